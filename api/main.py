@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
 import os
 import logging
 from dotenv import load_dotenv
@@ -8,6 +9,12 @@ import traceback
 
 # Import routers
 from api.routers.lesson import router as lesson_router
+from api.routers.jobs import router as jobs_router
+from api.services import llm_client, job_queue, async_lesson_storage
+from api.services import metrics
+from api.services.llm.prompting import prompt_templates
+from api.middleware.compression import CompressionMiddleware
+from api.middleware.metrics import MetricsMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -20,11 +27,21 @@ logger = logging.getLogger("api")
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers on startup and release resources on shutdown"""
+    await llm_client.warm_up()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await llm_client.aclose()
+
 # Create FastAPI app
 app = FastAPI(
     title="Lesson Generator API",
     description="API for generating and managing educational lessons",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -34,8 +51,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-After-Id"],
 )
 
+# Compress responses (brotli when installed, otherwise gzip)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500")),
+    gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5")),
+    cache_entries=int(os.getenv("COMPRESSION_CACHE_ENTRIES", "512"))
+)
+
+# Count and time every request
+app.add_middleware(MetricsMiddleware)
+
+metrics.LLM_RATE_LIMIT_IN_FLIGHT.set_function(lambda: llm_client.rate_limiter.in_flight)
+metrics.LLM_RATE_LIMIT_WAITING.set_function(lambda: llm_client.rate_limiter.waiting)
+# The bucket gauges are only exported when their limit is configured
+if llm_client.rate_limiter.requests_per_minute > 0:
+    metrics.LLM_RATE_LIMIT_AVAILABLE_REQUESTS.set_function(llm_client.rate_limiter.available_requests)
+if llm_client.rate_limiter.tokens_per_minute > 0:
+    metrics.LLM_RATE_LIMIT_AVAILABLE_TOKENS.set_function(llm_client.rate_limiter.available_tokens)
+
 # Exception handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -43,6 +81,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"message": exc.detail},
+        headers=exc.headers,
     )
 
 @app.exception_handler(Exception)
@@ -66,8 +105,30 @@ async def health():
     """Health check endpoint"""
     return {"status": "ok", "message": "Server is running"}
 
+# LLM client statistics
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """LLM client statistics (generation cache counters, prompt sizes, etc.)"""
+    return {**llm_client.stats(), "prompts": prompt_templates.stats()}
+
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    # Counted here rather than in a gauge callback, so the SQLite count runs off the event loop;
+    # it still sees lessons written by other worker processes
+    metrics.LESSONS_STORED.set(await async_lesson_storage.count_lessons())
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+# Job queue statistics
+@app.get("/api/jobs/stats")
+async def job_stats():
+    """Generation job queue statistics"""
+    return job_queue.stats()
+
 # Include routers
 app.include_router(lesson_router, prefix="/api", tags=["lessons"])
+app.include_router(jobs_router, prefix="/api", tags=["jobs"])
 
 # Run app with uvicorn if this file is run directly
 if __name__ == "__main__":
@@ -0,0 +1,249 @@
+import gzip
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger("api.middleware.compression")
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+# Suffix added to strong ETags of compressed representations
+ENCODED_ETAG_SUFFIX = re.compile(r'-(?:gzip|br)"')
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip
+
+    The encoding is negotiated from Accept-Encoding (brotli only when the
+    optional brotli package is installed). Bodies smaller than minimum_size
+    are sent as-is. Compressed bodies of successful GET/HEAD responses with a
+    strong ETag are cached per (path, query, ETag, encoding), so an unchanged lesson is not
+    recompressed on every read; their ETag gets an encoding suffix, which is
+    stripped from If-None-Match and If-Match before the request reaches the app.
+    Streaming responses (e.g. server-sent events) are compressed on the fly
+    and flushed after every chunk so events are not held back.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+        cache_entries: int = 512
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[Tuple[str, bytes, str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match", "")
+        if_match = request_headers.get("if-match", "")
+        if if_none_match or if_match:
+            scope = dict(scope)
+            headers = MutableHeaders(scope=scope)
+            if if_none_match:
+                headers["if-none-match"] = ENCODED_ETAG_SUFFIX.sub('"', if_none_match)
+            if if_match:
+                headers["if-match"] = ENCODED_ETAG_SUFFIX.sub('"', if_match)
+
+        encoding = self._negotiate(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        # A 304 must repeat the ETag of the variant the client holds
+        holds_variant = f'-{encoding}"' in if_none_match
+        responder = _CompressionResponder(self, scope, send, encoding, holds_variant)
+        await self.app(scope, receive, responder.send)
+
+    def _negotiate(self, accept_encoding: str) -> Optional[str]:
+        """Pick "br" or "gzip" from an Accept-Encoding header, honoring q-values"""
+        weights: Dict[str, float] = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            name = name.strip().lower()
+            if not name:
+                continue
+            q = 1.0
+            match = re.search(r"q\s*=\s*([0-9.]+)", params)
+            if match:
+                try:
+                    q = float(match.group(1))
+                except ValueError:
+                    q = 0.0
+            weights[name] = q
+
+        wildcard = weights.get("*", 0.0)
+        candidates = []
+        if brotli is not None:
+            candidates.append(("br", weights.get("br", wildcard)))
+        candidates.append(("gzip", weights.get("gzip", wildcard)))
+        # Stable sort keeps brotli ahead of gzip on equal weights
+        encoding, q = max(candidates, key=lambda item: item[1])
+        return encoding if q > 0 else None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def compressor(self, encoding: str):
+        """Return an incremental compressor with process(data) and flush() methods"""
+        if encoding == "br":
+            return _BrotliStream(brotli.Compressor(quality=self.brotli_quality))
+        return _GzipStream(zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31))
+
+    def cached(self, key: Tuple[str, bytes, str, str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+            return body
+
+    def store(self, key: Tuple[str, bytes, str, str], body: bytes) -> None:
+        if self.cache_entries <= 0:
+            return
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+class _GzipStream:
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def process(self, data: bytes) -> bytes:
+        # Sync-flush so every chunk reaches the client right away
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class _BrotliStream:
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+class _CompressionResponder:
+    """Send wrapper compressing one response"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope, send, encoding: str, holds_variant: bool):
+        self.middleware = middleware
+        self.scope = scope
+        self._send = send
+        self.encoding = encoding
+        self.holds_variant = holds_variant
+        self.start_message = None
+        self.passthrough = False
+        self.stream = None
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            if not self.passthrough:
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+            elif message["status"] == 304 and self.holds_variant:
+                self._mark_etag(MutableHeaders(raw=message["headers"]))
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.stream is None:
+            if not more_body:
+                await self._send_whole(body)
+                return
+            self._begin_stream()
+
+        data = self.stream.process(body) if body else b""
+        if not more_body:
+            data += self.stream.flush()
+        await self._flush_start()
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_whole(self, body: bytes) -> None:
+        """Compress a complete body, reusing the cached result for the same ETag"""
+        if len(body) < self.middleware.minimum_size:
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        etag = headers.get("etag")
+        key = None
+        compressed = None
+        # Only reads are cacheable; POST responses (create, continue) must never be replayed
+        cacheable = self.scope.get("method") in ("GET", "HEAD") and self.start_message["status"] == 200
+        if cacheable and etag and not etag.startswith("W/"):
+            key = (self.scope["path"], self.scope.get("query_string", b""), etag, self.encoding)
+            compressed = self.middleware.cached(key)
+        if compressed is None:
+            compressed = self.middleware.compress(body, self.encoding)
+            if key is not None:
+                self.middleware.store(key, compressed)
+
+        self._mark_etag(headers)
+        headers["content-encoding"] = self.encoding
+        headers["content-length"] = str(len(compressed))
+        await self._flush_start()
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    def _begin_stream(self) -> None:
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["content-encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["content-length"]
+        self._mark_etag(headers)
+        self.stream = self.middleware.compressor(self.encoding)
+
+    def _mark_etag(self, headers: MutableHeaders) -> None:
+        """Give a strong ETag the suffix of the encoding, as the body differs per encoding"""
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/") and etag.endswith('"'):
+            headers["etag"] = f'{etag[:-1]}-{self.encoding}"'
+
+    async def _flush_start(self) -> None:
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            await self._send(start)
@@ -0,0 +1,44 @@
+import time
+
+from api.services.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting HTTP requests and timing them until the response starts
+
+    Requests are labelled with the matched route template (e.g.
+    /lessons/{lesson_id}) rather than the raw path, so the number of series
+    stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, method=scope["method"], route=self._route(scope)
+                )
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUESTS.inc(method=scope["method"], route=self._route(scope), status=status_code)
+
+    @staticmethod
+    def _route(scope) -> str:
+        route = scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Optional, Literal
+from datetime import datetime
+
+from api.models.lesson import Lesson
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+class Job(BaseModel):
+    id: str
+    kind: Literal["create", "continue"]
+    status: JobStatus = "queued"
+    priority: int = 0
+    lessonId: Optional[int] = None
+    createdAt: datetime
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    lesson: Optional[Lesson] = None
+    error: Optional[str] = None
\ No newline at end of file
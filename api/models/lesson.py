@@ -19,6 +19,8 @@ class LessonBase(BaseModel):
 class LessonGenerationRequest(LessonBase):
     additionalInstructions: Optional[str] = None
     includeQuiz: bool = False
+    # Return a stored lesson on a near-identical topic instead of generating a new one
+    reuseExisting: bool = False
 
 class LessonContinuationRequest(BaseModel):
     additionalInstructions: Optional[str] = None
@@ -30,6 +32,8 @@ class Lesson(LessonBase):
     createdAt: datetime
     includeQuiz: bool = False
     quiz: Optional[List[QuizQuestion]] = None
+    # Incremented by every continuation (the number of content segments)
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -37,8 +41,69 @@ class Lesson(LessonBase):
             datetime: lambda dt: dt.isoformat()
         }
 
+class LessonSummary(LessonBase):
+    """Lesson listing projection without the content and quiz bodies"""
+    id: int
+    readTime: int
+    createdAt: datetime
+    includeQuiz: bool = False
+
+class LessonSegment(BaseModel):
+    """An immutable piece of lesson content: the original text or one continuation"""
+    index: int
+    content: str
+    readTime: int
+    createdAt: datetime
+
+class SimilarLesson(LessonSummary):
+    """A stored lesson whose topic is similar to a requested one"""
+    similarity: float
+
+class LessonBatchRequest(BaseModel):
+    """Several lessons to generate at once, e.g. the topics of a unit"""
+    lessons: List[LessonGenerationRequest] = Field(..., min_length=1, max_length=100)
+
+class LessonBatchItem(BaseModel):
+    """The outcome of one lesson of a batch, identified by its position in the request"""
+    index: int
+    lesson: Optional[Lesson] = None
+    reusedSimilarity: Optional[float] = None
+    error: Optional[str] = None
+
+class LessonSearchHit(LessonSummary):
+    """A lesson matching a search query"""
+    score: float
+    snippet: str
+
+class LessonSearchResults(BaseModel):
+    query: str
+    # Lessons containing at least one query term, on every storage backend. With
+    # terms found in a large share of lessons, the in-memory index estimates it
+    # (lessons with the most frequent term plus those matching a rarer one) and
+    # only returns lessons that also contain a rarer term (or all terms), so
+    # paging can end before `total` hits
+    total: int
+    limit: int
+    offset: int
+    hits: List[LessonSearchHit]
+
 class LessonCreate(LessonBase):
     content: str
     readTime: int
     includeQuiz: bool = False
-    quiz: Optional[List[QuizQuestion]] = None
\ No newline at end of file
+    quiz: Optional[List[QuizQuestion]] = None
+
+class GeneratedLesson(BaseModel):
+    """A new lesson as the LLM returns it (the structured output schema)"""
+    title: str
+    content: str
+    readTime: int
+
+class GeneratedQuizLesson(GeneratedLesson):
+    """A new lesson with its quiz as the LLM returns it"""
+    quiz: List[QuizQuestion]
+
+class GeneratedContinuation(BaseModel):
+    """A lesson continuation as the LLM returns it"""
+    continuation: str
+    readTimeIncrement: int
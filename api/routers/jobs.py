@@ -0,0 +1,76 @@
+from fastapi import APIRouter, HTTPException, Response, status
+from typing import Optional
+import logging
+
+from api.models.job import Job
+from api.models.lesson import LessonGenerationRequest, LessonContinuationRequest
+from api.services import job_queue, async_lesson_storage
+from api.services import generation
+from api.services.jobs import QueueFullError
+
+router = APIRouter()
+logger = logging.getLogger("api.routes.jobs")
+
+def _submit(response: Response, kind: str, run, priority: int, lesson_id: Optional[int] = None) -> Job:
+    """Queue a job, translating backpressure into a 503"""
+    try:
+        job = job_queue.submit(kind, run, priority=priority, lesson_id=lesson_id)
+    except QueueFullError as e:
+        logger.warning(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return job
+
+@router.post("/jobs/lessons", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def submit_lesson_job(request: LessonGenerationRequest, response: Response, priority: int = 0):
+    """Queue the generation of a new lesson"""
+
+    async def run():
+        # With reuseExisting the job succeeds with a stored near-duplicate instead
+        reused = await generation.find_reusable_lesson(request)
+        if reused:
+            return reused[0]
+        return await generation.generate_lesson(request)
+
+    logger.info(f"Queueing lesson generation for topic: {request.topic}")
+    return _submit(response, "create", run, priority)
+
+@router.post("/jobs/lessons/{lesson_id}/continue", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+async def submit_continuation_job(
+    lesson_id: int,
+    response: Response,
+    request: Optional[LessonContinuationRequest] = None,
+    priority: int = 0
+):
+    """Queue the continuation of an existing lesson"""
+    lesson = await async_lesson_storage.get_lesson(lesson_id)
+    if not lesson:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Lesson with ID {lesson_id} not found"
+        )
+
+    async def run():
+        # Re-read the lesson when the job starts so earlier continuations are included
+        current = await async_lesson_storage.get_lesson(lesson_id)
+        if not current:
+            return None
+        return await generation.continue_lesson(current, request)
+
+    logger.info(f"Queueing continuation of lesson with ID: {lesson_id}")
+    return _submit(response, "continue", run, priority, lesson_id=lesson_id)
+
+@router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    """Get the status of a job, including the lesson once it has succeeded"""
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with ID {job_id} not found"
+        )
+    return job
@@ -1,117 +1,325 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, AsyncIterator, Any, Literal, Union
+import json
 import logging
+import math
 
 from api.models.lesson import (
     Lesson,
-    LessonCreate,
+    LessonBatchRequest,
+    LessonSearchResults,
+    LessonSegment,
+    LessonSummary,
+    SimilarLesson,
     LessonGenerationRequest,
-    LessonContinuationRequest,
-    QuizQuestion
+    LessonContinuationRequest
 )
-from api.services.storage import lesson_storage
-from api.services import llm_client
+from api.services import llm_client, async_lesson_storage
+from api.services import generation
 from api.services.llm.prompting import PromptGenerator
+from api.services.llm.parsing import IncrementalJSONParser
+from api.services.llm.ratelimit import RateLimitExceeded
+from api.services.llm.tokens import PromptTooLarge
+from api.services.metrics import LESSON_STAGE_SECONDS
+from api.services.http_cache import (
+    cache_headers,
+    collection_etag,
+    etag_matches,
+    etag_matches_strong,
+    lesson_etag
+)
+from api.services.serialization import lesson_json
+from api.services.storage import VersionConflict
 
 router = APIRouter()
 logger = logging.getLogger("api.routes.lesson")
 
-@router.get("/lessons", response_model=List[Lesson])
-async def get_lessons():
-    """Get all lessons"""
-    return lesson_storage.get_all_lessons()
+# Keep proxies from buffering server-sent events
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+def _overloaded(exc: RateLimitExceeded) -> HTTPException:
+    """Translate upstream load shedding into a 503 with Retry-After"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(exc),
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+def _prompt_too_large(exc: PromptTooLarge) -> HTTPException:
+    """Translate a prompt over LLM_MAX_INPUT_TOKENS into a 413"""
+    return HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(exc))
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _lesson_response(lesson: Lesson, operation: str, status_code: int = status.HTTP_200_OK) -> Response:
+    """Serialize a newly generated lesson, timing the serialization stage"""
+    with LESSON_STAGE_SECONDS.time(operation=operation, stage="serialize"):
+        body = lesson_json.encode(lesson) if lesson_json.enabled else lesson.model_dump_json()
+    return Response(
+        content=body,
+        media_type="application/json",
+        status_code=status_code,
+        headers=cache_headers(lesson_etag(lesson))
+    )
+
+def _not_modified(etag: str) -> Response:
+    """Answer a matching If-None-Match without a body"""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+
+@router.get("/lessons", response_model=Union[List[Lesson], List[LessonSummary]])
+async def get_lessons(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    after_id: Optional[int] = None,
+    gradeLevel: Optional[str] = None,
+    lessonStyle: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get lessons ordered by ID
+    
+    Without query parameters this returns every lesson in full. `limit` and
+    `after_id` page through the lessons by ID; when more lessons follow the
+    page, the cursor for the next one is returned in the `X-Next-After-Id`
+    header. `view=summary` omits the `content` and `quiz` fields.
+    
+    The response carries an ETag derived from the storage revision, which
+    changes on every write; a request with a matching `If-None-Match` is
+    answered with `304 Not Modified` without reading any lessons.
+    
+    With FAST_JSON_RESPONSES enabled the page is encoded directly from the
+    stored lessons, reusing cached bodies of unchanged lessons.
+    """
+    # Read the revision before the lessons: a write in between then only
+    # makes the ETag older than the body, never newer
+    etag = collection_etag(await async_lesson_storage.get_revision())
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    
+    list_method = (
+        async_lesson_storage.list_lesson_summaries if view == "summary" else async_lesson_storage.list_lessons
+    )
+    
+    # Fetch one extra lesson to find out whether another page follows
+    lessons = await list_method(
+        limit=limit + 1 if limit else None,
+        after_id=after_id,
+        grade_level=gradeLevel,
+        lesson_style=lessonStyle
+    )
+    headers = cache_headers(etag)
+    if limit and len(lessons) > limit:
+        lessons = lessons[:limit]
+        headers["X-Next-After-Id"] = str(lessons[-1].id)
+    
+    if lesson_json.enabled:
+        return Response(content=lesson_json.encode_list(lessons), media_type="application/json", headers=headers)
+    
+    response.headers.update(headers)
+    return lessons
+
+@router.get("/lessons/search", response_model=LessonSearchResults)
+async def search_lessons(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Full-text search over lesson topics, content and quizzes
+    
+    Lessons matching any term of `q` are ranked by BM25 (topic matches
+    weigh more) and returned with a snippet in which the matching terms are
+    wrapped in `<mark>` tags, together with the total number of matches.
+    """
+    try:
+        return await async_lesson_storage.search_lessons(q, limit=limit, offset=offset)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+@router.get("/lessons/similar", response_model=List[SimilarLesson])
+async def get_similar_lessons(
+    topic: str = Query(..., min_length=1, max_length=500),
+    gradeLevel: str = Query(..., min_length=1),
+    lessonStyle: Optional[str] = None,
+    limit: int = Query(5, ge=1, le=50)
+):
+    """
+    Find stored lessons of a grade level on a similar topic
+    
+    Lets a client offer an existing lesson before requesting a new one.
+    Each lesson comes with the cosine similarity of its topic (1.0 for the
+    same topic); lessons at or above LESSON_REUSE_THRESHOLD are the ones
+    `reuseExisting` would return.
+    """
+    return await generation.find_similar_lessons(topic, gradeLevel, lessonStyle, limit=limit)
 
 @router.get("/lessons/{lesson_id}", response_model=Lesson)
-async def get_lesson(lesson_id: int):
-    """Get a lesson by ID"""
-    lesson = lesson_storage.get_lesson(lesson_id)
+async def get_lesson(lesson_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    """
+    Get a lesson by ID
+    
+    The response carries a strong ETag of the lesson version; a request with
+    a matching `If-None-Match` is answered with `304 Not Modified`.
+    """
+    lesson = await async_lesson_storage.get_lesson(lesson_id)
     if not lesson:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Lesson with ID {lesson_id} not found"
         )
+    
+    etag = lesson_etag(lesson)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    
+    if lesson_json.enabled:
+        return Response(content=lesson_json.encode(lesson), media_type="application/json", headers=cache_headers(etag))
+    
+    response.headers.update(cache_headers(etag))
     return lesson
 
+@router.get("/lessons/{lesson_id}/segments", response_model=List[LessonSegment])
+async def get_lesson_segments(lesson_id: int, start: int = Query(0, ge=0)):
+    """
+    Get the content segments of a lesson
+    
+    Segment 0 is the original lesson and every continuation adds one more.
+    `start` skips the segments a client already has.
+    """
+    segments = await async_lesson_storage.get_segments(lesson_id)
+    if segments is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Lesson with ID {lesson_id} not found"
+        )
+    return segments[start:]
+
+@router.get("/lessons/{lesson_id}/segments/{index}", response_model=LessonSegment)
+async def get_lesson_segment(lesson_id: int, index: int):
+    """Get one content segment of a lesson"""
+    segment = await async_lesson_storage.get_segment(lesson_id, index)
+    if not segment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Segment {index} of lesson {lesson_id} not found"
+        )
+    return segment
+
 @router.post("/lessons", response_model=Lesson, status_code=status.HTTP_201_CREATED)
 async def create_lesson(request: LessonGenerationRequest):
-    """Create a new lesson using AI generation"""
+    """
+    Create a new lesson using AI generation
+    
+    With `reuseExisting` set, a stored lesson on a near-identical topic is
+    returned instead (status 200, with its similarity in the
+    `X-Lesson-Reused` header) and nothing is generated.
+    """
+    reused = await generation.find_reusable_lesson(request)
+    if reused:
+        lesson, similarity = reused
+        response = _lesson_response(lesson, "create")
+        response.headers["X-Lesson-Reused"] = str(similarity)
+        return response
+    
     try:
-        logger.info(f"Generating lesson for topic: {request.topic}")
-        
-        # Generate prompt for the LLM
-        prompt = PromptGenerator.create_lesson_prompt(request)
-        
-        # Generate content using LLM
-        response_text = await llm_client.generate_content(
-            prompt=prompt,
-            system_prompt=PromptGenerator.SYSTEM_PROMPT
-        )
-        
-        # Parse the LLM response
-        try:
-            data = PromptGenerator.parse_llm_response(response_text)
-            
-            # Extract content and other fields
-            content = data.get("content", "")
-            title = data.get("title", request.topic)
-            read_time = data.get("readTime", PromptGenerator.estimate_read_time(content))
-            
-            # Format content with the title as a heading
-            formatted_content = f"# {title}\n\n{content}"
-            
-            # Extract quiz if present
-            quiz = None
-            if request.includeQuiz and "quiz" in data:
-                quiz_data = data.get("quiz", [])
-                quiz = [
-                    QuizQuestion(
-                        question=q.get("question", ""),
-                        options=q.get("options", []),
-                        correctAnswer=q.get("correctAnswer", 0)
-                    )
-                    for q in quiz_data
-                ]
-            
-            # Create the lesson
-            lesson_data = LessonCreate(
-                topic=request.topic,
-                gradeLevel=request.gradeLevel,
-                lessonStyle=request.lessonStyle,
-                content=formatted_content,
-                readTime=read_time,
-                includeQuiz=request.includeQuiz,
-                quiz=quiz
-            )
-            
-            return lesson_storage.create_lesson(lesson_data)
-            
-        except ValueError as e:
-            logger.error(f"Error parsing LLM response: {str(e)}")
-            # Fallback to creating a basic lesson
-            estimated_read_time = PromptGenerator.estimate_read_time(response_text)
-            
-            lesson_data = LessonCreate(
-                topic=request.topic,
-                gradeLevel=request.gradeLevel,
-                lessonStyle=request.lessonStyle,
-                content=f"# {request.topic}\n\n{response_text}",
-                readTime=estimated_read_time,
-                includeQuiz=False
-            )
-            
-            return lesson_storage.create_lesson(lesson_data)
-            
+        lesson = await generation.generate_lesson(request)
+    except PromptTooLarge as e:
+        raise _prompt_too_large(e)
+    except RateLimitExceeded as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error creating lesson: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create lesson: {str(e)}"
         )
+    
+    return _lesson_response(lesson, "create", status.HTTP_201_CREATED)
+
+async def _lesson_event_stream(request: LessonGenerationRequest) -> AsyncIterator[str]:
+    """Stream the lesson content as it is generated, then the stored lesson"""
+    try:
+        reused = await generation.find_reusable_lesson(request)
+        if reused:
+            lesson, similarity = reused
+            yield _sse_event("lesson", {**lesson.model_dump(mode="json"), "reusedSimilarity": similarity})
+            return
+        
+        logger.info(f"Streaming lesson for topic: {request.topic}")
+        
+        prompt = PromptGenerator.create_lesson_prompt(request)
+        
+        # Decode the markdown of the "content" field out of the JSON as it arrives
+        parser = IncrementalJSONParser(stream_fields=("content",))
+        chunks: List[str] = []
+        async for delta in llm_client.stream_content(
+            prompt=prompt.user,
+            system_prompt=prompt.system,
+            response_format=generation.lesson_response_format(request)
+        ):
+            chunks.append(delta)
+            text = parser.feed(delta)
+            if text:
+                yield _sse_event("delta", {"text": text})
+        
+        try:
+            data = parser.finish()
+        except ValueError:
+            data = None
+        lesson_data = generation.lesson_from_response(request, "".join(chunks), data)
+        lesson = await async_lesson_storage.create_lesson(lesson_data)
+        
+        yield _sse_event("lesson", lesson.model_dump(mode="json"))
+        
+    except Exception as e:
+        logger.error(f"Error streaming lesson: {str(e)}", exc_info=True)
+        yield _sse_event("error", {"message": f"Failed to create lesson: {str(e)}"})
+
+@router.post("/lessons/stream", status_code=status.HTTP_200_OK)
+async def stream_lesson(request: LessonGenerationRequest):
+    """
+    Create a new lesson, streaming the generated content as server-sent events
+    
+    Emits a `delta` event for every chunk of generated lesson markdown,
+    followed by a single `lesson` event with the stored lesson (or an
+    `error` event). A lesson reused through `reuseExisting` is sent as the
+    only `lesson` event, with its similarity in `reusedSimilarity`.
+    """
+    return StreamingResponse(_lesson_event_stream(request), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def _batch_event_stream(batch: LessonBatchRequest) -> AsyncIterator[str]:
+    """Stream the outcome of every lesson of a batch as it completes, then a summary"""
+    logger.info(f"Generating batch of {len(batch.lessons)} lessons")
+    succeeded = 0
+    async for item in generation.generate_lessons(batch.lessons):
+        if item.error is None:
+            succeeded += 1
+        yield _sse_event("item", item.model_dump(mode="json", exclude_none=True))
+    yield _sse_event("done", {"succeeded": succeeded, "failed": len(batch.lessons) - succeeded})
+
+@router.post("/lessons/batch", status_code=status.HTTP_200_OK)
+async def create_lesson_batch(batch: LessonBatchRequest):
+    """
+    Create several lessons concurrently, streaming results as server-sent events
+    
+    Up to LESSON_BATCH_PARALLELISM lessons are generated at a time. Each
+    lesson produces an `item` event as soon as it is stored, with its
+    `index` in the request and either the `lesson` or an `error`; a final
+    `done` event counts the successes and failures.
+    """
+    return StreamingResponse(_batch_event_stream(batch), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.delete("/lessons/{lesson_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_lesson(lesson_id: int):
     """Delete a lesson by ID"""
-    success = lesson_storage.delete_lesson(lesson_id)
+    success = await async_lesson_storage.delete_lesson(lesson_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -120,75 +328,54 @@ async def delete_lesson(lesson_id: int):
     return None
 
 @router.post("/lessons/{lesson_id}/continue", response_model=Lesson)
-async def continue_lesson(lesson_id: int, request: Optional[LessonContinuationRequest] = None):
-    """Continue a lesson by adding more content"""
+async def continue_lesson(
+    lesson_id: int,
+    request: Optional[LessonContinuationRequest] = None,
+    if_match: Optional[str] = Header(None)
+):
+    """
+    Continue a lesson by adding more content
+    
+    The continuation is only stored if the lesson is still at the version
+    it was generated from; if another continuation was stored in the
+    meantime the request fails with `409 Conflict`. Sending the lesson's
+    ETag in `If-Match` also rejects the request up front with
+    `412 Precondition Failed` when the client's copy is out of date.
+    """
     # Get the existing lesson
-    lesson = lesson_storage.get_lesson(lesson_id)
+    lesson = await async_lesson_storage.get_lesson(lesson_id)
     if not lesson:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Lesson with ID {lesson_id} not found"
         )
     
-    try:
-        logger.info(f"Continuing lesson with ID: {lesson_id}")
-        
-        # Generate prompt for the LLM
-        prompt = PromptGenerator.create_continuation_prompt(lesson.content, request)
-        
-        # Generate content using LLM
-        response_text = await llm_client.generate_content(
-            prompt=prompt,
-            system_prompt=PromptGenerator.SYSTEM_PROMPT
+    if if_match and not etag_matches_strong(if_match, lesson_etag(lesson)):
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Lesson with ID {lesson_id} has changed (now at version {lesson.version})",
+            headers=cache_headers(lesson_etag(lesson))
         )
-        
-        # Parse the LLM response
-        try:
-            data = PromptGenerator.parse_llm_response(response_text)
-            
-            # Extract continuation content
-            continuation = data.get("continuation", "")
-            read_time_increment = data.get("readTimeIncrement", PromptGenerator.estimate_read_time(continuation))
-            
-            # Update the lesson
-            updated_lesson = lesson_storage.update_lesson(
-                lesson_id=lesson_id,
-                content=continuation,
-                read_time_increment=read_time_increment
-            )
-            
-            if not updated_lesson:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Lesson with ID {lesson_id} not found during update"
-                )
-                
-            return updated_lesson
-            
-        except ValueError as e:
-            logger.error(f"Error parsing LLM response for continuation: {str(e)}")
-            
-            # Fallback to adding the raw response
-            estimated_read_time = PromptGenerator.estimate_read_time(response_text)
-            
-            # Update the lesson with the raw response
-            updated_lesson = lesson_storage.update_lesson(
-                lesson_id=lesson_id,
-                content=response_text,
-                read_time_increment=estimated_read_time
-            )
-            
-            if not updated_lesson:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Lesson with ID {lesson_id} not found during update"
-                )
-                
-            return updated_lesson
-            
+    
+    try:
+        updated_lesson = await generation.continue_lesson(lesson, request)
+    except VersionConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except PromptTooLarge as e:
+        raise _prompt_too_large(e)
+    except RateLimitExceeded as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Error continuing lesson: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to continue lesson: {str(e)}"
-        )
\ No newline at end of file
+        )
+    
+    if not updated_lesson:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Lesson with ID {lesson_id} not found during update"
+        )
+        
+    return _lesson_response(updated_lesson, "continue")
\ No newline at end of file
@@ -1,6 +1,26 @@
+import os
+
 from api.services.llm.client import LLMClient
 from api.services.storage import LessonStorage
+from api.services.async_storage import AsyncLessonStorage
+from api.services.sqlite_storage import SQLiteLessonStorage
+from api.services.jobs import JobQueue
+from api.services.similarity import LessonMatcher
+
+def create_lesson_storage():
+    """Create the lesson storage selected by the LESSON_STORAGE_BACKEND environment variable"""
+    backend = os.getenv("LESSON_STORAGE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteLessonStorage(os.getenv("LESSON_STORAGE_PATH", "lessons.sqlite3"))
+    return LessonStorage()
 
 # Create instances
 llm_client = LLMClient()
-lesson_storage = LessonStorage()
\ No newline at end of file
+lesson_storage = create_lesson_storage()
+# Request handlers use this view so blocking storage calls run off the event loop
+async_lesson_storage = AsyncLessonStorage(lesson_storage)
+lesson_matcher = LessonMatcher.from_env(lesson_storage)
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_depth=int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+)
\ No newline at end of file
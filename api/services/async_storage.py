@@ -0,0 +1,88 @@
+import asyncio
+from typing import Any, Callable, List, Optional, TypeVar
+
+from api.models.lesson import (
+    Lesson,
+    LessonCreate,
+    LessonSearchResults,
+    LessonSegment,
+    LessonSummary
+)
+
+T = TypeVar("T")
+
+class AsyncLessonStorage:
+    """
+    Awaitable view of a lesson storage for request handlers
+
+    Storages that block (`blocking = True`, e.g. SQLite) are called in a
+    worker thread with asyncio.to_thread, so queries and lock waits never
+    stall the event loop. Storages that only touch memory are called
+    directly, as a thread hop would cost more than the call itself.
+    Storages can set `blocking_search` to run only searches in a thread.
+    """
+
+    def __init__(self, storage):
+        """
+        Args:
+            storage: The lesson storage to wrap (LessonStorage or SQLiteLessonStorage)
+        """
+        self.storage = storage
+        self.blocking = getattr(storage, "blocking", True)
+        self.blocking_search = self.blocking or getattr(storage, "blocking_search", False)
+
+    async def run(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Call a function that reads the storage, in a thread if the storage blocks"""
+        if self.blocking:
+            return await asyncio.to_thread(function, *args, **kwargs)
+        return function(*args, **kwargs)
+
+    async def list_lessons(self, **filters: Any) -> List[Lesson]:
+        return await self.run(self.storage.list_lessons, **filters)
+
+    async def list_lesson_summaries(self, **filters: Any) -> List[LessonSummary]:
+        return await self.run(self.storage.list_lesson_summaries, **filters)
+
+    async def search_lessons(self, query: str, limit: int = 20, offset: int = 0) -> LessonSearchResults:
+        if self.blocking_search:
+            return await asyncio.to_thread(self.storage.search_lessons, query, limit=limit, offset=offset)
+        return self.storage.search_lessons(query, limit=limit, offset=offset)
+
+    async def get_revision(self) -> str:
+        return await self.run(self.storage.get_revision)
+
+    async def count_lessons(self) -> int:
+        return await self.run(self.storage.count_lessons)
+
+    async def get_lesson(self, lesson_id: int) -> Optional[Lesson]:
+        return await self.run(self.storage.get_lesson, lesson_id)
+
+    async def get_segments(self, lesson_id: int) -> Optional[List[LessonSegment]]:
+        return await self.run(self.storage.get_segments, lesson_id)
+
+    async def get_segment(self, lesson_id: int, index: int) -> Optional[LessonSegment]:
+        return await self.run(self.storage.get_segment, lesson_id, index)
+
+    async def create_lesson(self, lesson: LessonCreate) -> Lesson:
+        return await self.run(self.storage.create_lesson, lesson)
+
+    async def create_lessons(self, lessons: List[LessonCreate]) -> List[Lesson]:
+        return await self.run(self.storage.create_lessons, lessons)
+
+    async def update_lesson(
+        self,
+        lesson_id: int,
+        content: str,
+        read_time_increment: int,
+        expected_version: Optional[int] = None
+    ) -> Optional[Lesson]:
+        return await self.run(
+            self.storage.update_lesson,
+            lesson_id,
+            content,
+            read_time_increment,
+            expected_version=expected_version
+        )
+
+    async def delete_lesson(self, lesson_id: int) -> bool:
+        return await self.run(self.storage.delete_lesson, lesson_id)
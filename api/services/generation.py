@@ -0,0 +1,432 @@
+from typing import Optional, Tuple, Dict, Any, List, AsyncIterator, Type, TypeVar, Union
+import asyncio
+import logging
+import os
+
+from pydantic import BaseModel
+
+from api.models.lesson import (
+    GeneratedContinuation,
+    GeneratedLesson,
+    GeneratedQuizLesson,
+    Lesson,
+    LessonBatchItem,
+    LessonCreate,
+    LessonGenerationRequest,
+    LessonContinuationRequest,
+    QuizQuestion,
+    SimilarLesson
+)
+from api.services import llm_client, async_lesson_storage, lesson_matcher
+from api.services.llm import structured
+from api.services.llm.prompting import Prompt, PromptGenerator
+from api.services.metrics import LESSON_PARSE_FAILURES, LESSON_REUSE, LESSON_STAGE_SECONDS, LLM_STRUCTURED_OUTPUT
+
+logger = logging.getLogger("api.services.generation")
+
+# Lessons of a batch generated concurrently
+BATCH_PARALLELISM = int(os.getenv("LESSON_BATCH_PARALLELISM", "8"))
+# Constrain responses to the JSON schema of the response models and validate them directly
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "false").lower() in ("1", "true", "yes")
+
+M = TypeVar("M", bound=BaseModel)
+
+def lesson_response_model(request: LessonGenerationRequest) -> Type[GeneratedLesson]:
+    """The model a lesson response must validate into: with a quiz if the request asks for one"""
+    return GeneratedQuizLesson if request.includeQuiz else GeneratedLesson
+
+def lesson_response_format(request: LessonGenerationRequest) -> Optional[Dict[str, Any]]:
+    """The response_format to request for a lesson, or None without LLM_STRUCTURED_OUTPUT"""
+    if not STRUCTURED_OUTPUT:
+        return None
+    return structured.response_format(lesson_response_model(request))
+
+def lesson_from_generated(request: LessonGenerationRequest, generated: GeneratedLesson) -> LessonCreate:
+    """
+    Build the lesson to store from a validated LLM response
+
+    Args:
+        request: The original lesson generation request
+        generated: The response validated into its model
+
+    Returns:
+        The lesson data ready to be stored
+    """
+    return LessonCreate(
+        topic=request.topic,
+        gradeLevel=request.gradeLevel,
+        lessonStyle=request.lessonStyle,
+        content=f"# {generated.title}\n\n{generated.content}",
+        readTime=generated.readTime,
+        includeQuiz=request.includeQuiz,
+        quiz=getattr(generated, "quiz", None) if request.includeQuiz else None
+    )
+
+def lesson_from_response(
+    request: LessonGenerationRequest,
+    response_text: str,
+    data: Optional[Dict[str, Any]] = None
+) -> LessonCreate:
+    """
+    Build the lesson to store from a raw LLM response
+
+    Args:
+        request: The original lesson generation request
+        response_text: The raw text response from the LLM
+        data: The response already parsed (e.g. incrementally while streaming)
+
+    Returns:
+        The lesson data ready to be stored
+    """
+    # A response already parsed while streaming validates without another pass over the text
+    if STRUCTURED_OUTPUT and data is not None:
+        generated, _ = structured.validate(lesson_response_model(request), data)
+        if generated is not None:
+            return lesson_from_generated(request, generated)
+
+    # Parse the LLM response
+    try:
+        if data is None:
+            data = PromptGenerator.parse_llm_response(response_text)
+    except ValueError as e:
+        LESSON_PARSE_FAILURES.inc(operation="create")
+        logger.error(f"Error parsing LLM response: {str(e)}")
+        # Fallback to creating a basic lesson
+        return LessonCreate(
+            topic=request.topic,
+            gradeLevel=request.gradeLevel,
+            lessonStyle=request.lessonStyle,
+            content=f"# {request.topic}\n\n{response_text}",
+            readTime=PromptGenerator.estimate_read_time(response_text),
+            includeQuiz=False
+        )
+
+    # Extract content and other fields
+    content = data.get("content", "")
+    title = data.get("title", request.topic)
+    read_time = data.get("readTime", PromptGenerator.estimate_read_time(content))
+
+    # Format content with the title as a heading
+    formatted_content = f"# {title}\n\n{content}"
+
+    # Extract quiz if present
+    quiz = None
+    if request.includeQuiz and "quiz" in data:
+        quiz_data = data.get("quiz", [])
+        quiz = [
+            QuizQuestion(
+                question=q.get("question", ""),
+                options=q.get("options", []),
+                correctAnswer=q.get("correctAnswer", 0)
+            )
+            for q in quiz_data
+        ]
+
+    return LessonCreate(
+        topic=request.topic,
+        gradeLevel=request.gradeLevel,
+        lessonStyle=request.lessonStyle,
+        content=formatted_content,
+        readTime=read_time,
+        includeQuiz=request.includeQuiz,
+        quiz=quiz
+    )
+
+def continuation_from_response(response_text: str) -> Tuple[str, int]:
+    """
+    Extract the continuation content and read time increment from a raw LLM response
+
+    Args:
+        response_text: The raw text response from the LLM
+
+    Returns:
+        A tuple of (continuation content, read time increment)
+    """
+    try:
+        data = PromptGenerator.parse_llm_response(response_text)
+    except ValueError as e:
+        LESSON_PARSE_FAILURES.inc(operation="continue")
+        logger.error(f"Error parsing LLM response for continuation: {str(e)}")
+        # Fallback to adding the raw response
+        return response_text, PromptGenerator.estimate_read_time(response_text)
+
+    continuation = data.get("continuation", "")
+    read_time_increment = data.get("readTimeIncrement", PromptGenerator.estimate_read_time(continuation))
+
+    return continuation, read_time_increment
+
+async def generate_structured(
+    prompt: Prompt,
+    model: Type[M],
+    operation: str
+) -> Tuple[Optional[M], str]:
+    """
+    Generate a response constrained to a model's JSON schema and validate it
+
+    A response that does not validate is asked for once more, with the
+    validation errors appended to the prompt. If that one fails as well,
+    the caller falls back to the lenient parser on its text.
+
+    Args:
+        prompt: The prompt to send
+        model: The pydantic model the response must validate into
+        operation: "create" or "continue", for metrics
+
+    Returns:
+        A tuple of (validated response or None, raw text of the last response)
+    """
+    response_format = structured.response_format(model)
+    with LESSON_STAGE_SECONDS.time(operation=operation, stage="llm"):
+        response_text = await llm_client.generate_content(
+            prompt=prompt.user,
+            system_prompt=prompt.system,
+            response_format=response_format
+        )
+
+    with LESSON_STAGE_SECONDS.time(operation=operation, stage="parse"):
+        generated, errors = structured.validate(model, response_text)
+    if generated is not None:
+        LLM_STRUCTURED_OUTPUT.inc(operation=operation, result="valid")
+        return generated, response_text
+
+    logger.warning(f"LLM response does not match the {model.__name__} schema, asking again:\n{errors}")
+    repair = PromptGenerator.create_repair_prompt(prompt, errors)
+    with LESSON_STAGE_SECONDS.time(operation=operation, stage="repair"):
+        response_text = await llm_client.generate_content(
+            prompt=repair.user,
+            system_prompt=repair.system,
+            response_format=response_format
+        )
+
+    with LESSON_STAGE_SECONDS.time(operation=operation, stage="parse"):
+        generated, errors = structured.validate(model, response_text)
+    if generated is not None:
+        LLM_STRUCTURED_OUTPUT.inc(operation=operation, result="repaired")
+        return generated, response_text
+
+    LLM_STRUCTURED_OUTPUT.inc(operation=operation, result="invalid")
+    logger.error(f"Repaired LLM response still does not match the {model.__name__} schema:\n{errors}")
+    return None, response_text
+
+async def find_similar_lessons(
+    topic: str,
+    grade_level: str,
+    lesson_style: Optional[str] = None,
+    limit: int = 5
+) -> List[SimilarLesson]:
+    """
+    Find stored lessons of a grade level with topics similar to the given one
+
+    Args:
+        topic: The topic to compare
+        grade_level: The grade level the lessons must have
+        lesson_style: If given, the style the lessons must have
+        limit: Maximum number of lessons
+
+    Returns:
+        The lessons, most similar first
+    """
+    similar = []
+    matches = await async_lesson_storage.run(lesson_matcher.similar, topic, grade_level, lesson_style, limit=limit)
+    for lesson_id, similarity in matches:
+        lesson = await async_lesson_storage.get_lesson(lesson_id)
+        if lesson is not None:
+            similar.append(SimilarLesson(**lesson.model_dump(include=set(SimilarLesson.model_fields)), similarity=similarity))
+    return similar
+
+async def find_reusable_lesson(request: LessonGenerationRequest) -> Optional[Tuple[Lesson, float]]:
+    """
+    Look up a stored lesson that can be returned instead of generating one
+
+    Only applies when the request sets reuseExisting and gives no
+    additionalInstructions, as a stored lesson was not generated with
+    them. A lesson qualifies if its topic similarity reaches
+    LESSON_REUSE_THRESHOLD, it has the same grade level (and style, if the
+    request names one), and it has a quiz exactly when the request asks
+    for one.
+
+    Args:
+        request: The lesson generation request
+
+    Returns:
+        A tuple of (lesson, similarity), or None if a new lesson is needed
+    """
+    if not request.reuseExisting or request.additionalInstructions:
+        return None
+
+    with LESSON_STAGE_SECONDS.time(operation="create", stage="reuse"):
+        matches = await async_lesson_storage.run(
+            lesson_matcher.similar,
+            request.topic,
+            request.gradeLevel,
+            request.lessonStyle,
+            min_similarity=lesson_matcher.threshold
+        )
+        for lesson_id, similarity in matches:
+            lesson = await async_lesson_storage.get_lesson(lesson_id)
+            if lesson is None or bool(lesson.quiz) != request.includeQuiz:
+                continue
+            LESSON_REUSE.inc(result="hit")
+            logger.info(f"Reusing lesson {lesson.id} ({similarity:.2f} similar) for topic: {request.topic}")
+            return lesson, similarity
+
+    LESSON_REUSE.inc(result="miss")
+    return None
+
+async def generate_lesson(request: LessonGenerationRequest) -> Lesson:
+    """
+    Generate a new lesson with the LLM and store it
+
+    Args:
+        request: The lesson generation request
+
+    Returns:
+        The stored lesson
+    """
+    lesson_data = await draft_lesson(request)
+
+    with LESSON_STAGE_SECONDS.time(operation="create", stage="storage"):
+        return await async_lesson_storage.create_lesson(lesson_data)
+
+async def draft_lesson(request: LessonGenerationRequest) -> LessonCreate:
+    """
+    Generate a new lesson with the LLM without storing it
+
+    Args:
+        request: The lesson generation request
+
+    Returns:
+        The lesson data ready to be stored
+    """
+    logger.info(f"Generating lesson for topic: {request.topic}")
+
+    # Generate prompt for the LLM
+    with LESSON_STAGE_SECONDS.time(operation="create", stage="prompt"):
+        prompt = PromptGenerator.create_lesson_prompt(request)
+
+    if STRUCTURED_OUTPUT:
+        generated, response_text = await generate_structured(prompt, lesson_response_model(request), "create")
+        if generated is not None:
+            return lesson_from_generated(request, generated)
+        with LESSON_STAGE_SECONDS.time(operation="create", stage="parse"):
+            return lesson_from_response(request, response_text)
+
+    # Generate content using LLM
+    with LESSON_STAGE_SECONDS.time(operation="create", stage="llm"):
+        response_text = await llm_client.generate_content(
+            prompt=prompt.user,
+            system_prompt=prompt.system
+        )
+
+    with LESSON_STAGE_SECONDS.time(operation="create", stage="parse"):
+        return lesson_from_response(request, response_text)
+
+async def generate_lessons(
+    requests: List[LessonGenerationRequest],
+    parallelism: int = BATCH_PARALLELISM
+) -> AsyncIterator[LessonBatchItem]:
+    """
+    Generate several lessons concurrently, yielding each as it completes
+
+    At most `parallelism` lessons are generated at a time. Lessons that
+    finish while earlier ones are being stored are written together with
+    a single create_lessons call. A failing lesson yields an item with
+    its error and does not affect the others; requests with reuseExisting
+    may be answered with a stored lesson instead.
+
+    Args:
+        requests: The lesson generation requests
+        parallelism: Maximum number of concurrent generations
+
+    Yields:
+        One item per request, in completion order
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+    completed: "asyncio.Queue[Union[LessonBatchItem, Tuple[int, LessonCreate]]]" = asyncio.Queue()
+
+    async def draft(index: int, request: LessonGenerationRequest) -> None:
+        try:
+            reused = await find_reusable_lesson(request)
+            if reused:
+                lesson, similarity = reused
+                completed.put_nowait(LessonBatchItem(index=index, lesson=lesson, reusedSimilarity=similarity))
+                return
+            async with semaphore:
+                completed.put_nowait((index, await draft_lesson(request)))
+        except Exception as e:
+            logger.error(f"Error generating lesson {index} of batch: {str(e)}", exc_info=True)
+            completed.put_nowait(LessonBatchItem(index=index, error=str(e) or type(e).__name__))
+
+    tasks = [asyncio.create_task(draft(index, request)) for index, request in enumerate(requests)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            done = [await completed.get()]
+            while not completed.empty():
+                done.append(completed.get_nowait())
+            remaining -= len(done)
+
+            drafts = [item for item in done if isinstance(item, tuple)]
+            if drafts:
+                try:
+                    with LESSON_STAGE_SECONDS.time(operation="create", stage="storage"):
+                        stored = await async_lesson_storage.create_lessons([lesson_data for _, lesson_data in drafts])
+                    for (index, _), lesson in zip(drafts, stored):
+                        yield LessonBatchItem(index=index, lesson=lesson)
+                except Exception as e:
+                    logger.error(f"Error storing {len(drafts)} lessons of batch: {str(e)}", exc_info=True)
+                    for index, _ in drafts:
+                        yield LessonBatchItem(index=index, error=f"Failed to store lesson: {str(e)}")
+
+            for item in done:
+                if isinstance(item, LessonBatchItem):
+                    yield item
+    finally:
+        # Stop outstanding generations if the consumer goes away
+        for task in tasks:
+            task.cancel()
+
+async def continue_lesson(lesson: Lesson, request: Optional[LessonContinuationRequest] = None) -> Optional[Lesson]:
+    """
+    Generate a continuation for an existing lesson and append it
+
+    Args:
+        lesson: The lesson to continue
+        request: Optional continuation request with additional instructions
+
+    Returns:
+        The updated lesson, or None if it was deleted in the meantime
+
+    Raises:
+        VersionConflict: If another continuation was stored while this one was generated
+    """
+    logger.info(f"Continuing lesson with ID: {lesson.id}")
+
+    # Generate prompt for the LLM
+    with LESSON_STAGE_SECONDS.time(operation="continue", stage="prompt"):
+        prompt = PromptGenerator.create_continuation_prompt(lesson.content, request)
+
+    generated = None
+    if STRUCTURED_OUTPUT:
+        generated, response_text = await generate_structured(prompt, GeneratedContinuation, "continue")
+    else:
+        # Generate content using LLM
+        with LESSON_STAGE_SECONDS.time(operation="continue", stage="llm"):
+            response_text = await llm_client.generate_content(
+                prompt=prompt.user,
+                system_prompt=prompt.system
+            )
+
+    if generated is not None:
+        continuation, read_time_increment = generated.continuation, generated.readTimeIncrement
+    else:
+        with LESSON_STAGE_SECONDS.time(operation="continue", stage="parse"):
+            continuation, read_time_increment = continuation_from_response(response_text)
+
+    with LESSON_STAGE_SECONDS.time(operation="continue", stage="storage"):
+        return await async_lesson_storage.update_lesson(
+            lesson_id=lesson.id,
+            content=continuation,
+            read_time_increment=read_time_increment,
+            expected_version=lesson.version
+        )
@@ -0,0 +1,65 @@
+import os
+from typing import Dict, Optional
+
+from api.models.lesson import Lesson
+
+def lesson_etag(lesson: Lesson) -> str:
+    """
+    Build the strong ETag of a lesson
+
+    Lessons only change through continuations, which bump their version,
+    and IDs are never reused, so (id, version, createdAt) identifies the
+    representation.
+    """
+    created = int(lesson.createdAt.timestamp() * 1_000_000)
+    return f'"l{lesson.id}-v{lesson.version}-{created:x}"'
+
+def collection_etag(revision: str) -> str:
+    """Build the strong ETag of a lesson listing from the storage revision"""
+    return f'"c{revision}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluate an If-None-Match header against the current ETag
+
+    Uses the weak comparison required for If-None-Match, so a W/ prefix
+    added by a proxy still matches.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def etag_matches_strong(if_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluate an If-Match header against the current ETag
+
+    Uses the strong comparison required for If-Match: a weak tag (W/)
+    never matches, as it does not guarantee the same representation.
+    """
+    if not if_match:
+        return False
+    if if_match.strip() == "*":
+        return True
+    return any(tag.strip() == etag for tag in if_match.split(","))
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Headers sent with every cacheable lesson response (200 or 304)"""
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+def _cache_control() -> str:
+    """
+    Cache-Control policy for lesson reads
+
+    By default clients may store responses but must revalidate them with
+    If-None-Match every time; LESSON_CACHE_MAX_AGE lets them reuse a copy
+    for that many seconds first.
+    """
+    max_age = int(os.getenv("LESSON_CACHE_MAX_AGE", "0"))
+    if max_age > 0:
+        return f"private, max-age={max_age}"
+    return "private, no-cache"
+
+CACHE_CONTROL = _cache_control()
@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import logging
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Any, Tuple
+
+from api.models.job import Job
+from api.models.lesson import Lesson
+
+logger = logging.getLogger("api.services.jobs")
+
+# (negated priority, submission sequence, job, run) as ordered by the priority queue
+QueueEntry = Tuple[int, int, Job, Callable[[], Awaitable[Optional[Lesson]]]]
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its maximum depth"""
+
+class JobQueue:
+    """
+    Priority queue of generation jobs drained by a bounded pool of asyncio workers
+
+    Jobs for the same lesson run one after the other, so every continuation
+    job reads the lesson as left by the previous one and none of them fails
+    the optimistic version check on update. Only one job per lesson is in
+    the priority queue at a time; the others wait in a per-lesson backlog
+    without holding a worker, and the next one is queued when it finishes.
+    """
+
+    def __init__(self, workers: int = 4, max_depth: int = 100, max_retained: int = 1000):
+        """
+        Initialize the queue (workers are started separately with start())
+
+        Args:
+            workers: Number of jobs processed concurrently
+            max_depth: Maximum number of queued jobs before submissions are rejected
+            max_retained: Number of finished jobs kept for status lookups
+        """
+        self.worker_count = workers
+        self.max_depth = max_depth
+        self.max_retained = max_retained
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        # Lessons with a queued or running job, and their jobs waiting behind it
+        self._lesson_backlogs: Dict[int, Deque[QueueEntry]] = {}
+        self._deferred = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        """Start the worker pool on the running event loop"""
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_depth)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"Started {self.worker_count} job workers (max queue depth {self.max_depth})")
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs still queued are marked as failed"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        for job in self.jobs.values():
+            if job.status in ("queued", "running"):
+                self._finish(job, error="Server shut down before the job completed")
+
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[], Awaitable[Optional[Lesson]]],
+        priority: int = 0,
+        lesson_id: Optional[int] = None
+    ) -> Job:
+        """
+        Queue a generation job
+
+        Args:
+            kind: "create" or "continue"
+            run: Coroutine function performing the generation and returning the lesson
+            priority: Jobs with a higher priority are started first
+            lesson_id: The lesson being continued, for continuation jobs
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: If the queue is at its maximum depth
+        """
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started")
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            priority=priority,
+            lessonId=lesson_id,
+            createdAt=datetime.now()
+        )
+        if self._queue.qsize() + self._deferred >= self.max_depth:
+            self.rejected += 1
+            raise QueueFullError(f"Job queue is full ({self.max_depth} jobs waiting)")
+
+        # Lower tuples are served first; the sequence keeps FIFO order per priority
+        entry = (-priority, next(self._sequence), job, run)
+        backlog = self._lesson_backlogs.get(lesson_id) if lesson_id is not None else None
+        if backlog is not None:
+            # Another job of this lesson is queued or running; queue this one when it finishes
+            backlog.append(entry)
+            self._deferred += 1
+        else:
+            if lesson_id is not None:
+                self._lesson_backlogs[lesson_id] = deque()
+            self._queue.put_nowait(entry)
+
+        self.submitted += 1
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Get a job by ID"""
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, worker and job counters"""
+        running = sum(1 for job in self.jobs.values() if job.status == "running")
+        return {
+            "workers": len(self._workers),
+            "queued": (self._queue.qsize() if self._queue else 0) + self._deferred,
+            "running": running,
+            "maxDepth": self.max_depth,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+    async def _worker(self, index: int) -> None:
+        """Process jobs until cancelled"""
+        while True:
+            _, _, job, run = await self._queue.get()
+            try:
+                job.status = "running"
+                job.startedAt = datetime.now()
+                lesson = await run()
+                if lesson is None:
+                    self._finish(job, error="Lesson not found")
+                else:
+                    self._finish(job, lesson=lesson)
+            except asyncio.CancelledError:
+                self._finish(job, error="Server shut down before the job completed")
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+                self._finish(job, error=str(e))
+            finally:
+                self._release(job.lessonId)
+                self._queue.task_done()
+
+    def _release(self, lesson_id: Optional[int]) -> None:
+        """Queue the next job waiting for a lesson, or mark the lesson idle"""
+        if lesson_id is None:
+            return
+        backlog = self._lesson_backlogs[lesson_id]
+        if backlog:
+            self._deferred -= 1
+            # Fits: the finished job's slot was freed when it was taken off the queue
+            self._queue.put_nowait(backlog.popleft())
+        else:
+            del self._lesson_backlogs[lesson_id]
+
+    def _finish(self, job: Job, lesson: Optional[Lesson] = None, error: Optional[str] = None) -> None:
+        """Record the outcome of a job"""
+        job.status = "failed" if error else "succeeded"
+        job.lesson = lesson
+        job.error = error
+        job.finishedAt = datetime.now()
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond max_retained"""
+        excess = len(self.jobs) - self.max_retained
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finishedAt][:excess]:
+            del self.jobs[job_id]
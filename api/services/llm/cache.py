@@ -0,0 +1,380 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any
+
+logger = logging.getLogger("api.services.llm.cache")
+
+def generation_key(
+    prompt: str,
+    system_prompt: Optional[str],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    response_format: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Build a content-addressed cache key for an LLM generation
+
+    Line endings and surrounding whitespace are normalized so that prompts
+    differing only in formatting noise map to the same entry.
+
+    Args:
+        prompt: The user prompt sent to the LLM
+        system_prompt: Optional system prompt
+        model: The model used for the generation
+        temperature: Sampling temperature
+        max_tokens: Maximum number of tokens to generate
+        response_format: Optional output schema the generation was constrained to
+
+    Returns:
+        A hex SHA-256 digest identifying the generation
+    """
+    def normalize(text: Optional[str]) -> str:
+        if not text:
+            return ""
+        return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").strip().split("\n"))
+
+    fields = {
+        "prompt": normalize(prompt),
+        "system_prompt": normalize(system_prompt),
+        "model": model,
+        "temperature": round(float(temperature), 4),
+        "max_tokens": int(max_tokens),
+    }
+    # Only present when set, so keys of free-form generations stay unchanged
+    if response_format:
+        fields["response_format"] = response_format
+    payload = json.dumps(
+        fields,
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class CacheBackend:
+    """Interface for persistent generation cache backends"""
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return the cached (value, stored_at) for a key, if present"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, stored_at: float) -> None:
+        """Store a value under a key"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Remove a key if present"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        raise NotImplementedError
+
+class SQLiteCacheBackend(CacheBackend):
+    """Generation cache backend stored in a SQLite database"""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        """
+        Open (or create) the cache database
+
+        Args:
+            path: Path of the SQLite database file
+            max_entries: Number of entries kept before the least recently used are pruned
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS generation_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_cache_accessed ON generation_cache (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM generation_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE generation_cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str, stored_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generation_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, stored_at, stored_at),
+            )
+            self._conn.execute(
+                """DELETE FROM generation_cache WHERE key IN (
+                    SELECT key FROM generation_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM generation_cache")
+
+class FileCacheBackend(CacheBackend):
+    """Generation cache backend storing one JSON file per entry in a directory"""
+
+    # Prune the directory every this many writes rather than on each one
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, directory: str, max_entries: int = 10000):
+        """
+        Create the cache directory if needed
+
+        Args:
+            directory: Directory holding the cache files
+            max_entries: Number of files kept before the least recently used are pruned
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        # Writes run in worker threads; guards the write counter and pruning
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Touch the file so pruning evicts the least recently used entries
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry["value"], entry["stored_at"]
+
+    def set(self, key: str, value: str, stored_at: float) -> None:
+        path = self._path(key)
+        # Unique per thread too, as concurrent writes of one key may run in different threads
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"value": value, "stored_at": stored_at}, f)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._prune()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+    def _prune(self) -> None:
+        """Remove the least recently used files beyond max_entries"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                entries.append((entry.stat().st_mtime, entry.path))
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+class GenerationCache:
+    """
+    LRU + TTL cache for LLM generations with an optional persistent backend
+
+    Backends do blocking disk I/O; from the event loop use `aget`/`aset`,
+    which only hop to a thread when the backend has to be consulted.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400, backend: Optional[CacheBackend] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Number of entries kept in memory
+            ttl_seconds: Age after which an entry is considered stale
+            backend: Optional persistent backend consulted on memory misses
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None on a miss"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self.backend:
+            value = self._get_backend(key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Like `get`, reading the backend in a thread"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self.backend:
+            value = await asyncio.to_thread(self._get_backend, key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Store a value under a key"""
+        stored_at = self._set_memory(key, value)
+        if self.backend:
+            self._set_backend(key, value, stored_at)
+
+    async def aset(self, key: str, value: str) -> None:
+        """Like `set`, writing the backend in a thread"""
+        stored_at = self._set_memory(key, value)
+        if self.backend:
+            await asyncio.to_thread(self._set_backend, key, value, stored_at)
+
+    def clear(self) -> None:
+        """Remove every entry from memory and the backend"""
+        with self._lock:
+            self._entries.clear()
+        if self.backend:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend else "memory",
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        """Look a key up in memory, dropping it if expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        return None
+
+    def _get_backend(self, key: str, now: float) -> Optional[str]:
+        """Look a key up in the backend, keeping a fresh entry in memory"""
+        try:
+            entry = self.backend.get(key)
+            if entry and now - entry[1] > self.ttl_seconds:
+                entry = None
+                with self._lock:
+                    self.expirations += 1
+                self.backend.delete(key)
+        except Exception as e:
+            logger.warning(f"Generation cache backend read failed: {str(e)}")
+            entry = None
+        if entry:
+            with self._lock:
+                self._store(key, entry)
+                self.hits += 1
+            return entry[0]
+        return None
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def _set_memory(self, key: str, value: str) -> float:
+        """Store a value in memory and return its timestamp"""
+        entry = (value, time.time())
+        with self._lock:
+            self._store(key, entry)
+        return entry[1]
+
+    def _set_backend(self, key: str, value: str, stored_at: float) -> None:
+        try:
+            self.backend.set(key, value, stored_at)
+        except Exception as e:
+            logger.warning(f"Generation cache backend write failed: {str(e)}")
+
+    def _store(self, key: str, entry: Tuple[str, float]) -> None:
+        """Insert an entry and evict the least recently used ones (lock held)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+def create_generation_cache() -> Optional[GenerationCache]:
+    """
+    Create the generation cache configured by environment variables
+
+    LLM_CACHE_BACKEND selects "memory" (default), "sqlite", "file" or "none".
+    LLM_CACHE_PATH sets the database file or directory for persistent backends,
+    LLM_CACHE_MAX_ENTRIES the in-memory size and LLM_CACHE_TTL_SECONDS the TTL.
+
+    Returns:
+        The configured cache, or None when caching is disabled
+    """
+    backend_name = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    if backend_name in ("none", "off", "disabled"):
+        logger.info("LLM generation cache disabled")
+        return None
+
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+    ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+
+    backend: Optional[CacheBackend] = None
+    if backend_name == "sqlite":
+        backend = SQLiteCacheBackend(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"), max_entries=max_entries * 10)
+    elif backend_name == "file":
+        backend = FileCacheBackend(os.getenv("LLM_CACHE_PATH", ".llm_cache"), max_entries=max_entries * 10)
+    elif backend_name != "memory":
+        logger.warning(f"Unknown LLM_CACHE_BACKEND '{backend_name}', using in-memory cache")
+
+    logger.info(f"LLM generation cache enabled ({backend_name}, {max_entries} entries, TTL {ttl_seconds}s)")
+    return GenerationCache(max_entries=max_entries, ttl_seconds=ttl_seconds, backend=backend)
@@ -1,23 +1,131 @@
+import asyncio
 import httpx
 import logging
 import os
 import json
-from typing import Optional, Dict, Any, List
+import time
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+
+from api.services.llm.cache import create_generation_cache, generation_key
+from api.services.llm.singleflight import SingleFlight
+from api.services.llm.retry import RetryPolicy
+from api.services.llm.ratelimit import RateLimiter, RateLimitExceeded
+from api.services.llm.tokens import PromptTooLarge, estimate_tokens
+from api.services.llm.routing import (
+    HedgingConfig,
+    LatencyTracker,
+    ModelRoute,
+    UpstreamError,
+    parse_model_chain
+)
+from api.services.metrics import (
+    LLM_COMPLETION_SECONDS,
+    LLM_FALLBACK_CONTENT,
+    LLM_MODEL_FALLBACKS,
+    LLM_UPSTREAM_RESPONSES,
+    cached_tokens,
+    record_usage
+)
 
 logger = logging.getLogger("api.services.llm.client")
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_MODEL = "google/gemini-2.0-flash"
+# Providers behind OpenRouter that only cache prompt prefixes marked with cache_control;
+# others (OpenAI, DeepSeek, ...) cache stable prefixes automatically
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
 class LLMClient:
     """Client for interacting with OpenRouter API for Google Gemini 2.0 Flash and other LLMs"""
     
     def __init__(self):
         """Initialize the LLM client with API keys from environment variables"""
         self.openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-        self.http_client = httpx.AsyncClient(timeout=60.0)
+        self.base_url = os.getenv("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL).rstrip("/")
+        self.completions_url = f"{self.base_url}/chat/completions"
+        self.http_client = self._create_http_client()
+        self.retry_policy = RetryPolicy.from_env()
+        self.rate_limiter = RateLimiter.from_env()
+        self.model_timeout = float(os.getenv("LLM_MODEL_TIMEOUT", "60"))
+        # Largest prompt (with the system prompt) in approximate tokens; 0 disables the check
+        self.max_input_tokens = int(os.getenv("LLM_MAX_INPUT_TOKENS", "0"))
+        # "auto" marks the system prompt as cacheable for providers that need it, "always" or "never"
+        self.cache_control = os.getenv("LLM_PROMPT_CACHE_CONTROL", "auto").lower()
+        self.completions = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.prompt_cache_hits = 0
+        self.model_chain = parse_model_chain(os.getenv("LLM_MODELS", DEFAULT_MODEL), self.model_timeout)
+        self.hedging = HedgingConfig.from_env()
+        self.latencies = LatencyTracker()
+        self.model_fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.cache = create_generation_cache()
+        self.singleflight = SingleFlight()
         
         if self.openrouter_api_key:
             logger.info("Initialized OpenRouter client")
         else:
             logger.warning("No OpenRouter API key found, using fallback content generation")
+    
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """
+        Create the shared HTTP client from environment configuration
+        
+        LLM_MAX_CONNECTIONS and LLM_MAX_KEEPALIVE bound the connection pool,
+        LLM_KEEPALIVE_EXPIRY sets how long idle connections are kept, and
+        LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT / LLM_POOL_TIMEOUT split the
+        request timeout. LLM_HTTP2=true enables HTTP/2 multiplexing when the
+        optional h2 package is installed.
+        """
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+        )
+        timeout = httpx.Timeout(
+            connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+            read=float(os.getenv("LLM_READ_TIMEOUT", "60")),
+            write=10.0,
+            pool=float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+        )
+        
+        http2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("LLM_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+                http2 = False
+        
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+    
+    async def warm_up(self) -> None:
+        """
+        Open pooled connections to OpenRouter ahead of the first request
+        
+        LLM_WARMUP_CONNECTIONS sets how many connections are opened (default 1,
+        0 disables). Failures are logged and otherwise ignored.
+        """
+        connections = int(os.getenv("LLM_WARMUP_CONNECTIONS", "1"))
+        if not self.openrouter_api_key or connections <= 0:
+            return
+        
+        async def touch():
+            response = await self.http_client.get(f"{self.base_url}/models", headers=self._build_headers())
+            await response.aread()
+        
+        results = await asyncio.gather(*(touch() for _ in range(connections)), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"OpenRouter connection warm-up failed: {str(failures[0])}")
+        else:
+            logger.info(f"Warmed up {connections} OpenRouter connection(s)")
+    
+    async def aclose(self) -> None:
+        """Close the shared HTTP client and its pooled connections"""
+        await self.http_client.aclose()
             
     async def generate_content(
         self, 
@@ -25,7 +133,8 @@ class LLMClient:
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: int = 4000,
-        model: str = None
+        model: str = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Generate content using the OpenRouter API
@@ -35,64 +144,510 @@ class LLMClient:
             system_prompt: Optional system prompt for context
             temperature: Controls randomness (0.0-1.0)
             max_tokens: Maximum number of tokens to generate
-            model: Which model to use (defaults to Google Gemini 2.0 Flash)
+            model: Which model to try first (defaults to the head of the LLM_MODELS chain)
+            response_format: Optional response_format constraining the output to a JSON schema
             
         Returns:
             The generated content as a string
+            
+        Raises:
+            PromptTooLarge: If the prompt exceeds LLM_MAX_INPUT_TOKENS
         """
-        if not model:
-            model = "google/gemini-2.0-flash"  # Default to Google Gemini 2.0 Flash
+        self._check_input_budget(prompt, system_prompt)
+        chain = self._resolve_chain(model)
+        model = chain[0].name
             
         logger.info(f"Generating content with model: {model}")
         
+        cache_key = generation_key(prompt, system_prompt, model, temperature, max_tokens, response_format)
+        if self.cache:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                logger.info("Serving content from generation cache")
+                return cached
+        
+        # Concurrent identical requests share a single upstream call
+        return await self.singleflight.do(
+            cache_key,
+            lambda: self._generate_uncached(
+                prompt, system_prompt, temperature, max_tokens, chain, cache_key, response_format
+            )
+        )
+    
+    async def _generate_uncached(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        chain: List[ModelRoute],
+        cache_key: str,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Call the OpenRouter API, caching successful completions"""
+        if not self.openrouter_api_key:
+            # Use fallback method (for development/testing only)
+            return self._generate_fallback_content(prompt, system_prompt)
+        
+        # Prepare the request data (the model is filled in per route)
+        data = {
+            "messages": self._build_messages(prompt, system_prompt),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "usage": {"include": True}
+        }
+        if response_format:
+            data["response_format"] = response_format
+        tokens = estimate_tokens(prompt, system_prompt) + max_tokens
+        
+        try:
+            if self.hedging.enabled and len(chain) > 1:
+                route, content = await self._complete_hedged(chain, data, tokens)
+            else:
+                route, content = await self._complete_with_fallbacks(chain, data, tokens)
+        except RateLimitExceeded:
+            # Load is being shed; let the caller report it instead of serving fallback content
+            raise
+        except Exception as e:
+            logger.error(f"Error generating content: {str(e)}", exc_info=True)
+            # Use fallback content in case of error
+            return self._generate_fallback_content(prompt, system_prompt)
+        
+        if self.cache:
+            if route is not chain[0]:
+                # A fallback model answered: cache it as that model's answer, not the requested one's
+                cache_key = generation_key(prompt, system_prompt, route.name, temperature, max_tokens, response_format)
+            await self.cache.aset(cache_key, content)
+        return content
+    
+    async def _complete(self, route: ModelRoute, data: Dict[str, Any], tokens: int) -> str:
+        """
+        Get a completion from a single model within its timeout
+        
+        Raises:
+            UpstreamError: If the model returns a non-200 response
+            asyncio.TimeoutError: If the model does not answer within its timeout
+        """
+        async with self.rate_limiter.slot():
+            started = time.monotonic()
+            response = await asyncio.wait_for(
+                self._send_with_retry({**data, "model": route.name}, tokens, deadline=route.timeout),
+                timeout=route.timeout
+            )
+        
+        if response.status_code != 200:
+            raise UpstreamError(f"OpenRouter API error from {route.name}: {response.status_code} - {response.text}")
+        
+        body = response.json()
+        content = body["choices"][0]["message"]["content"]
+        duration = time.monotonic() - started
+        self.latencies.record(route.name, duration)
+        self._record_completion(route.name, body.get("usage"), duration)
+        return content
+    
+    async def _complete_with_fallbacks(
+        self, chain: List[ModelRoute], data: Dict[str, Any], tokens: int
+    ) -> Tuple[ModelRoute, str]:
+        """Try each model of the chain in order until one succeeds, returning (route, content)"""
+        last_error: Optional[Exception] = None
+        for index, route in enumerate(chain):
+            try:
+                return route, await self._complete(route, data, tokens)
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Model {route.name} failed: {type(e).__name__}: {str(e)}")
+                if index + 1 < len(chain):
+                    self.model_fallbacks += 1
+                    LLM_MODEL_FALLBACKS.inc()
+                    logger.info(f"Falling back to model {chain[index + 1].name}")
+        raise last_error
+    
+    async def _complete_hedged(
+        self, chain: List[ModelRoute], data: Dict[str, Any], tokens: int
+    ) -> Tuple[ModelRoute, str]:
+        """
+        Try the chain with hedged requests, returning (route, content)
+        
+        If the newest request has not answered after the hedge delay (derived
+        from that model's recent latency percentile), the next model is fired
+        in parallel. A failure also moves on to the next model immediately.
+        The first successful answer wins and the other requests are cancelled.
+        """
+        pending: Dict[asyncio.Task, ModelRoute] = {}
+        next_index = 0
+        last_error: Optional[Exception] = None
+        
+        def launch() -> None:
+            nonlocal next_index
+            route = chain[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self._complete(route, data, tokens))] = route
+        
+        launch()
         try:
-            if self.openrouter_api_key:
-                # Use OpenRouter API
-                messages: List[Dict[str, str]] = []
+            while pending:
+                delay = None
+                if next_index < len(chain):
+                    delay = self.hedging.delay_for(chain[next_index - 1].name, self.latencies)
                 
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                    
-                messages.append({"role": "user", "content": prompt})
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
                 
-                # Prepare the request data
-                data = {
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens
-                }
+                if not done:
+                    self.hedges += 1
+                    logger.info(
+                        f"Model {chain[next_index - 1].name} slower than {delay:.2f} s, "
+                        f"hedging with {chain[next_index].name}"
+                    )
+                    launch()
+                    continue
                 
-                # Send the API request
-                response = await self.http_client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.openrouter_api_key}",
-                        "HTTP-Referer": "https://replit.com",
-                        "X-Title": "Lesson Generator"
-                    },
-                    json=data
-                )
+                for task in done:
+                    route = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if route is not chain[0]:
+                            self.hedge_wins += 1
+                        return route, task.result()
+                    last_error = error
+                    logger.warning(f"Model {route.name} failed: {type(error).__name__}: {str(error)}")
                 
-                # Process the response
-                if response.status_code == 200:
-                    response_data = response.json()
-                    return response_data["choices"][0]["message"]["content"]
-                else:
-                    logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-                    return self._generate_fallback_content(prompt)
-            else:
-                # Use fallback method (for development/testing only)
-                return self._generate_fallback_content(prompt)
+                if not pending and next_index < len(chain):
+                    self.model_fallbacks += 1
+                    LLM_MODEL_FALLBACKS.inc()
+                    launch()
+        finally:
+            # Cancel the losers (or everything, if we were cancelled ourselves)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        raise last_error
+    
+    def _resolve_chain(self, model: Optional[str]) -> List[ModelRoute]:
+        """Return the model chain, moving an explicitly requested model to the front"""
+        if not model:
+            return self.model_chain
+        
+        primary = next((route for route in self.model_chain if route.name == model), None)
+        if primary is None:
+            primary = ModelRoute(model, self.model_timeout)
+        return [primary] + [route for route in self.model_chain if route.name != model]
+    
+    async def stream_content(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        model: str = None,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream content from the OpenRouter API as it is generated
+        
+        Uses the streaming chat-completions mode and yields the text deltas
+        in the order they arrive. If the request fails before anything has
+        been streamed, the fallback content is yielded as a single chunk.
+        
+        Args:
+            prompt: The user prompt to send to the LLM
+            system_prompt: Optional system prompt for context
+            temperature: Controls randomness (0.0-1.0)
+            max_tokens: Maximum number of tokens to generate
+            model: Which model to try first (defaults to the head of the LLM_MODELS chain)
+            response_format: Optional response_format constraining the output to a JSON schema
+            
+        Yields:
+            Chunks of generated content
+            
+        Raises:
+            PromptTooLarge: If the prompt exceeds LLM_MAX_INPUT_TOKENS
+        """
+        self._check_input_budget(prompt, system_prompt)
+        chain = self._resolve_chain(model)
+        model = chain[0].name
+            
+        logger.info(f"Streaming content with model: {model}")
+        
+        cache_key = generation_key(prompt, system_prompt, model, temperature, max_tokens, response_format)
+        if self.cache:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                logger.info("Serving streamed content from generation cache")
+                yield cached
+                return
+        
+        if not self.openrouter_api_key:
+            yield self._generate_fallback_content(prompt, system_prompt)
+            return
+        
+        data = {
+            "messages": self._build_messages(prompt, system_prompt),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "usage": {"include": True}
+        }
+        if response_format:
+            data["response_format"] = response_format
+        tokens = estimate_tokens(prompt, system_prompt) + max_tokens
+        
+        chunks: List[str] = []
+        for index, route in enumerate(chain):
+            try:
+                async with self.rate_limiter.slot():
+                    started = time.monotonic()
+                    usage = None
+                    response = await asyncio.wait_for(
+                        self._send_with_retry(
+                            {**data, "model": route.name}, tokens, stream=True, deadline=route.timeout
+                        ),
+                        timeout=route.timeout
+                    )
+                    try:
+                        if response.status_code != 200:
+                            body = await response.aread()
+                            raise UpstreamError(
+                                f"OpenRouter API error from {route.name}: "
+                                f"{response.status_code} - {body.decode(errors='replace')}"
+                            )
+                        
+                        async for line in response.aiter_lines():
+                            # Skip keep-alive comments and blank separator lines
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[len("data:"):].strip()
+                            if payload == "[DONE]":
+                                break
+                            
+                            chunk = json.loads(payload)
+                            if "error" in chunk:
+                                raise UpstreamError(f"OpenRouter stream error: {chunk['error']}")
+                            # The final chunk carries the usage of the whole completion
+                            usage = chunk.get("usage") or usage
+                            
+                            choices = chunk.get("choices") or []
+                            delta = choices[0].get("delta", {}).get("content") if choices else None
+                            if delta:
+                                chunks.append(delta)
+                                yield delta
+                    finally:
+                        await response.aclose()
                 
-        except Exception as e:
-            logger.error(f"Error generating content: {str(e)}", exc_info=True)
-            # Use fallback content in case of error
-            return self._generate_fallback_content(prompt)
+                self._record_completion(route.name, usage, time.monotonic() - started)
+                if self.cache and chunks:
+                    if index:
+                        # Cache a fallback model's answer as its own, not the requested model's
+                        cache_key = generation_key(
+                            prompt, system_prompt, route.name, temperature, max_tokens, response_format
+                        )
+                    await self.cache.aset(cache_key, "".join(chunks))
+                return
+                
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                logger.error(f"Error streaming content from {route.name}: {str(e)}", exc_info=True)
+                if chunks:
+                    # Part of the response already reached the caller, so we
+                    # cannot swap in another model or fallback content transparently
+                    raise
+                if index + 1 < len(chain):
+                    self.model_fallbacks += 1
+                    LLM_MODEL_FALLBACKS.inc()
+                    logger.info(f"Falling back to model {chain[index + 1].name}")
+        
+        yield self._generate_fallback_content(prompt, system_prompt)
+    
+    async def _send_with_retry(
+        self,
+        data: Dict[str, Any],
+        tokens: int,
+        stream: bool = False,
+        deadline: Optional[float] = None
+    ) -> httpx.Response:
+        """
+        POST a chat-completions request, retrying transient failures
+        
+        Retryable statuses and transport errors are retried with exponential
+        backoff and full jitter, honoring Retry-After, until the attempt limit
+        or deadline budget of the retry policy is reached. Every attempt is
+        admitted by the rate limiter on its own, so retries count against
+        the requests and tokens per minute.
+        
+        Args:
+            data: The request body
+            tokens: Estimated tokens per attempt (prompt plus max_tokens)
+            stream: Whether to return a streaming response (the caller must close it)
+            deadline: Budget in seconds below the policy's deadline, e.g. the model
+                timeout, so retries end (with the last failure) before the caller's timeout
+            
+        Returns:
+            The last response received; non-retryable or exhausted failures are
+            returned as-is for the caller to handle
+            
+        Raises:
+            RateLimitExceeded: If an attempt cannot be admitted within the limiter's max wait
+        """
+        policy = self.retry_policy
+        started = time.monotonic()
+        attempt = 0
+        data = self._with_cache_control(data)
+        
+        while True:
+            attempt += 1
+            await self.rate_limiter.admit(tokens)
+            attempt_started = time.monotonic()
+            request = self.http_client.build_request(
+                "POST",
+                self.completions_url,
+                headers=self._build_headers(),
+                json=data,
+                timeout=self._attempt_timeout(policy.remaining(started, deadline))
+            )
+            
+            try:
+                response = await self.http_client.send(request, stream=stream)
+            except Exception as e:
+                LLM_UPSTREAM_RESPONSES.inc(status="error")
+                elapsed_ms = (time.monotonic() - attempt_started) * 1000
+                logger.warning(
+                    f"OpenRouter attempt {attempt} failed after {elapsed_ms:.0f} ms: {type(e).__name__}: {str(e)}"
+                )
+                delay = None
+                if policy.is_retryable_exception(e):
+                    delay = policy.next_delay(attempt, started, deadline=deadline)
+                if delay is None:
+                    raise
+                logger.info(f"Retrying OpenRouter request in {delay:.2f} s")
+                await asyncio.sleep(delay)
+                continue
+            
+            LLM_UPSTREAM_RESPONSES.inc(status=response.status_code)
+            elapsed_ms = (time.monotonic() - attempt_started) * 1000
+            logger.info(f"OpenRouter attempt {attempt} returned {response.status_code} in {elapsed_ms:.0f} ms")
+            
+            if response.status_code == 200 or not policy.is_retryable_status(response.status_code):
+                return response
+            
+            retry_after = policy.parse_retry_after(response.headers.get("Retry-After"))
+            delay = policy.next_delay(attempt, started, retry_after, deadline)
+            if delay is None:
+                return response
+            
+            await response.aclose()
+            logger.info(f"Retrying OpenRouter request in {delay:.2f} s")
+            await asyncio.sleep(delay)
+    
+    def _attempt_timeout(self, remaining: float) -> httpx.Timeout:
+        """Clamp the configured timeouts to the remaining deadline budget"""
+        timeout = self.http_client.timeout
+        remaining = max(remaining, 0.1)
+        return httpx.Timeout(
+            connect=min(timeout.connect, remaining),
+            read=min(timeout.read, remaining),
+            write=min(timeout.write, remaining),
+            pool=min(timeout.pool, remaining)
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return runtime statistics for the client"""
+        return {
+            "cache": self.cache.stats() if self.cache else None,
+            "singleflight": self.singleflight.stats(),
+            "rateLimiter": self.rate_limiter.stats(),
+            "maxInputTokens": self.max_input_tokens,
+            "promptCache": {
+                "cacheControl": self.cache_control,
+                "completions": self.completions,
+                "hits": self.prompt_cache_hits,
+                "promptTokens": self.prompt_tokens,
+                "cachedTokens": self.cached_prompt_tokens,
+                "cachedShare": round(self.cached_prompt_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+            },
+            "models": {
+                "chain": [{"model": route.name, "timeout": route.timeout} for route in self.model_chain],
+                "fallbacks": self.model_fallbacks,
+                "hedging": self.hedging.enabled,
+                "hedges": self.hedges,
+                "hedgeWins": self.hedge_wins,
+                "latency": self.latencies.stats()
+            }
+        }
+    
+    def _check_input_budget(self, prompt: str, system_prompt: Optional[str]) -> None:
+        """Reject a prompt above the input token budget before spending anything on it"""
+        if self.max_input_tokens <= 0:
+            return
+        tokens = estimate_tokens(prompt, system_prompt)
+        if tokens > self.max_input_tokens:
+            logger.warning(f"Rejecting prompt of ~{tokens} tokens (limit {self.max_input_tokens})")
+            raise PromptTooLarge(tokens, self.max_input_tokens)
+    
+    def _record_completion(self, model: str, usage: Optional[Dict[str, Any]], duration: float) -> None:
+        """Account the token usage and duration of a successful completion, including prompt cache hits"""
+        record_usage(model, usage)
+        cached = cached_tokens(usage)
+        prompt_tokens = (usage or {}).get("prompt_tokens")
+        self.completions += 1
+        if isinstance(prompt_tokens, (int, float)):
+            self.prompt_tokens += int(prompt_tokens)
+        if cached:
+            self.prompt_cache_hits += 1
+            self.cached_prompt_tokens += cached
+        LLM_COMPLETION_SECONDS.observe(duration, model=model, prompt_cache="hit" if cached else "miss")
+    
+    def _with_cache_control(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Mark the system prompt as a cacheable prefix for providers that need it
+        
+        The system message holds everything that is the same for every request
+        of a kind and is always sent first, so its processed form can be reused
+        across requests. Anthropic and Gemini models only cache prefixes ending
+        in a cache_control breakpoint, which requires the content-parts form of
+        the message.
+        """
+        if self.cache_control == "never":
+            return data
+        if self.cache_control != "always" and not data.get("model", "").startswith(CACHE_CONTROL_MODEL_PREFIXES):
+            return data
+        
+        messages = []
+        for message in data["messages"]:
+            if message["role"] == "system" and isinstance(message["content"], str):
+                message = {
+                    "role": "system",
+                    "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}]
+                }
+            messages.append(message)
+        return {**data, "messages": messages}
+    
+    def _build_messages(self, prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """Build the chat messages for a completion request"""
+        messages: List[Dict[str, str]] = []
+        
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+            
+        messages.append({"role": "user", "content": prompt})
+        
+        return messages
+    
+    def _build_headers(self) -> Dict[str, str]:
+        """Build the OpenRouter request headers"""
+        return {
+            "Authorization": f"Bearer {self.openrouter_api_key}",
+            "HTTP-Referer": "https://replit.com",
+            "X-Title": "Lesson Generator"
+        }
     
-    def _generate_fallback_content(self, prompt: str) -> str:
+    def _generate_fallback_content(self, prompt: str, system_prompt: Optional[str] = None) -> str:
         """Generate fallback content when no API keys are available (for development only)"""
         logger.warning("Using fallback content generation")
+        LLM_FALLBACK_CONTENT.inc()
         
         # Extract the topic from the prompt (simple heuristic)
         topic = "the requested topic"
@@ -148,7 +703,9 @@ Here are some practical examples that illustrate {topic} in real-world contexts:
             })
         else:
             # For new lesson creation
-            include_quiz = "quiz" in prompt.lower() and "include" in prompt.lower()
+            # The quiz instructions are part of the system prompt
+            instructions = f"{system_prompt or ''}\n{prompt}".lower()
+            include_quiz = "quiz" in instructions and "include" in instructions
             
             response = {
                 "title": f"Introduction to {topic.title()}",
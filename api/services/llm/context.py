@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from api.services.llm.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger("api.services.llm.context")
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+class Section:
+    """A markdown section: a heading and the text up to the next heading"""
+
+    def __init__(self, level: int, title: Optional[str], text: str):
+        self.level = level
+        self.title = title
+        self.text = text
+
+def split_sections(markdown: str) -> List[Section]:
+    """
+    Split markdown into sections at every heading (outside code fences)
+
+    Args:
+        markdown: The lesson content
+
+    Returns:
+        The sections in document order; text before the first heading becomes
+        a section without a title
+    """
+    sections: List[Section] = []
+    level, title, lines = 0, None, []
+    in_fence = False
+
+    for line in markdown.split("\n"):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_PATTERN.match(line)
+        if match:
+            if title is not None or "".join(lines).strip():
+                sections.append(Section(level, title, "\n".join(lines).strip()))
+            level, title, lines = len(match.group(1)), match.group(2), [line]
+        else:
+            lines.append(line)
+
+    if title is not None or "".join(lines).strip():
+        sections.append(Section(level, title, "\n".join(lines).strip()))
+    return sections
+
+class ContinuationContext:
+    """
+    Build a bounded prompt context for continuing long lessons
+
+    Lessons within the token budget are sent verbatim. Longer lessons are
+    reduced to the heading outline of the whole lesson, a summary of the
+    older sections and the most recent sections verbatim. Section summaries
+    are cached by content hash, so each continuation only summarizes the
+    sections that newly aged out of the verbatim window.
+
+    The parts are budgeted in that order: the outline (bounded to a share
+    of the budget) is always kept, then the oldest summaries are dropped,
+    and only then is the verbatim text shortened from its start, at a
+    line boundary, so the context still ends where the lesson does.
+    """
+
+    # Words kept from each older section for its summary line
+    SUMMARY_WORDS = 40
+    # Largest share of the budget the heading outline may take
+    OUTLINE_SHARE = 0.5
+
+    def __init__(self, budget_tokens: int = 3000, recent_sections: int = 3, cache_size: int = 4096):
+        """
+        Args:
+            budget_tokens: Maximum estimated tokens of lesson context (0 disables trimming)
+            recent_sections: Number of trailing sections kept verbatim
+            cache_size: Number of section summaries cached
+        """
+        self.budget_tokens = budget_tokens
+        self.recent_sections = recent_sections
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ContinuationContext":
+        """Create from LESSON_CONTEXT_BUDGET_TOKENS and LESSON_CONTEXT_RECENT_SECTIONS"""
+        return cls(
+            budget_tokens=int(os.getenv("LESSON_CONTEXT_BUDGET_TOKENS", "3000")),
+            recent_sections=int(os.getenv("LESSON_CONTEXT_RECENT_SECTIONS", "3"))
+        )
+
+    def build(self, content: str) -> Tuple[str, bool]:
+        """
+        Build the lesson context for a continuation prompt
+
+        Args:
+            content: The full lesson content
+
+        Returns:
+            A tuple of (context text, whether it was condensed)
+        """
+        if self.budget_tokens <= 0 or estimate_tokens(content) <= self.budget_tokens:
+            return content, False
+
+        sections = split_sections(content)
+        outline = self._outline(sections, int(self.budget_tokens * self.OUTLINE_SHARE))
+
+        keep = min(self.recent_sections, len(sections))
+        while True:
+            older, recent = sections[:len(sections) - keep], sections[len(sections) - keep:]
+            summary_lines = [self._summarize(s) for s in older]
+            recent_text = "\n\n".join(s.text for s in recent)
+            context = self._assemble(outline, summary_lines, recent_text)
+            if estimate_tokens(context) <= self.budget_tokens or keep <= 1:
+                break
+            # Move the oldest verbatim section into the summary
+            keep -= 1
+
+        # Still too large: drop the oldest summary lines, then shorten the verbatim text
+        while summary_lines and estimate_tokens(context) > self.budget_tokens:
+            summary_lines.pop(0)
+            context = self._assemble(outline, summary_lines, recent_text)
+        if estimate_tokens(context) > self.budget_tokens:
+            spare = int(self.budget_tokens * CHARS_PER_TOKEN) - len(self._assemble(outline, [], ""))
+            recent_text = self._tail(recent_text, spare)
+            context = self._assemble(outline, [], recent_text)
+
+        logger.info(
+            f"Condensed lesson context from {estimate_tokens(content)} to {estimate_tokens(context)} tokens "
+            f"({len(older)} sections summarized, {keep} verbatim)"
+        )
+        return context, True
+
+    @staticmethod
+    def _outline(sections: List[Section], max_tokens: int) -> str:
+        """
+        The heading outline of a lesson within max_tokens
+
+        The deepest heading levels are left out first; if the top level
+        alone is still too long, its first headings are kept.
+        """
+        headings = [(s.level, s.title) for s in sections if s.title]
+        while headings:
+            lines = [f"{'  ' * max(0, level - 1)}- {title}" for level, title in headings]
+            outline = "\n".join(lines)
+            if estimate_tokens(outline) <= max_tokens:
+                return outline
+            deepest = max(level for level, _ in headings)
+            if deepest == min(level for level, _ in headings):
+                break
+            headings = [(level, title) for level, title in headings if level < deepest]
+        else:
+            return ""
+
+        kept: List[str] = []
+        for line in lines:
+            if estimate_tokens("\n".join(kept + [line, "- ..."])) > max_tokens:
+                break
+            kept.append(line)
+        return "\n".join(kept + ["- ..."])
+
+    @staticmethod
+    def _tail(text: str, max_chars: int) -> str:
+        """The end of a text within max_chars, starting at a line (or word) boundary"""
+        if len(text) <= max_chars:
+            return text
+        if max_chars <= 0:
+            return ""
+        tail = text[-max_chars:]
+        boundary = tail.find("\n")
+        if boundary == -1:
+            boundary = tail.find(" ")
+        return tail[boundary + 1:] if boundary != -1 else tail
+
+    def _summarize(self, section: Section) -> str:
+        """Return a one-line extractive summary of a section, cached by content"""
+        key = hashlib.sha1(section.text.encode("utf-8")).hexdigest()
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary
+
+        body = section.text
+        if section.title:
+            body = body.split("\n", 1)[1] if "\n" in body else ""
+        body = " ".join(body.split())
+        first_sentence = SENTENCE_END.split(body, 1)[0] if body else ""
+        words = first_sentence.split()
+        if len(words) > self.SUMMARY_WORDS:
+            first_sentence = " ".join(words[:self.SUMMARY_WORDS]) + "..."
+        summary = f"- {section.title or 'Introduction'}: {first_sentence}".rstrip(": ")
+
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    @staticmethod
+    def _assemble(outline: str, summary_lines: List[str], recent_text: str) -> str:
+        parts = []
+        if outline:
+            parts.append(f"Lesson outline:\n{outline}")
+        if summary_lines:
+            parts.append("Summary of earlier sections:\n" + "\n".join(summary_lines))
+        parts.append(f"Most recent sections (verbatim):\n{recent_text}")
+        return "\n\n".join(parts)
+
+continuation_context = ContinuationContext.from_env()
@@ -0,0 +1,253 @@
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("api.services.llm.parsing")
+
+# Characters that end a run of ordinary characters inside a JSON string
+STRING_SPECIAL = re.compile(r'["\\]')
+
+SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+class IncrementalJSONParser:
+    """
+    Single-pass parser for the JSON object in an LLM response
+
+    Chunks are fed as they arrive. Leading prose and code fences before the
+    first "{" are skipped, and text after the object closes is ignored. The
+    string values of selected top-level fields (e.g. "content") are decoded
+    and returned from feed() as they stream in. finish() parses the object,
+    repairing truncated output such as an unclosed string or object when the
+    response was cut off at max_tokens.
+
+    Work is linear in the size of the response: runs of ordinary characters
+    inside strings are skipped with a single regex search.
+    """
+
+    def __init__(self, stream_fields: Iterable[str] = ("content", "continuation")):
+        """
+        Args:
+            stream_fields: Top-level string fields whose values feed() returns progressively
+        """
+        self.stream_fields = frozenset(stream_fields)
+        self.started = False
+        self.complete = False
+        self._parts: List[str] = []
+        self._length = 0
+        # Container stack of "{" / "[" characters
+        self._stack: List[str] = []
+        self._in_string = False
+        self._string_is_key = False
+        self._expect_key = False
+        self._escape: Optional[str] = None
+        self._escape_start = 0
+        self._pending_surrogate: Optional[int] = None
+        self._key_parts: List[str] = []
+        self._top_key: Optional[str] = None
+        self._streaming = False
+        # Position and stack after the last point where the text can be cut cleanly
+        self._checkpoint: Tuple[int, List[str]] = (0, [])
+
+    def feed(self, chunk: str) -> str:
+        """
+        Consume the next chunk of the response
+
+        Args:
+            chunk: The next piece of raw response text
+
+        Returns:
+            Newly decoded text of the streamed fields (may be empty)
+        """
+        if self.complete or not chunk:
+            return ""
+
+        if not self.started:
+            start = chunk.find("{")
+            if start == -1:
+                return ""
+            chunk = chunk[start:]
+            self.started = True
+
+        out: List[str] = []
+        i = 0
+        n = len(chunk)
+        while i < n:
+            if self._in_string:
+                i = self._consume_string(chunk, i, out)
+                continue
+
+            char = chunk[i]
+            position = self._length + i
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = self._expect_key
+                self._key_parts = []
+                self._streaming = (
+                    not self._string_is_key
+                    and self._stack == ["{"]
+                    and self._top_key in self.stream_fields
+                )
+            elif char in "{[":
+                self._stack.append(char)
+                self._expect_key = char == "{"
+                self._checkpoint = (position + 1, list(self._stack))
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self._expect_key = False
+                self._checkpoint = (position + 1, list(self._stack))
+                if not self._stack:
+                    i += 1
+                    self.complete = True
+                    break
+            elif char == ",":
+                self._checkpoint = (position, list(self._stack))
+                self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+            i += 1
+
+        self._parts.append(chunk[:i])
+        self._length += i
+        return "".join(out)
+
+    @property
+    def consumed(self) -> int:
+        """Number of characters consumed since the start of the object"""
+        return self._length
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Parse the object fed so far, repairing it if it was truncated
+
+        Returns:
+            The parsed object
+
+        Raises:
+            ValueError: If no JSON object could be recovered
+        """
+        if not self.started:
+            raise ValueError("No JSON object found in LLM response")
+
+        text = "".join(self._parts)
+        if self.complete:
+            try:
+                return self._loads(text)
+            except ValueError as e:
+                raise ValueError(f"Could not parse LLM response as JSON: {str(e)}")
+
+        for candidate in (self._close_in_place(text), self._close_at_checkpoint(text)):
+            if candidate is None:
+                continue
+            try:
+                data = self._loads(candidate)
+            except ValueError:
+                continue
+            if not data:
+                # Nothing usable survived the cut
+                break
+            logger.warning("Repaired truncated JSON in LLM response")
+            return data
+
+        raise ValueError("Could not parse LLM response as JSON: truncated object could not be repaired")
+
+    def _consume_string(self, chunk: str, i: int, out: List[str]) -> int:
+        """Consume string characters from chunk[i:], returning the next index"""
+        if self._escape is not None:
+            return self._consume_escape(chunk, i, out)
+
+        match = STRING_SPECIAL.search(chunk, i)
+        end = match.start() if match else len(chunk)
+        if end > i:
+            self._emit(chunk[i:end], out)
+        if not match:
+            return end
+
+        if chunk[end] == "\\":
+            self._escape = ""
+            self._escape_start = self._length + end
+            return end + 1
+
+        # Closing quote
+        self._in_string = False
+        self._streaming = False
+        if self._string_is_key:
+            self._expect_key = False
+            if self._stack == ["{"]:
+                self._top_key = "".join(self._key_parts)
+        else:
+            self._checkpoint = (self._length + end + 1, list(self._stack))
+        return end + 1
+
+    def _consume_escape(self, chunk: str, i: int, out: List[str]) -> int:
+        """Consume (part of) an escape sequence"""
+        self._escape += chunk[i]
+        i += 1
+        escape = self._escape
+
+        if escape[0] != "u":
+            self._escape = None
+            self._emit(SIMPLE_ESCAPES.get(escape, escape), out)
+            return i
+        if len(escape) < 5:
+            return i
+
+        self._escape = None
+        try:
+            code = int(escape[1:], 16)
+        except ValueError:
+            return i
+        if 0xD800 <= code < 0xDC00:
+            self._pending_surrogate = code
+            return i
+        if 0xDC00 <= code < 0xE000 and self._pending_surrogate is not None:
+            code = 0x10000 + ((self._pending_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._pending_surrogate = None
+        self._emit(chr(code), out)
+        return i
+
+    def _emit(self, text: str, out: List[str]) -> None:
+        if self._string_is_key:
+            self._key_parts.append(text)
+        elif self._streaming:
+            out.append(text)
+
+    def _close_in_place(self, text: str) -> Optional[str]:
+        """Close an open string and all open containers at the current position"""
+        if self._in_string:
+            if self._escape is not None:
+                text = text[:self._escape_start]
+            text += '"'
+        text = text.rstrip()
+        if text.endswith(","):
+            text = text[:-1]
+        if text.endswith(":"):
+            return None
+        return text + self._closers(self._stack)
+
+    def _close_at_checkpoint(self, text: str) -> Optional[str]:
+        """Cut back to the last complete value and close the containers open there"""
+        position, stack = self._checkpoint
+        if not stack:
+            return None
+        return text[:position].rstrip().rstrip(",") + self._closers(stack)
+
+    @staticmethod
+    def _closers(stack: List[str]) -> str:
+        return "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+    @staticmethod
+    def _loads(text: str) -> Dict[str, Any]:
+        # strict=False accepts raw newlines inside strings, which models often emit
+        data = json.loads(text, strict=False)
+        if not isinstance(data, dict):
+            raise ValueError("LLM response JSON is not an object")
+        return data
@@ -1,43 +1,55 @@
-import json
-import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from string import Formatter
+from types import MappingProxyType
 import logging
 import math
+import threading
 
 from api.models.lesson import LessonGenerationRequest, LessonContinuationRequest
+from api.services.llm.context import continuation_context
+from api.services.llm.parsing import IncrementalJSONParser
+from api.services.llm.tokens import estimate_tokens
+from api.services.metrics import LLM_PROMPT_TOKENS
 
 logger = logging.getLogger("api.services.llm.prompting")
 
-class PromptGenerator:
-    """Generate prompts for lesson creation and continuation"""
-    
-    SYSTEM_PROMPT = """You are an expert educational content creator with years of experience in curriculum development.
+SYSTEM_PROMPT = """You are an expert educational content creator with years of experience in curriculum development.
     Your task is to create high-quality, engaging, and educational lesson content based on user specifications.
     Format your responses in markdown, with proper headings, lists, and emphasis where appropriate.
     Make the content accurate, age-appropriate, and aligned with educational standards.
     Focus on clarity, engagement, and educational value.
     """
-    
-    @staticmethod
-    def create_lesson_prompt(request: LessonGenerationRequest) -> str:
-        """
-        Generate a prompt for creating a new lesson
-        
-        Args:
-            request: The lesson generation request containing topic, grade level, etc.
-            
-        Returns:
-            A formatted prompt string to send to the LLM
-        """
-        grade_level_desc = PromptGenerator._get_grade_level_description(request.gradeLevel)
-        
-        style_desc = ""
-        if request.lessonStyle:
-            style_desc = PromptGenerator._get_lesson_style_description(request.lessonStyle)
-        
-        quiz_instructions = ""
-        if request.includeQuiz:
-            quiz_instructions = """
+
+# Read-only lookup tables, built once
+GRADE_LEVEL_DESCRIPTIONS = MappingProxyType({
+    "elementary": "Elementary School (Grades K-5)",
+    "middle_school": "Middle School (Grades 6-8)",
+    "high_school": "High School (Grades 9-12)",
+    "college": "College/University Level",
+    "adult": "Adult Education",
+    "professional": "Professional Development"
+})
+
+LESSON_STYLE_DESCRIPTIONS = MappingProxyType({
+    "standard": "Use a standard, straightforward teaching approach.",
+    "interactive": "Make the lesson interactive with activities and engagement opportunities.",
+    "visual": "Emphasize visual learning with descriptive examples and mental imagery.",
+    "inquiry": "Use an inquiry-based approach that encourages critical thinking and questioning.",
+    "project": "Design the lesson around a project-based learning approach.",
+    "discussion": "Structure the lesson to facilitate discussion and debate.",
+    "storytelling": "Use narrative techniques and storytelling to convey information."
+})
+
+# Everything that is the same for every request of a kind lives in the
+# system message, which is sent first and never varies, so providers can
+# cache the processed prefix. Only the request itself goes in the user message.
+LESSON_INSTRUCTIONS = """
+The lesson should be comprehensive, accurate, and engaging for the specified grade level.
+Include a clear introduction, body with key concepts, and conclusion.
+Use markdown formatting with headings, lists, and emphasis for clarity.
+"""
+
+QUIZ_INSTRUCTIONS = """
 Include a quiz at the end of the lesson with 3-5 multiple-choice questions that test understanding of the key concepts.
 For each question, provide:
 - The question text
@@ -45,30 +57,14 @@ For each question, provide:
 - The index of the correct answer (0-3)
 """
 
-        additional = ""
-        if request.additionalInstructions:
-            additional = f"Additional instructions: {request.additionalInstructions}\n"
-            
-        prompt = f"""Create an educational lesson on the following topic:
-Topic: {request.topic}
-Grade Level: {grade_level_desc}
-{style_desc}
-{additional}
-
-The lesson should be comprehensive, accurate, and engaging for the specified grade level.
-Include a clear introduction, body with key concepts, and conclusion.
-Use markdown formatting with headings, lists, and emphasis for clarity.
-{quiz_instructions}
-
+LESSON_SCHEMA = """
 Return your response as a JSON object with the following structure:
-{{
+{
   "title": "The title of the lesson",
   "content": "The full lesson content in markdown",
-  "readTime": estimated_read_time_in_minutes
-"""
+  "readTime": estimated_read_time_in_minutes"""
 
-        if request.includeQuiz:
-            prompt += """,
+QUIZ_SCHEMA = """,
   "quiz": [
     {
       "question": "Question text",
@@ -76,79 +72,219 @@ Return your response as a JSON object with the following structure:
       "correctAnswer": correct_answer_index
     },
     // Additional questions...
-  ]
+  ]"""
+
+CONTINUATION_INSTRUCTIONS = """
+Continue the lesson you are given by adding additional content that builds on what's already covered.
+Add new sections, examples, or activities that enhance the educational value.
+Maintain the same tone, style, and grade level as the original content.
+Use markdown formatting with headings, lists, and emphasis for clarity.
+
+Return your response as a JSON object with the following structure:
+{
+  "continuation": "The additional content to append to the lesson",
+  "readTimeIncrement": estimated_additional_read_time_in_minutes
+}
 """
 
-        prompt += "\n}"
-        
+# User messages use str.format syntax: {field} is filled in
+LESSON_REQUEST = """Create an educational lesson on the following topic:
+Topic: {topic}
+Grade Level: {grade_level}
+{style}
+{additional}"""
+
+CONTINUATION_REQUEST = """Continue the following educational lesson by adding more content.
+
+{lesson_label}:
+```
+{context}
+```
+{additional}"""
+
+# Appended to the original request when a structured response failed validation
+REPAIR_REQUEST = """
+Your previous response did not match the required JSON structure:
+{errors}
+Return the complete JSON object again, with every required field and nothing else.
+"""
+
+class Prompt(NamedTuple):
+    """A rendered prompt: the static system message and the per-request user message"""
+    system: str
+    user: str
+
+class PromptTemplate:
+    """
+    A prompt variant: a fixed system message and a user message template
+
+    The user template is parsed once into literal and field parts, so
+    rendering only concatenates them with the values, without re-parsing
+    or interpreting braces in the values.
+    """
+
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = system
+        self.parts: Tuple[Tuple[str, Optional[str]], ...] = tuple(
+            (literal, field or None) for literal, field, _, _ in Formatter().parse(user)
+        )
+        self.fields = frozenset(field for _, field in self.parts if field)
+        # Tokens of the fixed text, sent with every prompt of this variant
+        self.static_tokens = estimate_tokens(system, "".join(literal for literal, _ in self.parts))
+
+    def render(self, values: Dict[str, str]) -> Prompt:
+        user = "".join(literal + values[field] if field else literal for literal, field in self.parts)
+        return Prompt(self.system, user)
+
+class PromptRegistry:
+    """
+    The prompt variants, compiled once when the module is loaded
+
+    Every render is measured in approximate input tokens (system and user
+    message), logged, observed in the llm_prompt_tokens histogram and
+    summarized per template by stats().
+    """
+
+    def __init__(self, templates: List[PromptTemplate]):
+        self.templates = MappingProxyType({template.name: template for template in templates})
+        # Per template: [renders, total tokens, largest prompt in tokens]
+        self._stats: Dict[str, List[int]] = {name: [0, 0, 0] for name in self.templates}
+        self._lock = threading.Lock()
+        logger.info(f"Compiled {len(self.templates)} prompt templates")
+
+    def render(self, name: str, **values: str) -> Prompt:
+        """
+        Render a template and account for its size
+
+        Args:
+            name: The template name
+            values: A value for every field of the user message
+
+        Returns:
+            The system and user messages
+        """
+        prompt = self.templates[name].render(values)
+        tokens = estimate_tokens(prompt.system, prompt.user)
+        with self._lock:
+            stats = self._stats[name]
+            stats[0] += 1
+            stats[1] += tokens
+            stats[2] = max(stats[2], tokens)
+        LLM_PROMPT_TOKENS.observe(tokens, template=name)
+        logger.info(f"Rendered {name} prompt: ~{tokens} input tokens")
         return prompt
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-template render counts and approximate input token sizes"""
+        with self._lock:
+            return {
+                name: {
+                    "staticTokens": self.templates[name].static_tokens,
+                    "renders": renders,
+                    "averageTokens": round(total / renders) if renders else 0,
+                    "maxTokens": largest
+                }
+                for name, (renders, total, largest) in self._stats.items()
+            }
+
+prompt_templates = PromptRegistry([
+    PromptTemplate("lesson", SYSTEM_PROMPT + LESSON_INSTRUCTIONS + LESSON_SCHEMA + "\n}\n", LESSON_REQUEST),
+    PromptTemplate(
+        "lesson_quiz",
+        SYSTEM_PROMPT + LESSON_INSTRUCTIONS + QUIZ_INSTRUCTIONS + LESSON_SCHEMA + QUIZ_SCHEMA + "\n}\n",
+        LESSON_REQUEST
+    ),
+    PromptTemplate("continuation", SYSTEM_PROMPT + CONTINUATION_INSTRUCTIONS, CONTINUATION_REQUEST)
+])
+
+class PromptGenerator:
+    """Generate prompts for lesson creation and continuation"""
+    
+    SYSTEM_PROMPT = SYSTEM_PROMPT
+    
+    @staticmethod
+    def create_lesson_prompt(request: LessonGenerationRequest) -> Prompt:
+        """
+        Generate a prompt for creating a new lesson
+        
+        Args:
+            request: The lesson generation request containing topic, grade level, etc.
+        
+        Returns:
+            The system message (instructions and response format, the same
+            for every lesson with a quiz and for every lesson without) and
+            the user message
+        """
+        additional = ""
+        if request.additionalInstructions:
+            additional = f"Additional instructions: {request.additionalInstructions}\n"
+        
+        return prompt_templates.render(
+            "lesson_quiz" if request.includeQuiz else "lesson",
+            topic=request.topic,
+            grade_level=PromptGenerator._get_grade_level_description(request.gradeLevel),
+            style=PromptGenerator._get_lesson_style_description(request.lessonStyle) if request.lessonStyle else "",
+            additional=additional
+        )
     
     @staticmethod
-    def create_continuation_prompt(original_content: str, request: Optional[LessonContinuationRequest] = None) -> str:
+    def create_continuation_prompt(
+        original_content: str,
+        request: Optional[LessonContinuationRequest] = None
+    ) -> Prompt:
         """
         Generate a prompt for continuing an existing lesson
         
+        Lessons longer than the context budget are condensed to an outline,
+        a summary of older sections and the most recent sections verbatim.
+        
         Args:
             original_content: The original lesson content
             request: Optional continuation request with additional instructions
-            
+        
         Returns:
-            A formatted prompt string to send to the LLM
+            The system message (identical for every continuation) and the user message
         """
         additional = ""
         if request and request.additionalInstructions:
             additional = f"Additional instructions: {request.additionalInstructions}\n"
-            
-        prompt = f"""Continue the following educational lesson by adding more content.
-
-Original lesson:
-```
-{original_content}
-```
-
-{additional}
-Continue this lesson by adding additional content that builds on what's already covered.
-Add new sections, examples, or activities that enhance the educational value.
-Maintain the same tone, style, and grade level as the original content.
-Use markdown formatting with headings, lists, and emphasis for clarity.
-
-Return your response as a JSON object with the following structure:
-{{
-  "continuation": "The additional content to append to the lesson",
-  "readTimeIncrement": estimated_additional_read_time_in_minutes
-}}
-"""
         
-        return prompt
+        context, condensed = continuation_context.build(original_content)
+        
+        return prompt_templates.render(
+            "continuation",
+            lesson_label="Original lesson (condensed)" if condensed else "Original lesson",
+            context=context,
+            additional=additional
+        )
+    
+    @staticmethod
+    def create_repair_prompt(prompt: Prompt, errors: str) -> Prompt:
+        """
+        Generate the prompt to ask again for a response that failed validation
+        
+        The system message is unchanged, so the cached prompt prefix still applies.
+        
+        Args:
+            prompt: The prompt that produced the invalid response
+            errors: A summary of the validation errors, one per line
+        
+        Returns:
+            The system message and the original user message with the errors appended
+        """
+        return Prompt(prompt.system, prompt.user + REPAIR_REQUEST.format(errors=errors))
     
     @staticmethod
     def _get_grade_level_description(grade_level: str) -> str:
         """Convert grade level code to descriptive text"""
-        grade_level_map = {
-            "elementary": "Elementary School (Grades K-5)",
-            "middle_school": "Middle School (Grades 6-8)",
-            "high_school": "High School (Grades 9-12)",
-            "college": "College/University Level",
-            "adult": "Adult Education",
-            "professional": "Professional Development"
-        }
-        
-        return grade_level_map.get(grade_level, grade_level)
+        return GRADE_LEVEL_DESCRIPTIONS.get(grade_level, grade_level)
     
     @staticmethod
     def _get_lesson_style_description(style: str) -> str:
         """Convert lesson style code to descriptive text"""
-        style_map = {
-            "standard": "Use a standard, straightforward teaching approach.",
-            "interactive": "Make the lesson interactive with activities and engagement opportunities.",
-            "visual": "Emphasize visual learning with descriptive examples and mental imagery.",
-            "inquiry": "Use an inquiry-based approach that encourages critical thinking and questioning.",
-            "project": "Design the lesson around a project-based learning approach.",
-            "discussion": "Structure the lesson to facilitate discussion and debate.",
-            "storytelling": "Use narrative techniques and storytelling to convey information."
-        }
-        
-        return style_map.get(style, f"Style: {style}")
+        description = LESSON_STYLE_DESCRIPTIONS.get(style)
+        return description if description is not None else f"Style: {style}"
     
     @staticmethod
     def parse_llm_response(response_text: str) -> Dict[str, Any]:
@@ -161,30 +297,25 @@ Return your response as a JSON object with the following structure:
         Returns:
             Parsed dictionary containing the lesson data
         """
-        # Try to extract JSON from the response if it contains other text
-        json_pattern = r'```json\n([\s\S]*?)\n```'
-        json_match = re.search(json_pattern, response_text)
-        
-        if json_match:
+        # Skip any prose or code fence before the object; a brace in leading
+        # prose yields a complete but invalid object, so retry after it
+        error = "no JSON object found"
+        start = response_text.find("{")
+        for _ in range(3):
+            if start == -1:
+                break
+            parser = IncrementalJSONParser()
+            parser.feed(response_text[start:])
             try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse JSON in code block")
-                
-        # Try to find any JSON object in the text
-        try:
-            # Look for content between curly braces
-            json_content_pattern = r'\{[\s\S]*\}'
-            json_content_match = re.search(json_content_pattern, response_text)
-            
-            if json_content_match:
-                return json.loads(json_content_match.group(0))
-            
-            # If we're here, try to parse the entire response as JSON
-            return json.loads(response_text)
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.warning(f"Failed to parse LLM response as JSON: {str(e)}")
-            raise ValueError(f"Could not parse LLM response as JSON: {str(e)}")
+                return parser.finish()
+            except ValueError as e:
+                error = str(e)
+            if not parser.complete:
+                break
+            start = response_text.find("{", start + parser.consumed)
+        
+        logger.warning(f"Failed to parse LLM response as JSON: {error}")
+        raise ValueError(f"Could not parse LLM response as JSON: {error}")
     
     @staticmethod
     def estimate_read_time(content: str) -> int:
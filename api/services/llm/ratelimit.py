@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, Optional
+
+from api.services.metrics import LLM_RATE_LIMIT_REJECTIONS
+
+logger = logging.getLogger("api.services.llm.ratelimit")
+
+class RateLimitExceeded(Exception):
+    """Raised when an upstream call cannot be admitted within the maximum wait"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize a full bucket
+
+        Args:
+            per_minute: Capacity of the bucket and its refill per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Take tokens out of the bucket"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateLimiter:
+    """
+    Client-side limiter for upstream LLM calls
+
+    Enforces requests per minute, tokens per minute and a cap on concurrent
+    in-flight calls. A call holds a concurrency slot (slot()) while it runs
+    and every attempt it makes, retries included, is admitted against the
+    request and token budgets (admit()). Callers are admitted in arrival
+    order; one that would wait longer than max_wait is rejected with
+    RateLimitExceeded instead. A limit of 0 disables it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = 0,
+        max_wait: float = 30.0
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        # asyncio.Lock wakes waiters in FIFO order, which gives fair queueing
+        self._turn = asyncio.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Create a limiter from LLM_RATE_LIMIT_* environment variables"""
+        return cls(
+            requests_per_minute=int(os.getenv("LLM_RATE_LIMIT_RPM", "0")),
+            tokens_per_minute=int(os.getenv("LLM_RATE_LIMIT_TPM", "0")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "0")),
+            max_wait=float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "30"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._request_bucket or self._token_bucket or self._semaphore)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one of the concurrent in-flight slots for the duration of an upstream call
+
+        Raises:
+            RateLimitExceeded: If no slot frees up within max_wait
+        """
+        if self._semaphore:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._reject("concurrency limit", 1.0)
+            finally:
+                self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    async def admit(self, tokens: int) -> None:
+        """
+        Wait until the request and token budgets cover one attempt, and charge them
+
+        Called before every attempt, so retries after a 429 or a transport
+        error are paid for like any other request.
+
+        Args:
+            tokens: Estimated tokens the attempt will use (prompt plus max_tokens)
+
+        Raises:
+            RateLimitExceeded: If the attempt cannot be admitted within max_wait
+        """
+        if not (self._request_bucket or self._token_bucket):
+            return
+
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._wait_for_budget(tokens, started + self.max_wait)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.total_wait += waited
+        self.admitted += 1
+        if waited > 0.1:
+            logger.info(f"Upstream attempt admitted after waiting {waited:.2f} s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return configured limits and admission counters"""
+        return {
+            "requestsPerMinute": self.requests_per_minute,
+            "tokensPerMinute": self.tokens_per_minute,
+            "maxConcurrency": self.max_concurrency,
+            "maxWaitSeconds": self.max_wait,
+            "inFlight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "averageWaitSeconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "availableRequests": self.available_requests(),
+            "availableTokens": self.available_tokens(),
+        }
+
+    async def _wait_for_budget(self, tokens: int, deadline: float) -> None:
+        """Wait our turn, then until both buckets can cover the call"""
+        try:
+            await asyncio.wait_for(self._turn.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._reject("queue wait", 1.0)
+
+        try:
+            while True:
+                delay = max(
+                    self._request_bucket.delay_for(1) if self._request_bucket else 0.0,
+                    self._token_bucket.delay_for(tokens) if self._token_bucket else 0.0
+                )
+                if delay <= 0:
+                    break
+                if time.monotonic() + delay > deadline:
+                    self._reject("rate limit", delay)
+                await asyncio.sleep(delay)
+
+            if self._request_bucket:
+                self._request_bucket.consume(1)
+            if self._token_bucket:
+                self._token_bucket.consume(tokens)
+        finally:
+            self._turn.release()
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.rejected += 1
+        LLM_RATE_LIMIT_REJECTIONS.inc(reason=reason)
+        logger.warning(f"Shedding upstream call: {reason} exceeded (max wait {self.max_wait} s)")
+        raise RateLimitExceeded(f"Upstream {reason} exceeded, try again later", retry_after)
+
+    def available_requests(self) -> Optional[int]:
+        """Requests the limiter would admit right now (None without a requests-per-minute limit)"""
+        return self._available(self._request_bucket)
+
+    def available_tokens(self) -> Optional[int]:
+        """Tokens the limiter would admit right now (None without a tokens-per-minute limit)"""
+        return self._available(self._token_bucket)
+
+    @staticmethod
+    def _available(bucket: Optional[TokenBucket]) -> Optional[int]:
+        if not bucket:
+            return None
+        bucket._refill()
+        return int(bucket.tokens)
@@ -0,0 +1,129 @@
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("api.services.llm.retry")
+
+# Responses that mean the request was not processed (or failed transiently)
+# and can be sent again without side effects
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Transport failures before the request was sent, so it never reached the model.
+# Failures after sending (read errors, dropped connections, read timeouts) are
+# not retried: the upstream may already be generating, and a completion is a
+# billed, non-idempotent POST that must not run twice.
+RETRYABLE_EXCEPTIONS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and a total deadline"""
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline: float = 90.0
+    ):
+        """
+        Initialize the policy
+
+        Args:
+            max_attempts: Maximum number of attempts, including the first one
+            base_delay: Backoff ceiling for the first retry in seconds
+            max_delay: Upper bound of any single backoff in seconds
+            deadline: Total time budget for all attempts in seconds
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Create a policy from LLM_RETRY_* environment variables"""
+        return cls(
+            max_attempts=int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "4")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "8")),
+            deadline=float(os.getenv("LLM_RETRY_DEADLINE", "90"))
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter backoff before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def next_delay(
+        self,
+        attempt: int,
+        started: float,
+        retry_after: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> Optional[float]:
+        """
+        Decide whether to retry after a failed attempt
+
+        Args:
+            attempt: Number of attempts made so far
+            started: time.monotonic() at the first attempt
+            retry_after: Delay requested by the server, if any
+            deadline: Tighter budget than the policy's for this call (e.g. a model timeout)
+
+        Returns:
+            Seconds to wait before the next attempt, or None to give up
+        """
+        if attempt >= self.max_attempts:
+            return None
+
+        delay = self.backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        if delay >= self.remaining(started, deadline):
+            return None
+        return delay
+
+    def remaining(self, started: float, deadline: Optional[float] = None) -> float:
+        """Seconds left in the deadline budget (capped by a call's own deadline, if given)"""
+        budget = self.deadline if deadline is None else min(self.deadline, deadline)
+        return max(0.0, budget - (time.monotonic() - started))
+
+    @staticmethod
+    def is_retryable_status(status_code: int) -> bool:
+        return status_code in RETRYABLE_STATUS_CODES
+
+    @staticmethod
+    def is_retryable_exception(exc: BaseException) -> bool:
+        return isinstance(exc, RETRYABLE_EXCEPTIONS)
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parse a Retry-After header given in seconds or as an HTTP date
+
+        Returns:
+            The requested delay in seconds, or None if absent or malformed
+        """
+        if not value:
+            return None
+        value = value.strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
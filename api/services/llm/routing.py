@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger("api.services.llm.routing")
+
+class UpstreamError(Exception):
+    """Raised when a model returns an unusable response"""
+
+class ModelRoute:
+    """A model in the fallback chain together with its own timeout"""
+
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.timeout = timeout
+
+    def __repr__(self) -> str:
+        return f"ModelRoute({self.name!r}, timeout={self.timeout})"
+
+def parse_model_chain(value: str, default_timeout: float) -> List[ModelRoute]:
+    """
+    Parse an ordered model chain such as "google/gemini-2.0-flash@30,openai/gpt-4o-mini@45"
+
+    The "@seconds" suffix is optional and defaults to default_timeout.
+
+    Args:
+        value: Comma-separated model names with optional timeouts
+        default_timeout: Timeout for models without an explicit one
+
+    Returns:
+        The routes in order of preference
+    """
+    routes: List[ModelRoute] = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, timeout = item.partition("@")
+        routes.append(ModelRoute(name.strip(), float(timeout) if timeout else default_timeout))
+    return routes
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per model"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Args:
+            window: Number of recent latencies kept per model
+            min_samples: Samples required before percentiles are reported
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        """Return the q-quantile (0-1) of recent latencies, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": self.percentile(model, 0.5),
+                "p95": self.percentile(model, 0.95),
+            }
+            for model, samples in list(self._samples.items())
+        }
+
+class HedgingConfig:
+    """When to fire a hedged request to the next model in the chain"""
+
+    def __init__(self, enabled: bool = False, percentile: float = 0.95, default_delay: float = 10.0):
+        """
+        Args:
+            enabled: Whether hedged requests are sent at all
+            percentile: Latency percentile of the primary model used as the hedge delay
+            default_delay: Hedge delay used until enough latency samples exist
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.default_delay = default_delay
+
+    @classmethod
+    def from_env(cls) -> "HedgingConfig":
+        return cls(
+            enabled=os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes"),
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+            default_delay=float(os.getenv("LLM_HEDGE_DELAY", "10"))
+        )
+
+    def delay_for(self, model: str, latencies: LatencyTracker) -> float:
+        observed = latencies.percentile(model, self.percentile)
+        return observed if observed is not None else self.default_delay
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Any, TypeVar
+
+logger = logging.getLogger("api.services.llm.singleflight")
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into a single in-flight call"""
+
+    def __init__(self):
+        """Initialize with no calls in flight"""
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self.executed = 0
+        self.deduplicated = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn once for all concurrent callers sharing a key
+
+        The first caller starts the call; callers arriving while it is in
+        flight await the same result (or exception). A caller being cancelled
+        does not cancel the shared call for the others.
+
+        Args:
+            key: Fingerprint identifying identical calls
+            fn: Zero-argument coroutine function performing the call
+
+        Returns:
+            The result of the shared call
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.executed += 1
+        else:
+            self.deduplicated += 1
+            logger.info(f"Joining in-flight generation {key[:12]}")
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters for executed and deduplicated calls"""
+        return {
+            "inFlight": len(self._calls),
+            "executed": self.executed,
+            "deduplicated": self.deduplicated,
+        }
+
+    def _finish(self, key: str, task: "asyncio.Future[Any]") -> None:
+        """Forget a completed call"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,97 @@
+import functools
+from typing import Any, Dict, Optional, Tuple, Type, TypeVar, Union
+
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+# Validation errors quoted back to the model when asking it to repair a response
+MAX_REPORTED_ERRORS = 5
+
+@functools.lru_cache(maxsize=None)
+def response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    The chat-completions response_format constraining output to a model's schema
+
+    The pydantic JSON schema is converted to the strict subset providers
+    accept: references are inlined, every property is required and no
+    other properties are allowed. Built once per model; treat the result
+    as read-only.
+
+    Args:
+        model: The pydantic model the response must validate into
+
+    Returns:
+        The response_format request field
+    """
+    schema = model.model_json_schema()
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "strict": True,
+            "schema": _strict_schema(schema, schema.get("$defs", {}))
+        }
+    }
+
+def validate(model: Type[M], response: Union[str, Dict[str, Any]]) -> Tuple[Optional[M], Optional[str]]:
+    """
+    Validate a structured-output response into its model
+
+    Text is validated with a single pass of the pydantic JSON parser; only
+    a code fence or prose around the object is cut off first. A response
+    already parsed (e.g. incrementally while streaming) is validated as is.
+
+    Args:
+        model: The pydantic model the response must validate into
+        response: The raw response text or the parsed object
+
+    Returns:
+        A tuple of (model instance, None), or (None, a summary of the errors)
+    """
+    try:
+        if isinstance(response, str):
+            return model.model_validate_json(_json_span(response)), None
+        return model.model_validate(response), None
+    except ValidationError as e:
+        return None, _describe(e)
+
+def _json_span(text: str) -> str:
+    """The text from the first "{" to the last "}" (the whole text if there is none)"""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return text
+    return text[start:end + 1]
+
+def _describe(error: ValidationError) -> str:
+    """One line per validation error, e.g. `quiz.0.correctAnswer: Field required`"""
+    lines = []
+    for detail in error.errors()[:MAX_REPORTED_ERRORS]:
+        location = ".".join(str(part) for part in detail["loc"]) or "response"
+        lines.append(f"- {location}: {detail['msg']}")
+    if error.error_count() > MAX_REPORTED_ERRORS:
+        lines.append(f"- ... and {error.error_count() - MAX_REPORTED_ERRORS} more")
+    return "\n".join(lines)
+
+def _strict_schema(node: Any, definitions: Dict[str, Any]) -> Any:
+    """Inline references and close every object of a JSON schema"""
+    if isinstance(node, list):
+        return [_strict_schema(item, definitions) for item in node]
+    if not isinstance(node, dict):
+        return node
+    if "$ref" in node:
+        return _strict_schema(definitions[node["$ref"].rsplit("/", 1)[-1]], definitions)
+
+    strict = {}
+    for key, value in node.items():
+        if key in ("$defs", "title", "default"):
+            continue
+        if key == "properties":
+            strict[key] = {name: _strict_schema(schema, definitions) for name, schema in value.items()}
+        else:
+            strict[key] = _strict_schema(value, definitions)
+    if strict.get("type") == "object":
+        strict["required"] = list(strict.get("properties", {}))
+        strict["additionalProperties"] = False
+    return strict
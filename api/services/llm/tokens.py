@@ -0,0 +1,25 @@
+import math
+from typing import Optional
+
+# Rough average for English text across common tokenizers
+CHARS_PER_TOKEN = 4
+
+class PromptTooLarge(ValueError):
+    """Raised when a prompt exceeds the input token budget, before anything is sent upstream"""
+
+    def __init__(self, tokens: int, limit: int):
+        super().__init__(f"Prompt is about {tokens} tokens, above the limit of {limit} input tokens")
+        self.tokens = tokens
+        self.limit = limit
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    """
+    Approximate the number of tokens in one or more texts
+
+    Args:
+        texts: The texts to count (None entries are ignored)
+
+    Returns:
+        The estimated token count
+    """
+    return sum(math.ceil(len(text) / CHARS_PER_TOKEN) for text in texts if text)
@@ -0,0 +1,304 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("api.services.metrics")
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from fast local work up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Metric:
+    """Base class for a metric family with an optional fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(Metric):
+    """Value that can go up and down, or be read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the (unlabelled) value from function whenever metrics are rendered"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(float(self._function()))}"]
+            except Exception as e:
+                logger.warning(f"Could not read gauge {self.name}: {str(e)}")
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last one is +Inf), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observe the duration of the block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+
+        lines: List[str] = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """In-process registry rendering all metrics in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every registered metric"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+registry = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by method, route and status code", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time until the response headers are sent", ("method", "route")
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+# Lesson generation
+LESSON_STAGE_SECONDS = registry.histogram(
+    "lesson_stage_duration_seconds",
+    "Duration of each stage of creating or continuing a lesson "
+    "(reuse, prompt, llm, parse, storage, serialize)",
+    ("operation", "stage")
+)
+LESSON_PARSE_FAILURES = registry.counter(
+    "lesson_parse_failures_total", "LLM responses that could not be parsed as JSON", ("operation",)
+)
+LLM_STRUCTURED_OUTPUT = registry.counter(
+    "llm_structured_output_total",
+    "Structured-output responses by outcome: valid, repaired by a second request, or invalid",
+    ("operation", "result")
+)
+LESSONS_STORED = registry.gauge("lessons_stored", "Number of lessons in the lesson store")
+LESSON_REUSE = registry.counter(
+    "lesson_reuse_total", "Near-duplicate lookups before generating a lesson (hit or miss)", ("result",)
+)
+LESSON_JSON_CACHE = registry.counter(
+    "lesson_json_cache_total", "Encoded lesson body cache lookups of the fast JSON path", ("result",)
+)
+
+# Upstream LLM calls
+LLM_UPSTREAM_RESPONSES = registry.counter(
+    "llm_upstream_responses_total",
+    "OpenRouter HTTP attempts by status code (\"error\" for transport failures)",
+    ("status",)
+)
+LLM_PROMPT_TOKENS = registry.histogram(
+    "llm_prompt_tokens",
+    "Approximate input tokens (prompt and system prompt) of rendered prompts",
+    ("template",),
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Tokens reported by OpenRouter usage", ("model", "type")
+)
+LLM_COMPLETION_SECONDS = registry.histogram(
+    "llm_completion_duration_seconds",
+    "Duration of successful upstream completions, by whether part of the prompt was served from the provider's cache",
+    ("model", "prompt_cache")
+)
+LLM_RATE_LIMIT_REJECTIONS = registry.counter(
+    "llm_rate_limit_rejections_total", "Upstream calls shed by the client-side rate limiter", ("reason",)
+)
+LLM_RATE_LIMIT_IN_FLIGHT = registry.gauge(
+    "llm_rate_limit_in_flight", "Upstream calls holding a rate limiter concurrency slot"
+)
+LLM_RATE_LIMIT_WAITING = registry.gauge(
+    "llm_rate_limit_waiting", "Upstream calls waiting for the rate limiter"
+)
+LLM_RATE_LIMIT_AVAILABLE_REQUESTS = registry.gauge(
+    "llm_rate_limit_available_requests", "Requests left in the rate limiter's requests-per-minute bucket"
+)
+LLM_RATE_LIMIT_AVAILABLE_TOKENS = registry.gauge(
+    "llm_rate_limit_available_tokens", "Tokens left in the rate limiter's tokens-per-minute bucket"
+)
+LLM_MODEL_FALLBACKS = registry.counter(
+    "llm_model_fallbacks_total", "Times a later model in the chain was tried after a failure"
+)
+LLM_FALLBACK_CONTENT = registry.counter(
+    "llm_fallback_content_total", "Responses served from the built-in fallback content generator"
+)
+
+def cached_tokens(usage: Optional[Dict[str, object]]) -> int:
+    """
+    Prompt tokens the provider served from its prompt cache
+
+    OpenRouter reports them in prompt_tokens_details.cached_tokens;
+    Anthropic-style usage calls them cache_read_input_tokens.
+    """
+    if not usage:
+        return 0
+    details = usage.get("prompt_tokens_details")
+    value = details.get("cached_tokens") if isinstance(details, dict) else None
+    if value is None:
+        value = usage.get("cache_read_input_tokens")
+    return int(value) if isinstance(value, (int, float)) else 0
+
+def record_usage(model: str, usage: Optional[Dict[str, object]]) -> None:
+    """Count the token usage reported in an OpenRouter response body"""
+    if not usage:
+        return
+    for field, kind in (("prompt_tokens", "prompt"), ("completion_tokens", "completion")):
+        value = usage.get(field)
+        if isinstance(value, (int, float)):
+            LLM_TOKENS.inc(value, model=model, type=kind)
+    cached = cached_tokens(usage)
+    if cached:
+        LLM_TOKENS.inc(cached, model=model, type="cached")
@@ -0,0 +1,267 @@
+import heapq
+import logging
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from api.models.lesson import QuizQuestion
+
+logger = logging.getLogger("api.services.search")
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Very frequent English words carry no ranking signal but have the longest posting lists
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this "
+    "to was were will with you your".split()
+)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms, dropping stopwords"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def quiz_text(quiz: Optional[List[QuizQuestion]]) -> str:
+    """Flatten quiz questions and options into searchable text"""
+    if not quiz:
+        return ""
+    return "\n".join(f"{q.question} {' '.join(q.options)}" for q in quiz)
+
+def make_snippet(text: str, terms: Iterable[str], width: int = 160) -> str:
+    """
+    Cut a window of text around the first query term and highlight the terms
+
+    Args:
+        text: The text to take the snippet from
+        terms: Lowercase query terms
+        width: Approximate snippet length in characters
+
+    Returns:
+        The snippet with matches wrapped in <mark></mark>
+    """
+    terms = [re.escape(term) for term in terms]
+    if not terms:
+        return text[:width]
+    pattern = re.compile(r"(?<![^\W_])(?:" + "|".join(terms) + r")(?![^\W_])", re.IGNORECASE)
+
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 3) if match else 0
+    end = min(len(text), start + width)
+    window = " ".join(text[start:end].split())
+    window = pattern.sub(lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", window)
+    return ("…" if start > 0 else "") + window + ("…" if end < len(text) else "")
+
+class SearchIndex:
+    """
+    In-process inverted index with BM25 ranking
+
+    Documents are lessons. Topic terms are weighted above content and quiz
+    terms. The index is updated incrementally: a continuation only
+    tokenizes the appended segment, and a delete only touches the postings
+    of the lesson's own terms.
+
+    Terms found in a large share of lessons are handled like Lucene's
+    common-terms query: when the query also has rarer terms, lessons are
+    matched on the rare terms and common terms only add to their score, so
+    the long posting lists are never scanned in full (the total is
+    estimated rather than counted). Ranked results are cached until the
+    index changes.
+
+    Safe to search from a worker thread while the index is updated: a
+    search takes references to the postings of its terms under a lock and
+    ranks them without it. Writers replace a posting list with an updated
+    copy while a search holds it (copy-on-write) and update it in place
+    otherwise.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    TOPIC_WEIGHT = 3
+    # A term is common once it appears in this share of lessons (and at least COMMON_TERM_MIN_DOCS)
+    COMMON_TERM_RATIO = 0.1
+    COMMON_TERM_MIN_DOCS = 1000
+
+    def __init__(self):
+        # term -> {lesson_id: weighted term frequency}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        # lesson_id -> its terms, so a delete only visits those postings
+        self.doc_terms: Dict[int, Set[str]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        # term -> number of searches ranking its current postings, which writers must not mutate
+        self._readers: Counter = Counter()
+        self.total_length = 0
+        self.revision = 0
+        self._results: "OrderedDict[Tuple[FrozenSet[str], int], Tuple[int, int, List[Tuple[int, float]]]]" = OrderedDict()
+        self._results_size = 256
+        self._lock = threading.Lock()
+
+    def add(self, lesson_id: int, topic: str, content: str, quiz: Optional[List[QuizQuestion]] = None) -> None:
+        """Index a new lesson"""
+        terms = Counter()
+        for token in tokenize(topic):
+            terms[token] += self.TOPIC_WEIGHT
+        terms.update(tokenize(content))
+        terms.update(tokenize(quiz_text(quiz)))
+        with self._lock:
+            self.doc_terms[lesson_id] = set()
+            self.doc_lengths[lesson_id] = 0
+            self._add_terms(lesson_id, terms)
+
+    def append(self, lesson_id: int, content: str) -> None:
+        """Index content appended to an existing lesson"""
+        terms = Counter(tokenize(content))
+        with self._lock:
+            if lesson_id in self.doc_terms:
+                self._add_terms(lesson_id, terms)
+
+    def remove(self, lesson_id: int) -> None:
+        """Remove a lesson from the index"""
+        with self._lock:
+            terms = self.doc_terms.pop(lesson_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                postings = self._writable(term)
+                del postings[lesson_id]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(lesson_id)
+            self.revision += 1
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[Tuple[int, float]]]:
+        """
+        Rank lessons matching the query
+
+        Lessons match if they contain any of the rarer query terms; a query
+        made only of common terms matches lessons containing all of them.
+
+        Args:
+            query: The search query
+            limit: Maximum number of results
+            offset: Number of top results to skip
+
+        Returns:
+            A tuple of (lessons containing any query term, [(lesson_id, score)] best first)
+        """
+        terms = frozenset(tokenize(query))
+        if not terms:
+            return 0, []
+
+        key = (terms, offset + limit)
+        with self._lock:
+            count = len(self.doc_lengths)
+            if not count:
+                return 0, []
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == self.revision:
+                self._results.move_to_end(key)
+                return cached[1], cached[2][offset:]
+
+            revision = self.revision
+            present = [(term, self.postings[term]) for term in terms if term in self.postings]
+            self._readers.update(term for term, _ in present)
+            average_length = self.total_length / count or 1.0
+
+        try:
+            total, top = self._rank(present, count, average_length, offset + limit)
+        finally:
+            with self._lock:
+                for term, _ in present:
+                    self._readers[term] -= 1
+                    if not self._readers[term]:
+                        del self._readers[term]
+        with self._lock:
+            self._results[key] = (revision, total, top)
+            while len(self._results) > self._results_size:
+                self._results.popitem(last=False)
+        return total, top[offset:]
+
+    def _rank(
+        self,
+        present: List[Tuple[str, Dict[int, int]]],
+        count: int,
+        average_length: float,
+        size: int
+    ) -> Tuple[int, List[Tuple[int, float]]]:
+        """
+        Score the matching lessons with BM25
+
+        Args:
+            present: The postings of the query terms found in the index (not mutated while ranked)
+            count: Number of indexed lessons
+            average_length: Average weighted lesson length
+            size: Number of best results to keep
+
+        Returns:
+            A tuple of (lessons containing any of the terms, best `size` results).
+            With common terms the total is estimated from the longest posting
+            list and the rare-term matches, as a lower bound
+        """
+        if not present:
+            return 0, []
+
+        cutoff = max(self.COMMON_TERM_MIN_DOCS, self.COMMON_TERM_RATIO * count)
+        rare = [(term, postings) for term, postings in present if len(postings) <= cutoff]
+        common = [(term, postings) for term, postings in present if len(postings) > cutoff]
+
+        k1, b = self.K1, self.B
+        # Read live: a lesson deleted since the search started falls back to the average length
+        length = self.doc_lengths.get
+        scores: Dict[int, float] = {}
+
+        # BM25 with the length normalization folded into two constants per query
+        base = k1 * (1 - b)
+        scale = k1 * b / average_length
+
+        def add(postings: Dict[int, int], lesson_ids: Optional[Iterable[int]] = None) -> None:
+            frequency = len(postings)
+            weight = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5)) * (k1 + 1)
+            items = postings.items() if lesson_ids is None else (
+                (lesson_id, postings[lesson_id]) for lesson_id in lesson_ids if lesson_id in postings
+            )
+            get = scores.get
+            for lesson_id, tf in items:
+                scores[lesson_id] = get(lesson_id, 0.0) + weight * tf / (tf + base + scale * length(lesson_id, average_length))
+
+        if rare:
+            for _, postings in rare:
+                add(postings)
+            candidates = list(scores)
+        else:
+            # Only common terms: intersect the posting lists, starting from the shortest
+            common.sort(key=lambda item: len(item[1]))
+            candidates = common[0][1].keys()
+            for _, postings in common[1:]:
+                candidates = candidates & postings.keys()
+        for _, postings in common:
+            add(postings, candidates)
+
+        top = heapq.nlargest(size, scores.items(), key=lambda item: (item[1], -item[0]))
+        total = len(scores)
+        if common:
+            # Lessons holding only common terms are not ranked but match the query; counting
+            # their union would scan the long lists, so count the longest one plus the rare matches
+            longest = max((postings for _, postings in common), key=len)
+            total = len(longest) + sum(1 for lesson_id in scores if lesson_id not in longest)
+        return total, top
+
+    def _writable(self, term: str) -> Dict[int, int]:
+        """The postings of a term, copied first if a search is ranking them (lock held)"""
+        postings = self.postings.setdefault(term, {})
+        if self._readers[term]:
+            postings = self.postings[term] = dict(postings)
+        return postings
+
+    def _add_terms(self, lesson_id: int, terms: Counter) -> None:
+        self.doc_terms[lesson_id].update(terms.keys())
+        for term, tf in terms.items():
+            postings = self._writable(term)
+            postings[lesson_id] = postings.get(lesson_id, 0) + tf
+        length = sum(terms.values())
+        self.doc_lengths[lesson_id] += length
+        self.total_length += length
+        self.revision += 1
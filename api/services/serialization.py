@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+from pydantic import BaseModel
+
+from api.models.lesson import Lesson
+from api.services.metrics import LESSON_JSON_CACHE
+
+logger = logging.getLogger("api.services.serialization")
+
+class LessonJSONEncoder:
+    """
+    Encode lessons straight to JSON bytes, caching the bytes per lesson version
+
+    Lessons only change through continuations, which bump their version, so
+    the encoded body of an (id, version, createdAt) triple never goes stale.
+    Lessons coming from storage are already validated, so they are dumped
+    with pydantic's native serializer instead of passing through
+    response_model validation and jsonable_encoder again.
+    """
+
+    def __init__(self, enabled: bool = False, max_entries: int = 1024):
+        """
+        Args:
+            enabled: Whether lesson endpoints respond through this encoder
+            max_entries: Number of encoded lesson bodies kept (0 disables caching)
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._bodies: "OrderedDict[Tuple[int, int, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LessonJSONEncoder":
+        """Create from FAST_JSON_RESPONSES and FAST_JSON_CACHE_ENTRIES"""
+        return cls(
+            enabled=os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes"),
+            max_entries=int(os.getenv("FAST_JSON_CACHE_ENTRIES", "1024"))
+        )
+
+    def encode(self, lesson: Lesson) -> bytes:
+        """Return the JSON body of a lesson"""
+        if self.max_entries <= 0:
+            return lesson.model_dump_json().encode("utf-8")
+
+        key = (lesson.id, lesson.version, lesson.createdAt.isoformat())
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+        if body is not None:
+            LESSON_JSON_CACHE.inc(result="hit")
+            return body
+
+        LESSON_JSON_CACHE.inc(result="miss")
+        body = lesson.model_dump_json().encode("utf-8")
+        with self._lock:
+            self._bodies[key] = body
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return body
+
+    def encode_list(self, items: Iterable[BaseModel]) -> bytes:
+        """Return the JSON array of lessons (cached) or other models such as summaries"""
+        return b"[" + b",".join(
+            self.encode(item) if isinstance(item, Lesson) else item.model_dump_json().encode("utf-8")
+            for item in items
+        ) + b"]"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bodies.clear()
+
+lesson_json = LessonJSONEncoder.from_env()
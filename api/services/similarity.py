@@ -0,0 +1,199 @@
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("api.services.similarity")
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Words that make topics look different without changing what they are about
+TOPIC_FILLER = frozenset(
+    "a an and about all basic basics beginner beginners for fundamental fundamentals guide how in "
+    "intro introduction introductory learn learning lesson of on overview the to understanding "
+    "what with".split()
+)
+
+# Number of hash buckets of the topic vectors
+DIMENSIONS = 1 << 20
+
+def topic_terms(topic: str) -> List[str]:
+    """Normalize a topic into content words, folding simple plurals"""
+    words = []
+    for word in TOKEN_PATTERN.findall(topic.lower()):
+        if word in TOPIC_FILLER:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def topic_vector(topic: str) -> Dict[int, float]:
+    """
+    Map a topic to a sparse, L2-normalized vector of hashed features
+
+    Features are the normalized words plus their character trigrams, so
+    spelling variants and compound words still overlap. Hashing uses CRC-32,
+    which (unlike hash()) is stable across processes.
+
+    Args:
+        topic: The lesson topic
+
+    Returns:
+        {bucket: weight} with unit length (empty if the topic has no content words)
+    """
+    vector: Dict[int, float] = {}
+
+    def add(feature: str, weight: float) -> None:
+        bucket = zlib.crc32(feature.encode("utf-8")) % DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + weight
+
+    for word in topic_terms(topic):
+        add(f"w:{word}", 1.0)
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            add(f"c:{padded[i:i + 3]}", 0.5)
+
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {bucket: weight / norm for bucket, weight in vector.items()} if norm else {}
+
+class SimilarityIndex:
+    """
+    Nearest-neighbour index of lesson topics by cosine similarity
+
+    Vectors are kept in an inverted index per grade level, so a query only
+    visits lessons of its own grade that share at least one feature.
+    """
+
+    def __init__(self):
+        # grade level -> bucket -> {lesson_id: weight}
+        self.postings: Dict[str, Dict[int, Dict[int, float]]] = {}
+        # lesson_id -> (grade level, lesson style, vector)
+        self.vectors: Dict[int, Tuple[str, Optional[str], Dict[int, float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def add(self, lesson_id: int, topic: str, grade_level: str, lesson_style: Optional[str]) -> None:
+        vector = topic_vector(topic)
+        self.vectors[lesson_id] = (grade_level, lesson_style, vector)
+        postings = self.postings.setdefault(grade_level, {})
+        for bucket, weight in vector.items():
+            postings.setdefault(bucket, {})[lesson_id] = weight
+
+    def remove(self, lesson_id: int) -> None:
+        entry = self.vectors.pop(lesson_id, None)
+        if entry is None:
+            return
+        grade_level, _, vector = entry
+        postings = self.postings[grade_level]
+        for bucket in vector:
+            postings[bucket].pop(lesson_id, None)
+            if not postings[bucket]:
+                del postings[bucket]
+
+    def nearest(
+        self,
+        topic: str,
+        grade_level: str,
+        lesson_style: Optional[str] = None,
+        limit: int = 5,
+        min_similarity: float = 0.0
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the lessons of a grade level whose topics are most similar
+
+        Args:
+            topic: The topic to match
+            grade_level: Only lessons of this grade level are considered
+            lesson_style: If given, only lessons in this style are considered
+            limit: Maximum number of matches
+            min_similarity: Smallest cosine similarity returned
+
+        Returns:
+            [(lesson_id, similarity)] best first
+        """
+        postings = self.postings.get(grade_level)
+        if not postings:
+            return []
+
+        scores: Dict[int, float] = {}
+        for bucket, weight in topic_vector(topic).items():
+            for lesson_id, other in postings.get(bucket, {}).items():
+                scores[lesson_id] = scores.get(lesson_id, 0.0) + weight * other
+
+        matches = [
+            (lesson_id, round(min(score, 1.0), 4))
+            for lesson_id, score in scores.items()
+            if score >= min_similarity
+            and (lesson_style is None or self.vectors[lesson_id][1] == lesson_style)
+        ]
+        matches.sort(key=lambda item: (-item[1], item[0]))
+        return matches[:limit]
+
+class LessonMatcher:
+    """
+    Keep a SimilarityIndex in step with a lesson storage
+
+    Topics never change after creation, so syncing only adds lessons with
+    IDs above the last one seen and removes those in the storage's
+    deletion log since the last deletion seen. This works the same for
+    the in-memory store and for SQLite databases shared by several
+    processes.
+    """
+
+    def __init__(self, storage, threshold: float = 0.8):
+        """
+        Args:
+            storage: The lesson storage to index
+            threshold: Cosine similarity from which an existing lesson is reused
+        """
+        self.storage = storage
+        self.threshold = threshold
+        self.index = SimilarityIndex()
+        self._revision: Optional[str] = None
+        self._last_id = 0
+        # Deletions before registering are already reflected in the lessons the first sync lists
+        self._consumer, self._last_deletion = storage.register_deletion_consumer()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, storage) -> "LessonMatcher":
+        """Create from LESSON_REUSE_THRESHOLD"""
+        return cls(storage, threshold=float(os.getenv("LESSON_REUSE_THRESHOLD", "0.8")))
+
+    def similar(
+        self,
+        topic: str,
+        grade_level: str,
+        lesson_style: Optional[str] = None,
+        limit: int = 5,
+        min_similarity: float = 0.0
+    ) -> List[Tuple[int, float]]:
+        """Find stored lessons with similar topics (see SimilarityIndex.nearest)"""
+        with self._lock:
+            self._sync()
+            return self.index.nearest(topic, grade_level, lesson_style, limit, min_similarity)
+
+    def _sync(self) -> None:
+        """Catch up with the storage (the caller holds the lock)"""
+        revision = self.storage.get_revision()
+        if revision == self._revision:
+            return
+
+        for summary in self.storage.list_lesson_summaries(after_id=self._last_id):
+            self.index.add(summary.id, summary.topic, summary.gradeLevel, summary.lessonStyle)
+            self._last_id = max(self._last_id, summary.id)
+
+        # Read after the additions, so a lesson created and deleted in between is removed too
+        deletions = self.storage.list_deletions(after=self._last_deletion, consumer=self._consumer)
+        for sequence, lesson_id in deletions:
+            self.index.remove(lesson_id)
+            self._last_deletion = sequence
+        if deletions:
+            logger.info(f"Removed {len(deletions)} deleted lessons from the topic similarity index")
+
+        self._revision = revision
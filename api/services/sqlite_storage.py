@@ -0,0 +1,559 @@
+from typing import List, Optional, Dict, Sequence, Tuple, Any
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from api.models.lesson import (
+    Lesson,
+    LessonCreate,
+    LessonSearchHit,
+    LessonSearchResults,
+    LessonSegment,
+    LessonSummary,
+    QuizQuestion
+)
+from api.services.search import HIGHLIGHT_END, HIGHLIGHT_START, SearchIndex, quiz_text, tokenize
+from api.services.storage import SEGMENT_SEPARATOR, VersionConflict, example_lessons
+
+logger = logging.getLogger("api.services.sqlite_storage")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    grade_level TEXT NOT NULL,
+    lesson_style TEXT,
+    content TEXT NOT NULL,
+    read_time INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    include_quiz INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS quiz_questions (
+    lesson_id INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    options TEXT NOT NULL,
+    correct_answer INTEGER NOT NULL,
+    PRIMARY KEY (lesson_id, position)
+);
+CREATE TABLE IF NOT EXISTS lesson_segments (
+    lesson_id INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    read_time INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (lesson_id, position)
+);
+CREATE TABLE IF NOT EXISTS lesson_deletions (
+    sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+    lesson_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storage_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    instance TEXT NOT NULL,
+    revision INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lessons_created_at ON lessons (created_at);
+CREATE INDEX IF NOT EXISTS idx_lessons_grade_level ON lessons (grade_level);
+CREATE INDEX IF NOT EXISTS idx_lessons_topic ON lessons (topic);
+"""
+
+# Full-text index over topic, content (all segments) and quiz text, keyed by lesson id
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts"
+    " USING fts5(topic, content, quiz, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+# Statements are kept as constants so sqlite3's per-connection statement
+# cache reuses the prepared form on every call
+SELECT_LESSONS = (
+    "SELECT id, topic, grade_level, lesson_style, content, read_time, created_at, include_quiz FROM lessons"
+)
+SELECT_SUMMARIES = (
+    "SELECT id, topic, grade_level, lesson_style, read_time, created_at, include_quiz FROM lessons"
+)
+SELECT_LESSON = SELECT_LESSONS + " WHERE id = ?"
+SELECT_ALL_LESSONS = SELECT_LESSONS + " ORDER BY id"
+SELECT_QUIZ = (
+    "SELECT lesson_id, question, options, correct_answer FROM quiz_questions"
+    " WHERE lesson_id = ? ORDER BY position"
+)
+SELECT_ALL_QUIZZES = (
+    "SELECT lesson_id, question, options, correct_answer FROM quiz_questions ORDER BY lesson_id, position"
+)
+SELECT_QUIZZES_FOR = (
+    "SELECT lesson_id, question, options, correct_answer FROM quiz_questions"
+    " WHERE lesson_id IN ({placeholders}) ORDER BY lesson_id, position"
+)
+INSERT_LESSON = (
+    "INSERT INTO lessons (topic, grade_level, lesson_style, content, read_time, created_at, include_quiz)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_QUIZ_QUESTION = (
+    "INSERT INTO quiz_questions (lesson_id, position, question, options, correct_answer) VALUES (?, ?, ?, ?, ?)"
+)
+# lessons.content holds the original text (segment 0); continuations are
+# appended to lesson_segments from position 1 without rewriting it
+SELECT_SEGMENTS = (
+    "SELECT lesson_id, position, content, read_time, created_at FROM lesson_segments"
+    " WHERE lesson_id = ? ORDER BY position"
+)
+SELECT_ALL_SEGMENTS = (
+    "SELECT lesson_id, position, content, read_time, created_at FROM lesson_segments ORDER BY lesson_id, position"
+)
+SELECT_SEGMENTS_FOR = (
+    "SELECT lesson_id, position, content, read_time, created_at FROM lesson_segments"
+    " WHERE lesson_id IN ({placeholders}) ORDER BY lesson_id, position"
+)
+ADD_READ_TIME = "UPDATE lessons SET read_time = read_time + ? WHERE id = ?"
+COUNT_SEGMENTS = "SELECT COUNT(*) FROM lesson_segments WHERE lesson_id = ?"
+INSERT_SEGMENT = (
+    "INSERT INTO lesson_segments (lesson_id, position, content, read_time, created_at)"
+    " SELECT ?, COALESCE(MAX(position), 0) + 1, ?, ?, ? FROM lesson_segments WHERE lesson_id = ?"
+)
+DELETE_LESSON = "DELETE FROM lessons WHERE id = ?"
+COUNT_LESSONS = "SELECT COUNT(*) FROM lessons"
+INSERT_DELETION = "INSERT INTO lesson_deletions (lesson_id) VALUES (?)"
+SELECT_DELETIONS = "SELECT sequence, lesson_id FROM lesson_deletions WHERE sequence > ? ORDER BY sequence"
+SELECT_LAST_DELETION = "SELECT COALESCE(MAX(sequence), 0) FROM lesson_deletions"
+# A single row shared by every process using the database
+INIT_META = "INSERT OR IGNORE INTO storage_meta (id, instance, revision) VALUES (1, ?, 0)"
+SELECT_REVISION = "SELECT instance, revision FROM storage_meta WHERE id = 1"
+BUMP_REVISION = "UPDATE storage_meta SET revision = revision + 1 WHERE id = 1"
+INSERT_FTS = "INSERT INTO lessons_fts (rowid, topic, content, quiz) VALUES (?, ?, ?, ?)"
+APPEND_FTS = "UPDATE lessons_fts SET content = content || ? WHERE rowid = ?"
+DELETE_FTS = "DELETE FROM lessons_fts WHERE rowid = ?"
+COUNT_FTS = "SELECT COUNT(*) FROM lessons_fts"
+# Column weights follow SearchIndex: topic matches count three times as much
+SEARCH_RANK = f"bm25(lessons_fts, {float(SearchIndex.TOPIC_WEIGHT)}, 1.0, 1.0)"
+SEARCH_LESSONS = (
+    "SELECT l.id, l.topic, l.grade_level, l.lesson_style, l.read_time, l.created_at, l.include_quiz,"
+    f" -{SEARCH_RANK}, snippet(lessons_fts, -1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 24)"
+    " FROM lessons_fts JOIN lessons l ON l.id = lessons_fts.rowid"
+    f" WHERE lessons_fts MATCH ? ORDER BY {SEARCH_RANK}, l.id LIMIT ? OFFSET ?"
+)
+COUNT_SEARCH = "SELECT COUNT(*) FROM lessons_fts WHERE lessons_fts MATCH ?"
+
+class SQLiteLessonStorage:
+    """
+    Persistent lesson storage backed by SQLite in WAL mode
+
+    IDs come from AUTOINCREMENT and every write runs in a BEGIN IMMEDIATE
+    transaction, so IDs are unique and continuations are serialized even
+    across worker processes sharing the database. Reads spanning several
+    statements run in one read transaction, so they see a single state.
+    """
+
+    # Calls wait on disk and locks, so async callers run them in a thread
+    blocking = True
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the lessons database
+
+        Each thread gets its own connection; WAL mode lets several worker
+        processes read while one of them writes.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        conn.execute(INIT_META, (uuid.uuid4().hex[:8],))
+        self.fts = self._create_search_index(conn)
+        self._seed_if_empty()
+        logger.info(f"Using SQLite lesson storage at {path}")
+
+    def get_all_lessons(self) -> List[Lesson]:
+        """Get all lessons"""
+        with self._snapshot() as conn:
+            quizzes: Dict[int, List[QuizQuestion]] = {}
+            for row in conn.execute(SELECT_ALL_QUIZZES):
+                quizzes.setdefault(row[0], []).append(self._row_to_question(row))
+            segments: Dict[int, List[tuple]] = {}
+            for row in conn.execute(SELECT_ALL_SEGMENTS):
+                segments.setdefault(row[0], []).append(row)
+            return [
+                self._row_to_lesson(row, quizzes.get(row[0]), segments.get(row[0], ()))
+                for row in conn.execute(SELECT_ALL_LESSONS)
+            ]
+
+    def list_lessons(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        grade_level: Optional[str] = None,
+        lesson_style: Optional[str] = None
+    ) -> List[Lesson]:
+        """Get a page of lessons ordered by ID (see LessonStorage.list_lessons)"""
+        where, params = self._page_query(limit, after_id, grade_level, lesson_style)
+        with self._snapshot() as conn:
+            rows = conn.execute(SELECT_LESSONS + where, params).fetchall()
+            if not rows:
+                return []
+
+            quizzes: Dict[int, List[QuizQuestion]] = {}
+            ids = [row[0] for row in rows if row[7]]
+            if ids:
+                sql = SELECT_QUIZZES_FOR.format(placeholders=", ".join("?" * len(ids)))
+                for row in conn.execute(sql, ids):
+                    quizzes.setdefault(row[0], []).append(self._row_to_question(row))
+
+            segments: Dict[int, List[tuple]] = {}
+            ids = [row[0] for row in rows]
+            sql = SELECT_SEGMENTS_FOR.format(placeholders=", ".join("?" * len(ids)))
+            for row in conn.execute(sql, ids):
+                segments.setdefault(row[0], []).append(row)
+        return [self._row_to_lesson(row, quizzes.get(row[0]), segments.get(row[0], ())) for row in rows]
+
+    def list_lesson_summaries(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        grade_level: Optional[str] = None,
+        lesson_style: Optional[str] = None
+    ) -> List[LessonSummary]:
+        """Get a page of lesson summaries ordered by ID without reading content or quizzes"""
+        where, params = self._page_query(limit, after_id, grade_level, lesson_style)
+        return [
+            LessonSummary(
+                id=lesson_id,
+                topic=topic,
+                gradeLevel=grade_level,
+                lessonStyle=lesson_style,
+                readTime=read_time,
+                createdAt=datetime.fromisoformat(created_at),
+                includeQuiz=bool(include_quiz)
+            )
+            for lesson_id, topic, grade_level, lesson_style, read_time, created_at, include_quiz
+            in self._connection().execute(SELECT_SUMMARIES + where, params)
+        ]
+
+    def search_lessons(self, query: str, limit: int = 20, offset: int = 0) -> LessonSearchResults:
+        """
+        Full-text search over lesson topics, content and quizzes (see LessonStorage.search_lessons)
+        
+        Raises:
+            RuntimeError: If this SQLite build has no FTS5 support
+        """
+        if not self.fts:
+            raise RuntimeError("Full-text search requires SQLite with the FTS5 extension")
+        
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return LessonSearchResults(query=query, total=0, limit=limit, offset=offset, hits=[])
+        
+        # Quote every term so FTS5 query syntax in user input is matched literally
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._snapshot() as conn:
+            total = conn.execute(COUNT_SEARCH, (match,)).fetchone()[0]
+            rows = conn.execute(SEARCH_LESSONS, (match, limit, offset)).fetchall()
+        hits = [
+            LessonSearchHit(
+                id=lesson_id,
+                topic=topic,
+                gradeLevel=grade_level,
+                lessonStyle=lesson_style,
+                readTime=read_time,
+                createdAt=datetime.fromisoformat(created_at),
+                includeQuiz=bool(include_quiz),
+                score=round(score, 6),
+                snippet=snippet
+            )
+            for lesson_id, topic, grade_level, lesson_style, read_time, created_at, include_quiz, score, snippet
+            in rows
+        ]
+        return LessonSearchResults(query=query, total=total, limit=limit, offset=offset, hits=hits)
+
+    def get_revision(self) -> str:
+        """Get an opaque token that changes whenever any lesson is created, continued or deleted"""
+        instance, revision = self._connection().execute(SELECT_REVISION).fetchone()
+        return f"{instance}-{revision}"
+
+    def count_lessons(self) -> int:
+        """Get the number of stored lessons"""
+        return self._connection().execute(COUNT_LESSONS).fetchone()[0]
+
+    def get_lesson(self, lesson_id: int) -> Optional[Lesson]:
+        """Get a lesson by ID"""
+        # The lesson row, its segments and its quiz must describe the same version
+        with self._snapshot() as conn:
+            row = conn.execute(SELECT_LESSON, (lesson_id,)).fetchone()
+            if not row:
+                return None
+            return self._load_lesson(conn, row)
+
+    def get_segments(self, lesson_id: int) -> Optional[List[LessonSegment]]:
+        """Get the content segments of a lesson in order, or None if it does not exist"""
+        with self._snapshot() as conn:
+            row = conn.execute(SELECT_LESSON, (lesson_id,)).fetchone()
+            if not row:
+                return None
+            return self._row_to_segments(row, conn.execute(SELECT_SEGMENTS, (lesson_id,)).fetchall())
+
+    def get_segment(self, lesson_id: int, index: int) -> Optional[LessonSegment]:
+        """Get one content segment of a lesson, or None if either does not exist"""
+        segments = self.get_segments(lesson_id)
+        if segments is None or not 0 <= index < len(segments):
+            return None
+        return segments[index]
+
+    def create_lesson(self, lesson: LessonCreate) -> Lesson:
+        """Create a new lesson"""
+        with self._transaction() as conn:
+            return self._insert_lesson(conn, lesson)
+
+    def create_lessons(self, lessons: List[LessonCreate]) -> List[Lesson]:
+        """Create several lessons in a single transaction, returning them in the same order"""
+        with self._transaction() as conn:
+            return [self._insert_lesson(conn, lesson) for lesson in lessons]
+
+    def update_lesson(
+        self,
+        lesson_id: int,
+        content: str,
+        read_time_increment: int,
+        expected_version: Optional[int] = None
+    ) -> Optional[Lesson]:
+        """Update a lesson with additional content (see LessonStorage.update_lesson)"""
+        with self._transaction() as conn:
+            if expected_version is not None:
+                # The version is the number of segments: the original text plus the continuations
+                current_version = 1 + conn.execute(COUNT_SEGMENTS, (lesson_id,)).fetchone()[0]
+                if current_version != expected_version and conn.execute(SELECT_LESSON, (lesson_id,)).fetchone():
+                    raise VersionConflict(lesson_id, expected_version, current_version)
+            cursor = conn.execute(ADD_READ_TIME, (read_time_increment, lesson_id))
+            if cursor.rowcount == 0:
+                return None
+            conn.execute(
+                INSERT_SEGMENT,
+                (lesson_id, content, read_time_increment, datetime.now().isoformat(), lesson_id)
+            )
+            if self.fts:
+                conn.execute(APPEND_FTS, (SEGMENT_SEPARATOR + content, lesson_id))
+            conn.execute(BUMP_REVISION)
+            row = conn.execute(SELECT_LESSON, (lesson_id,)).fetchone()
+            return self._load_lesson(conn, row)
+
+    def delete_lesson(self, lesson_id: int) -> bool:
+        """Delete a lesson by ID"""
+        with self._transaction() as conn:
+            cursor = conn.execute(DELETE_LESSON, (lesson_id,))
+            if cursor.rowcount == 0:
+                return False
+            if self.fts:
+                conn.execute(DELETE_FTS, (lesson_id,))
+            conn.execute(INSERT_DELETION, (lesson_id,))
+            conn.execute(BUMP_REVISION)
+            return True
+
+    def register_deletion_consumer(self) -> Tuple[int, int]:
+        """Register a derived index that follows the deletion log (see LessonStorage.register_deletion_consumer)"""
+        # Other processes may follow the same log, so it is never trimmed and consumers need no ID
+        return 0, self._connection().execute(SELECT_LAST_DELETION).fetchone()[0]
+
+    def list_deletions(self, after: int = 0, consumer: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Get the deletions after a sequence number (see LessonStorage.list_deletions)"""
+        return self._connection().execute(SELECT_DELETIONS, (after,)).fetchall()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=128)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _snapshot(self):
+        """Run several reads in one read transaction, so they all see the same committed state"""
+        conn = self._connection()
+        if conn.in_transaction:
+            # Already inside a transaction, which gives the same guarantee
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in a write transaction, taking the write lock up front"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _insert_lesson(self, conn: sqlite3.Connection, lesson: LessonCreate) -> Lesson:
+        """Insert a lesson and its quiz inside an open transaction"""
+        created_at = datetime.now()
+        cursor = conn.execute(
+            INSERT_LESSON,
+            (
+                lesson.topic,
+                lesson.gradeLevel,
+                lesson.lessonStyle,
+                lesson.content,
+                lesson.readTime,
+                created_at.isoformat(),
+                int(lesson.includeQuiz),
+            ),
+        )
+        lesson_id = cursor.lastrowid
+        if self.fts:
+            conn.execute(INSERT_FTS, (lesson_id, lesson.topic, lesson.content, quiz_text(lesson.quiz)))
+        conn.execute(BUMP_REVISION)
+        if lesson.quiz:
+            conn.executemany(
+                INSERT_QUIZ_QUESTION,
+                [
+                    (lesson_id, position, q.question, json.dumps(q.options), q.correctAnswer)
+                    for position, q in enumerate(lesson.quiz)
+                ],
+            )
+
+        return Lesson(
+            id=lesson_id,
+            topic=lesson.topic,
+            gradeLevel=lesson.gradeLevel,
+            lessonStyle=lesson.lessonStyle,
+            content=lesson.content,
+            readTime=lesson.readTime,
+            createdAt=created_at,
+            includeQuiz=lesson.includeQuiz,
+            quiz=lesson.quiz
+        )
+
+    @staticmethod
+    def _page_query(
+        limit: Optional[int],
+        after_id: Optional[int],
+        grade_level: Optional[str],
+        lesson_style: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """Build the WHERE/ORDER/LIMIT clause for a keyset-paginated listing"""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if after_id is not None:
+            clauses.append("id > ?")
+            params.append(after_id)
+        if grade_level is not None:
+            clauses.append("grade_level = ?")
+            params.append(grade_level)
+        if lesson_style is not None:
+            clauses.append("lesson_style = ?")
+            params.append(lesson_style)
+
+        sql = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params
+
+    def _load_lesson(self, conn: sqlite3.Connection, row: tuple) -> Lesson:
+        """Load the quiz and continuation segments of a lesson row"""
+        lesson_id = row[0]
+        return self._row_to_lesson(
+            row,
+            self._load_quiz(conn, lesson_id),
+            conn.execute(SELECT_SEGMENTS, (lesson_id,)).fetchall()
+        )
+
+    def _load_quiz(self, conn: sqlite3.Connection, lesson_id: int) -> Optional[List[QuizQuestion]]:
+        """Load the quiz questions of a lesson"""
+        quiz = [self._row_to_question(row) for row in conn.execute(SELECT_QUIZ, (lesson_id,))]
+        return quiz or None
+
+    def _create_search_index(self, conn: sqlite3.Connection) -> bool:
+        """Create the FTS5 index, filling it from existing lessons; False if FTS5 is unavailable"""
+        try:
+            conn.execute(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite FTS5 is not available, lesson search is disabled: {str(e)}")
+            return False
+        
+        with self._transaction():
+            if conn.execute(COUNT_FTS).fetchone()[0] == 0:
+                # Databases created before the index existed
+                lessons = self.get_all_lessons()
+                conn.executemany(
+                    INSERT_FTS,
+                    [(lesson.id, lesson.topic, lesson.content, quiz_text(lesson.quiz)) for lesson in lessons]
+                )
+                if lessons:
+                    logger.info(f"Indexed {len(lessons)} existing lessons for search")
+        return True
+
+    def _seed_if_empty(self) -> None:
+        """Add the example lessons the first time the database is created"""
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM lessons LIMIT 1").fetchone():
+                return
+            for lesson in example_lessons():
+                self._insert_lesson(conn, lesson)
+
+    @staticmethod
+    def _row_to_question(row: tuple) -> QuizQuestion:
+        _, question, options, correct_answer = row
+        return QuizQuestion(question=question, options=json.loads(options), correctAnswer=correct_answer)
+
+    @staticmethod
+    def _row_to_segments(row: tuple, segment_rows: Sequence[tuple]) -> List[LessonSegment]:
+        """Build the segment list from a lesson row (segment 0) and its continuation rows"""
+        continuations = [
+            LessonSegment(
+                index=position,
+                content=content,
+                readTime=read_time,
+                createdAt=datetime.fromisoformat(created_at)
+            )
+            for _, position, content, read_time, created_at in segment_rows
+        ]
+        # lessons.read_time is the running total, so the original text gets the remainder
+        first = LessonSegment(
+            index=0,
+            content=row[4],
+            readTime=row[5] - sum(segment.readTime for segment in continuations),
+            createdAt=datetime.fromisoformat(row[6])
+        )
+        return [first] + continuations
+
+    @staticmethod
+    def _row_to_lesson(
+        row: tuple,
+        quiz: Optional[List[QuizQuestion]],
+        segment_rows: Sequence[tuple] = ()
+    ) -> Lesson:
+        lesson_id, topic, grade_level, lesson_style, content, read_time, created_at, include_quiz = row
+        if segment_rows:
+            content = SEGMENT_SEPARATOR.join([content] + [segment[2] for segment in segment_rows])
+        return Lesson(
+            id=lesson_id,
+            topic=topic,
+            gradeLevel=grade_level,
+            lessonStyle=lesson_style,
+            content=content,
+            readTime=read_time,
+            createdAt=datetime.fromisoformat(created_at),
+            includeQuiz=bool(include_quiz),
+            quiz=quiz,
+            version=1 + len(segment_rows)
+        )
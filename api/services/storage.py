@@ -1,90 +1,414 @@
-from typing import List, Optional, Dict
+from typing import Deque, List, Optional, Dict, Iterator, Tuple
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import count, islice
 import logging
+import threading
+import uuid
 from datetime import datetime
 
-from api.models.lesson import Lesson, LessonCreate, QuizQuestion
+from api.models.lesson import (
+    Lesson,
+    LessonCreate,
+    LessonSearchHit,
+    LessonSearchResults,
+    LessonSegment,
+    LessonSummary,
+    QuizQuestion
+)
+from api.services.search import SearchIndex, make_snippet, quiz_text, tokenize
 
 logger = logging.getLogger("api.services.storage")
 
+# Separator placed between segments when the lesson content is joined
+SEGMENT_SEPARATOR = "\n\n"
+
+class VersionConflict(Exception):
+    """Raised when a lesson was changed after the version an update was based on"""
+
+    def __init__(self, lesson_id: int, expected_version: int, current_version: int):
+        super().__init__(
+            f"Lesson {lesson_id} was changed concurrently: expected version "
+            f"{expected_version}, found {current_version}"
+        )
+        self.lesson_id = lesson_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+class LessonRecord:
+    """
+    A stored lesson: its metadata and an ordered list of immutable content segments
+
+    Continuations are appended as new segments instead of rebuilding the
+    lesson. The joined Lesson is materialized the first time it is read;
+    an append then extends the cached copy with the new segment rather
+    than joining every segment again on the next read.
+    """
+
+    __slots__ = (
+        "id", "topic", "gradeLevel", "lessonStyle", "createdAt",
+        "includeQuiz", "quiz", "readTime", "segments", "_lesson"
+    )
+
+    def __init__(self, lesson_id: int, lesson: LessonCreate, created_at: datetime):
+        self.id = lesson_id
+        self.topic = lesson.topic
+        self.gradeLevel = lesson.gradeLevel
+        self.lessonStyle = lesson.lessonStyle
+        self.createdAt = created_at
+        self.includeQuiz = lesson.includeQuiz
+        self.quiz = lesson.quiz
+        self.readTime = lesson.readTime
+        self.segments: List[LessonSegment] = [
+            LessonSegment(index=0, content=lesson.content, readTime=lesson.readTime, createdAt=created_at)
+        ]
+        self._lesson: Optional[Lesson] = None
+
+    def append(self, content: str, read_time: int) -> LessonSegment:
+        """Append a continuation segment"""
+        segment = LessonSegment(
+            index=len(self.segments),
+            content=content,
+            readTime=read_time,
+            createdAt=datetime.now()
+        )
+        self.segments.append(segment)
+        self.readTime += read_time
+        if self._lesson is not None:
+            # Lessons handed out earlier stay unchanged; only the new copy carries the segment
+            self._lesson = self._lesson.model_copy(update={
+                "content": self._lesson.content + SEGMENT_SEPARATOR + content,
+                "readTime": self.readTime,
+                "version": len(self.segments)
+            })
+        return segment
+
+    @property
+    def lesson(self) -> Lesson:
+        """The lesson with all segments joined, materialized on first access"""
+        if self._lesson is None:
+            self._lesson = Lesson(
+                id=self.id,
+                topic=self.topic,
+                gradeLevel=self.gradeLevel,
+                lessonStyle=self.lessonStyle,
+                content=SEGMENT_SEPARATOR.join(segment.content for segment in self.segments),
+                readTime=self.readTime,
+                createdAt=self.createdAt,
+                includeQuiz=self.includeQuiz,
+                quiz=self.quiz,
+                version=len(self.segments)
+            )
+        return self._lesson
+
+    def summary(self) -> LessonSummary:
+        """The lesson summary, without joining the content"""
+        return LessonSummary(
+            id=self.id,
+            topic=self.topic,
+            gradeLevel=self.gradeLevel,
+            lessonStyle=self.lessonStyle,
+            readTime=self.readTime,
+            createdAt=self.createdAt,
+            includeQuiz=self.includeQuiz
+        )
+
 class LessonStorage:
-    """In-memory storage for lessons"""
+    """
+    In-memory storage for lessons
+    
+    Safe to call from several threads: writes and reads that walk the
+    lessons hold a re-entrant lock, and IDs come from an atomic counter.
+    The lessons live in one process, so running several server workers
+    needs the SQLite backend.
+    """
+    
+    # Calls only touch memory, so there is nothing to gain from running them in a thread,
+    # except searches: BM25 ranking visits every lesson matching the query
+    blocking = False
+    blocking_search = True
     
     def __init__(self):
-        """Initialize the storage with an empty lessons dictionary and counter"""
-        self.lessons: Dict[int, Lesson] = {}
-        self.counter: int = 1
+        """Initialize the storage with an empty lessons dictionary and ID allocator"""
+        self.lessons: Dict[int, LessonRecord] = {}
+        # The stored IDs in increasing order, so a keyset cursor is found by bisection
+        self._order: List[int] = []
+        # IDs of deleted lessons not yet seen by every deletion consumer, in deletion
+        # order; the sequence number is the position + 1 after the trimmed ones
+        self.deletions: Deque[int] = deque()
+        self._deletions_trimmed = 0
+        # Registered consumer -> sequence number of the last deletion it has applied
+        self._deletion_acks: Dict[int, int] = {}
+        self._consumer_ids = count(1)
+        self._ids = count(1)
+        self._lock = threading.RLock()
+        # Changes on every write; the instance token keeps revisions of a
+        # restarted process from colliding with earlier ones
+        self.instance = uuid.uuid4().hex[:8]
+        self.revision: int = 0
+        self.search_index = SearchIndex()
         self._add_example_lessons()
         
     def get_all_lessons(self) -> List[Lesson]:
         """Get all lessons"""
-        return list(self.lessons.values())
+        with self._lock:
+            return [record.lesson for record in self.lessons.values()]
+    
+    def list_lessons(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        grade_level: Optional[str] = None,
+        lesson_style: Optional[str] = None
+    ) -> List[Lesson]:
+        """
+        Get a page of lessons ordered by ID
+        
+        Args:
+            limit: Maximum number of lessons to return
+            after_id: Only return lessons with an ID greater than this (keyset cursor)
+            grade_level: Only return lessons for this grade level
+            lesson_style: Only return lessons in this style
+            
+        Returns:
+            The matching lessons
+        """
+        with self._lock:
+            return [
+                record.lesson
+                for record in islice(self._iter_records(after_id, grade_level, lesson_style), limit)
+            ]
+    
+    def list_lesson_summaries(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        grade_level: Optional[str] = None,
+        lesson_style: Optional[str] = None
+    ) -> List[LessonSummary]:
+        """Get a page of lesson summaries ordered by ID (see list_lessons)"""
+        with self._lock:
+            return [
+                record.summary()
+                for record in islice(self._iter_records(after_id, grade_level, lesson_style), limit)
+            ]
+    
+    def search_lessons(self, query: str, limit: int = 20, offset: int = 0) -> LessonSearchResults:
+        """
+        Full-text search over lesson topics, content and quizzes
+        
+        Args:
+            query: The search query; lessons matching any term are ranked by BM25
+            limit: Maximum number of hits to return
+            offset: Number of top hits to skip
+            
+        Returns:
+            The page of hits (with highlighted snippets) and the number of
+            lessons containing any query term
+        """
+        terms = set(tokenize(query))
+        # Ranked without the storage lock (the index has its own), so reads are not held up
+        total, ranked = self.search_index.search(query, limit, offset)
+        with self._lock:
+            # Lessons deleted while ranking are left out
+            matches = [
+                (self.lessons[lesson_id], score) for lesson_id, score in ranked if lesson_id in self.lessons
+            ]
+        hits = [
+            LessonSearchHit(
+                **record.summary().model_dump(),
+                score=round(score, 6),
+                snippet=make_snippet(self._snippet_source(record, terms), terms)
+            )
+            for record, score in matches
+        ]
+        return LessonSearchResults(query=query, total=total, limit=limit, offset=offset, hits=hits)
+    
+    def get_revision(self) -> str:
+        """Get an opaque token that changes whenever any lesson is created, continued or deleted"""
+        return f"{self.instance}-{self.revision}"
+    
+    def count_lessons(self) -> int:
+        """Get the number of stored lessons"""
+        return len(self.lessons)
     
     def get_lesson(self, lesson_id: int) -> Optional[Lesson]:
         """Get a lesson by ID"""
-        return self.lessons.get(lesson_id)
+        with self._lock:
+            record = self.lessons.get(lesson_id)
+            return record.lesson if record else None
+    
+    def get_segments(self, lesson_id: int) -> Optional[List[LessonSegment]]:
+        """Get the content segments of a lesson in order, or None if it does not exist"""
+        with self._lock:
+            record = self.lessons.get(lesson_id)
+            return list(record.segments) if record else None
+    
+    def get_segment(self, lesson_id: int, index: int) -> Optional[LessonSegment]:
+        """Get one content segment of a lesson, or None if either does not exist"""
+        with self._lock:
+            record = self.lessons.get(lesson_id)
+            if not record or not 0 <= index < len(record.segments):
+                return None
+            return record.segments[index]
     
     def create_lesson(self, lesson: LessonCreate) -> Lesson:
         """Create a new lesson"""
-        lesson_id = self.counter
-        self.counter += 1
+        with self._lock:
+            created = self._add_record(lesson)
+            self.revision += 1
         
-        # Create new lesson
-        new_lesson = Lesson(
-            id=lesson_id,
-            topic=lesson.topic,
-            gradeLevel=lesson.gradeLevel,
-            lessonStyle=lesson.lessonStyle,
-            content=lesson.content,
-            readTime=lesson.readTime,
-            createdAt=datetime.now(),
-            includeQuiz=lesson.includeQuiz,
-            quiz=lesson.quiz
-        )
+        return created
+    
+    def create_lessons(self, lessons: List[LessonCreate]) -> List[Lesson]:
+        """Create several lessons as one write, returning them in the same order"""
+        with self._lock:
+            created = [self._add_record(lesson) for lesson in lessons]
+            self.revision += 1
         
-        # Store the lesson
-        self.lessons[lesson_id] = new_lesson
+        return created
+    
+    def update_lesson(
+        self,
+        lesson_id: int,
+        content: str,
+        read_time_increment: int,
+        expected_version: Optional[int] = None
+    ) -> Optional[Lesson]:
+        """
+        Update a lesson with additional content
         
-        return new_lesson
+        Args:
+            lesson_id: The lesson to continue
+            content: The continuation to append
+            read_time_increment: Minutes added to the read time
+            expected_version: If given, the lesson version the continuation was generated from
+            
+        Returns:
+            The updated lesson, or None if it does not exist
+            
+        Raises:
+            VersionConflict: If the lesson is no longer at expected_version
+        """
+        with self._lock:
+            record = self.lessons.get(lesson_id)
+            if not record:
+                return None
+            if expected_version is not None and len(record.segments) != expected_version:
+                raise VersionConflict(lesson_id, expected_version, len(record.segments))
+            
+            # Append the continuation as a new segment
+            record.append(content, read_time_increment)
+            self.search_index.append(lesson_id, content)
+            self.revision += 1
+            
+            return record.lesson
+    
+    def delete_lesson(self, lesson_id: int) -> bool:
+        """Delete a lesson by ID"""
+        with self._lock:
+            if lesson_id in self.lessons:
+                del self.lessons[lesson_id]
+                del self._order[bisect_left(self._order, lesson_id)]
+                if self._deletion_acks:
+                    self.deletions.append(lesson_id)
+                self.search_index.remove(lesson_id)
+                self.revision += 1
+                return True
+            return False
     
-    def update_lesson(self, lesson_id: int, content: str, read_time_increment: int) -> Optional[Lesson]:
-        """Update a lesson with additional content"""
-        existing_lesson = self.get_lesson(lesson_id)
-        if not existing_lesson:
-            return None
+    def register_deletion_consumer(self) -> Tuple[int, int]:
+        """
+        Register a derived index that follows the deletion log
         
-        # Update the lesson
-        updated_lesson = Lesson(
-            id=existing_lesson.id,
-            topic=existing_lesson.topic,
-            gradeLevel=existing_lesson.gradeLevel,
-            lessonStyle=existing_lesson.lessonStyle,
-            content=existing_lesson.content + "\n\n" + content,
-            readTime=existing_lesson.readTime + read_time_increment,
-            createdAt=existing_lesson.createdAt,
-            includeQuiz=existing_lesson.includeQuiz,
-            quiz=existing_lesson.quiz
-        )
+        Deletions are only logged while a consumer is registered, and kept
+        until every consumer has acknowledged them through list_deletions.
         
-        # Store the updated lesson
-        self.lessons[lesson_id] = updated_lesson
+        Returns:
+            A tuple of (consumer ID, sequence number to read deletions after)
+        """
+        with self._lock:
+            consumer = next(self._consumer_ids)
+            self._deletion_acks[consumer] = self._deletions_trimmed + len(self.deletions)
+            return consumer, self._deletion_acks[consumer]
+    
+    def list_deletions(self, after: int = 0, consumer: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Get the deletions after a sequence number, so derived indexes can drop lessons incrementally
         
-        return updated_lesson
+        Args:
+            after: The sequence number of the last deletion already seen
+            consumer: The registered consumer reading; acknowledges the deletions up to `after`
+            
+        Returns:
+            [(sequence, lesson_id)] in deletion order
+        """
+        with self._lock:
+            if consumer is not None:
+                self._deletion_acks[consumer] = after
+                # Drop the deletions every consumer has applied
+                for _ in range(min(self._deletion_acks.values()) - self._deletions_trimmed):
+                    self.deletions.popleft()
+                    self._deletions_trimmed += 1
+            start = max(after - self._deletions_trimmed, 0)
+            return [
+                (sequence, lesson_id)
+                for sequence, lesson_id in enumerate(
+                    islice(self.deletions, start, None), start=self._deletions_trimmed + start + 1
+                )
+            ]
     
-    def delete_lesson(self, lesson_id: int) -> bool:
-        """Delete a lesson by ID"""
-        if lesson_id in self.lessons:
-            del self.lessons[lesson_id]
-            return True
-        return False
+    def _add_record(self, lesson: LessonCreate) -> Lesson:
+        """Store a lesson under the next ID and index it (the caller holds the lock)"""
+        lesson_id = next(self._ids)
+        
+        record = LessonRecord(lesson_id, lesson, datetime.now())
+        self.lessons[lesson_id] = record
+        # IDs only grow, so appending keeps the order sorted
+        self._order.append(lesson_id)
+        self.search_index.add(lesson_id, lesson.topic, lesson.content, lesson.quiz)
+        
+        return record.lesson
+    
+    def _iter_records(
+        self,
+        after_id: Optional[int],
+        grade_level: Optional[str],
+        lesson_style: Optional[str]
+    ) -> Iterator[LessonRecord]:
+        """Iterate lesson records in ID order from the cursor, applying the filters (the caller holds the lock)"""
+        order = self._order
+        start = bisect_right(order, after_id) if after_id is not None else 0
+        for position in range(start, len(order)):
+            record = self.lessons[order[position]]
+            if grade_level is not None and record.gradeLevel != grade_level:
+                continue
+            if lesson_style is not None and record.lessonStyle != lesson_style:
+                continue
+            yield record
+    
+    @staticmethod
+    def _snippet_source(record: LessonRecord, terms: set) -> str:
+        """Pick the first segment (or the quiz) mentioning a query term"""
+        for text in [segment.content for segment in record.segments] + [quiz_text(record.quiz)]:
+            lowered = text.lower()
+            if any(term in lowered for term in terms):
+                return text
+        return record.segments[0].content
     
     def _add_example_lessons(self):
         """Add example lessons for development/demo purposes"""
-        example_lessons = [
-            LessonCreate(
-                topic="Introduction to Photosynthesis",
-                gradeLevel="middle_school",
-                lessonStyle="interactive",
-                content="""# Introduction to Photosynthesis
+        for lesson in example_lessons():
+            self.create_lesson(lesson)
+
+def example_lessons() -> List[LessonCreate]:
+    """Example lessons used to seed empty stores for development/demo purposes"""
+    return [
+        LessonCreate(
+            topic="Introduction to Photosynthesis",
+            gradeLevel="middle_school",
+            lessonStyle="interactive",
+            content="""# Introduction to Photosynthesis
 
 Photosynthesis is the process by which plants, algae, and some bacteria convert light energy, usually from the sun, into chemical energy in the form of glucose or other sugars.
 
@@ -118,31 +442,31 @@ Photosynthesis occurs in two main stages:
 ## Fun Fact
 
 Did you know that the oxygen we breathe today was likely produced by photosynthetic organisms like plants and algae? That's why conserving forests and oceans is so important for our planet!""",
-                readTime=5,
-                includeQuiz=True,
-                quiz=[
-                    QuizQuestion(
-                        question="What is the primary pigment in plants that captures light energy?",
-                        options=["Melanin", "Chlorophyll", "Hemoglobin", "Carotene"],
-                        correctAnswer=1
-                    ),
-                    QuizQuestion(
-                        question="Which gas is produced during photosynthesis?",
-                        options=["Carbon Dioxide", "Nitrogen", "Oxygen", "Hydrogen"],
-                        correctAnswer=2
-                    ),
-                    QuizQuestion(
-                        question="Where does the light-independent reaction take place in the chloroplast?",
-                        options=["Thylakoid membrane", "Cell wall", "Stroma", "Mitochondria"],
-                        correctAnswer=2
-                    )
-                ]
-            ),
-            LessonCreate(
-                topic="Introduction to Fractions",
-                gradeLevel="elementary",
-                lessonStyle="visual",
-                content="""# Introduction to Fractions
+            readTime=5,
+            includeQuiz=True,
+            quiz=[
+                QuizQuestion(
+                    question="What is the primary pigment in plants that captures light energy?",
+                    options=["Melanin", "Chlorophyll", "Hemoglobin", "Carotene"],
+                    correctAnswer=1
+                ),
+                QuizQuestion(
+                    question="Which gas is produced during photosynthesis?",
+                    options=["Carbon Dioxide", "Nitrogen", "Oxygen", "Hydrogen"],
+                    correctAnswer=2
+                ),
+                QuizQuestion(
+                    question="Where does the light-independent reaction take place in the chloroplast?",
+                    options=["Thylakoid membrane", "Cell wall", "Stroma", "Mitochondria"],
+                    correctAnswer=2
+                )
+            ]
+        ),
+        LessonCreate(
+            topic="Introduction to Fractions",
+            gradeLevel="elementary",
+            lessonStyle="visual",
+            content="""# Introduction to Fractions
 
 Fractions are a way of representing parts of a whole. They are very useful in everyday life!
 
@@ -189,27 +513,24 @@ We use fractions every day! Some examples include:
 ## Remember!
 
 The denominator cannot be zero because you cannot divide something into zero parts.""",
-                readTime=4,
-                includeQuiz=True,
-                quiz=[
-                    QuizQuestion(
-                        question="In the fraction 5/8, what is the denominator?",
-                        options=["5", "8", "13", "40"],
-                        correctAnswer=1
-                    ),
-                    QuizQuestion(
-                        question="Which of these is an improper fraction?",
-                        options=["3/4", "2/5", "7/6", "1/2"],
-                        correctAnswer=2
-                    ),
-                    QuizQuestion(
-                        question="Which fraction is equivalent to 1/2?",
-                        options=["2/5", "3/5", "2/6", "3/6"],
-                        correctAnswer=3
-                    )
-                ]
-            )
-        ]
-        
-        for lesson in example_lessons:
-            self.create_lesson(lesson)
\ No newline at end of file
+            readTime=4,
+            includeQuiz=True,
+            quiz=[
+                QuizQuestion(
+                    question="In the fraction 5/8, what is the denominator?",
+                    options=["5", "8", "13", "40"],
+                    correctAnswer=1
+                ),
+                QuizQuestion(
+                    question="Which of these is an improper fraction?",
+                    options=["3/4", "2/5", "7/6", "1/2"],
+                    correctAnswer=2
+                ),
+                QuizQuestion(
+                    question="Which fraction is equivalent to 1/2?",
+                    options=["2/5", "3/5", "2/6", "3/6"],
+                    correctAnswer=3
+                )
+            ]
+        )
+    ]
@@ -0,0 +1,71 @@
+"""
+Compare two benchmark result files and flag regressions
+
+    python -m benchmarks.compare benchmarks/results/baseline.json benchmarks/results/latest.json
+
+An endpoint regresses when a latency percentile grows, or its throughput
+drops, by more than the tolerance. Exits with status 1 if anything
+regressed, so it can gate a release.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+LATENCY_FIELDS = ("p50_ms", "p95_ms", "p99_ms")
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float
+) -> Tuple[List[str], List[str]]:
+    """
+    Compare the per-endpoint results of two reports
+
+    Returns:
+        A tuple of (report lines, regression descriptions)
+    """
+    lines: List[str] = []
+    regressions: List[str] = []
+    for backend, endpoints in current["results"].items():
+        base_endpoints = baseline["results"].get(backend, {})
+        for endpoint, stats in endpoints.items():
+            base = base_endpoints.get(endpoint)
+            if not isinstance(stats, dict) or not isinstance(base, dict) or "p50_ms" not in stats or "p50_ms" not in base:
+                continue
+            changes = []
+            for field in LATENCY_FIELDS:
+                before, after = base[field], stats[field]
+                change = (after - before) / before if before else 0.0
+                changes.append(f"{field[:-3]} {before:.1f}->{after:.1f}ms ({change:+.0%})")
+                if change > tolerance:
+                    regressions.append(f"{backend}/{endpoint} {field} {before:.1f} -> {after:.1f} ms ({change:+.0%})")
+            before, after = base["throughput"], stats["throughput"]
+            change = (after - before) / before if before else 0.0
+            changes.append(f"rps {before:.1f}->{after:.1f} ({change:+.0%})")
+            if change < -tolerance:
+                regressions.append(f"{backend}/{endpoint} throughput {before:.1f} -> {after:.1f} rps ({change:+.0%})")
+            lines.append(f"{backend:<8} {endpoint:<20} " + "  ".join(changes))
+    return lines, regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown before flagging a regression (default 0.2)")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    current = json.loads(args.current.read_text())
+    lines, regressions = compare(baseline, current, args.tolerance)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        print("\n".join(f"  {regression}" for regression in regressions))
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Fake OpenRouter-compatible chat-completions server for offline benchmarks
+
+Answers /api/v1/chat/completions (plain and streaming) with lesson or
+continuation JSON shaped like the prompts ask for, after a configurable
+latency. Run it standalone and point the API at it with
+OPENROUTER_BASE_URL:
+
+    python -m benchmarks.fake_openrouter --port 8100 --latency-median 0.8 --tokens-per-second 150
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOPIC_PATTERN = re.compile(r"^Topic:\s*(.+)$", re.MULTILINE)
+
+WORDS = (
+    "energy system process example model pattern structure change measure observe compare "
+    "result cause effect evidence question method data idea concept principle force cycle "
+    "growth balance signal value function number shape surface layer source material"
+).split()
+
+@dataclass
+class FakeUpstreamConfig:
+    """
+    Behaviour of the fake upstream
+
+    Latency before the first token is log-normal around latency_median (a
+    sigma of 0 makes it constant); after that tokens are produced at
+    tokens_per_second (0 sends the whole completion at once).
+    """
+    latency_median: float = 0.5
+    latency_sigma: float = 0.5
+    tokens_per_second: float = 200.0
+    # Share of requests answered with one of error_statuses instead of a completion
+    error_rate: float = 0.0
+    error_statuses: List[int] = field(default_factory=lambda: [429, 500, 503])
+    # Approximate size of a generated lesson and of a continuation
+    lesson_words: int = 600
+    continuation_words: int = 300
+    # Characters per streamed delta (about 4 characters per token)
+    chunk_chars: int = 24
+    seed: int = 0
+
+    def first_token_delay(self, rng: random.Random) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_median
+        return rng.lognormvariate(0.0, self.latency_sigma) * self.latency_median
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _paragraphs(rng: random.Random, topic: str, words: int) -> str:
+    sections = []
+    written = 0
+    section = 1
+    while written < words:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            length = rng.randint(8, 16)
+            sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+            sentences.append(f"The {topic.lower()} {sentence}.")
+            written += length + 2
+        sections.append(f"## Part {section}\n\n" + " ".join(sentences))
+        section += 1
+    return "\n\n".join(sections)
+
+def message_text(message: Dict[str, Any]) -> str:
+    """The text of a message, whether its content is a string or a list of parts"""
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "".join(str(part.get("text", "")) for part in content if isinstance(part, dict))
+    return str(content)
+
+def completion_text(messages: List[Dict[str, Any]], config: FakeUpstreamConfig, rng: random.Random) -> str:
+    """Build the JSON answer the prompt asks for: a lesson or a continuation"""
+    request = "\n".join(message_text(message) for message in messages if message.get("role") == "user")
+    match = TOPIC_PATTERN.search(request)
+    topic = match.group(1).strip() if match else "the lesson topic"
+    # The response format is described in the system message
+    prompt = "\n".join(message_text(message) for message in messages)
+
+    if '"continuation"' in prompt:
+        text = _paragraphs(rng, topic, config.continuation_words)
+        return json.dumps({"continuation": text, "readTimeIncrement": max(1, config.continuation_words // 200)})
+
+    lesson = {
+        "title": topic.title(),
+        "content": _paragraphs(rng, topic, config.lesson_words),
+        "readTime": max(1, config.lesson_words // 200)
+    }
+    if '"quiz"' in prompt:
+        lesson["quiz"] = [
+            {
+                "question": f"Question {i + 1} about {topic}?",
+                "options": [f"Option {j + 1}" for j in range(4)],
+                "correctAnswer": rng.randrange(4)
+            }
+            for i in range(3)
+        ]
+    return json.dumps(lesson)
+
+def create_app(config: FakeUpstreamConfig) -> FastAPI:
+    """Create the fake OpenRouter application"""
+    app = FastAPI(title="Fake OpenRouter")
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "streams": 0, "errors": 0}
+
+    # System prompts seen before; a repeated one is reported as a cached prefix
+    prefixes = set()
+
+    def usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+    @app.get("/api/v1/models")
+    async def models():
+        return {"data": [{"id": "fake/model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        delay = config.first_token_delay(rng)
+
+        if rng.random() < config.error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(delay)
+            return JSONResponse(
+                status_code=rng.choice(config.error_statuses),
+                content={"error": {"message": "Injected upstream error"}},
+                headers={"Retry-After": "0"}
+            )
+
+        messages = body.get("messages", [])
+        model = body.get("model", "fake/model")
+        text = completion_text(messages, config, rng)
+        prompt_tokens = estimate_tokens("".join(message_text(m) for m in messages))
+        system = "".join(message_text(m) for m in messages if m.get("role") == "system")
+        cached_tokens = estimate_tokens(system) if system in prefixes else 0
+        prefixes.add(system)
+        completion_tokens = estimate_tokens(text)
+        completion_id = f"gen-{uuid.uuid4().hex[:12]}"
+
+        if not body.get("stream"):
+            generation = completion_tokens / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+            await asyncio.sleep(delay + generation)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage(prompt_tokens, completion_tokens, cached_tokens)
+            }
+
+        stats["streams"] += 1
+
+        async def events() -> AsyncIterator[str]:
+            await asyncio.sleep(delay)
+            for chunk, pause in _chunks(text, config):
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+                if pause:
+                    await asyncio.sleep(pause)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage(prompt_tokens, completion_tokens, cached_tokens)
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def _chunks(text: str, config: FakeUpstreamConfig) -> List[Tuple[str, float]]:
+    """Split a completion into deltas with the pause after each one"""
+    size = max(1, config.chunk_chars)
+    pause = estimate_tokens("x" * size) / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+    return [(text[i:i + size], pause) for i in range(0, len(text), size)]
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the fake upstream options to an argument parser"""
+    defaults = FakeUpstreamConfig()
+    parser.add_argument("--latency-median", type=float, default=defaults.latency_median,
+                        help="Median seconds until the first token")
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma,
+                        help="Log-normal sigma of the first-token latency (0 for constant)")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help="Generation speed after the first token (0 for instant)")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="Share of upstream requests answered with an error status")
+    parser.add_argument("--error-statuses", default=",".join(str(s) for s in defaults.error_statuses),
+                        help="Comma-separated statuses used for injected errors")
+    parser.add_argument("--lesson-words", type=int, default=defaults.lesson_words)
+    parser.add_argument("--continuation-words", type=int, default=defaults.continuation_words)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+def config_from_arguments(args: argparse.Namespace) -> FakeUpstreamConfig:
+    return FakeUpstreamConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",") if s.strip()],
+        lesson_words=args.lesson_words,
+        continuation_words=args.continuation_words,
+        seed=args.seed
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_arguments(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
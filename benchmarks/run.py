@@ -0,0 +1,334 @@
+"""
+Offline load test of the lesson API against the fake OpenRouter server
+
+Starts benchmarks.fake_openrouter and, for every storage backend, a fresh
+uvicorn process serving api.main:app pointed at it. Each endpoint is then
+driven with concurrent requests, and the throughput and latency
+percentiles are written as JSON:
+
+    python -m benchmarks.run --backends memory,sqlite --output benchmarks/results/latest.json
+
+Compare two result files with benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks import fake_openrouter
+
+ROOT = Path(__file__).resolve().parent.parent
+
+GRADE_LEVELS = ["elementary", "middle_school", "high_school", "college"]
+LESSON_STYLES = ["visual", "interactive", "storytelling", "practical"]
+SUBJECTS = [
+    "photosynthesis", "fractions", "volcanoes", "the water cycle", "electric circuits",
+    "ancient rome", "probability", "plate tectonics", "poetry", "the solar system",
+    "chemical bonds", "supply and demand", "genetics", "world war i", "linear equations"
+]
+SEARCH_QUERIES = ["energy", "cycle system", "photosynthesis", "growth balance signal", "volcanoes structure"]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Linearly interpolated percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles (in milliseconds) of one endpoint"""
+    values = sorted(latencies)
+    summary = {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    if values:
+        summary.update({
+            "mean_ms": round(sum(values) / len(values) * 1000, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        })
+    return summary
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(url: str, process: subprocess.Popen, log_path: Path, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    output = log_path.read_text(errors="replace")[-2000:] if log_path.exists() else ""
+    raise RuntimeError(f"Server at {url} did not start:\n{output}")
+
+def start_process(args: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_process(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+class LoadDriver:
+    """Drives one API server and collects per-endpoint latencies"""
+
+    def __init__(self, base_url: str, concurrency: int, seed: int):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(120.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        )
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.lesson_ids: List[int] = []
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._topics = 0
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def lesson_request(self) -> Dict[str, Any]:
+        # A counter in the topic keeps the generation cache from answering
+        self._topics += 1
+        return {
+            "topic": f"{self.rng.choice(SUBJECTS)} {self._topics}",
+            "gradeLevel": self.rng.choice(GRADE_LEVELS),
+            "lessonStyle": self.rng.choice(LESSON_STYLES),
+            "includeQuiz": self.rng.random() < 0.5
+        }
+
+    async def run(self, name: str, count: int, request: Callable[[int], Awaitable[Optional[float]]]) -> None:
+        """
+        Send count requests with bounded concurrency
+
+        request(i) performs request i and returns its latency in seconds, or
+        None if it failed.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies: List[float] = []
+        errors = 0
+
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                try:
+                    latency = await request(i)
+                except httpx.HTTPError:
+                    latency = None
+                if latency is None:
+                    errors += 1
+                else:
+                    latencies.append(latency)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(count)))
+        elapsed = time.perf_counter() - started
+        self.results[name] = summarize(latencies, errors, elapsed)
+        print(f"  {name:<18} {json.dumps(self.results[name])}", file=sys.stderr)
+
+    async def timed(self, method: str, url: str, expect: int = 200, **kwargs) -> Optional[float]:
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        latency = time.perf_counter() - started
+        return latency if response.status_code == expect else None
+
+    async def create(self, _: int) -> Optional[float]:
+        started = time.perf_counter()
+        response = await self.client.post("/api/lessons", json=self.lesson_request())
+        latency = time.perf_counter() - started
+        if response.status_code != 201:
+            return None
+        self.lesson_ids.append(response.json()["id"])
+        return latency
+
+    async def stream(self, first_delta: List[float]) -> Optional[float]:
+        """Time a streamed creation to its final lesson event, recording the first delta separately"""
+        started = time.perf_counter()
+        seen_delta = False
+        async with self.client.stream("POST", "/api/lessons/stream", json=self.lesson_request()) as response:
+            if response.status_code != 200:
+                return None
+            async for line in response.aiter_lines():
+                event = line[len("event:"):].strip() if line.startswith("event:") else None
+                if event == "delta" and not seen_delta:
+                    seen_delta = True
+                    first_delta.append(time.perf_counter() - started)
+                elif event == "lesson":
+                    return time.perf_counter() - started
+                elif event == "error":
+                    return None
+        return None
+
+    async def run_all(self, counts: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+        await self.run("create", counts["create"], self.create)
+        if not self.lesson_ids:
+            raise RuntimeError("No lesson could be created; check the API log")
+
+        first_delta: List[float] = []
+        started = time.perf_counter()
+        await self.run("stream", counts["stream"], lambda i: self.stream(first_delta))
+        self.results["stream_first_delta"] = summarize(first_delta, 0, time.perf_counter() - started)
+
+        await self.run(
+            "continue", counts["continue"],
+            lambda i: self.timed("POST", f"/api/lessons/{self.rng.choice(self.lesson_ids)}/continue", json={})
+        )
+        await self.run(
+            "get", counts["reads"],
+            lambda i: self.timed("GET", f"/api/lessons/{self.rng.choice(self.lesson_ids)}")
+        )
+        await self.run(
+            "get_not_modified", counts["reads"],
+            lambda i: self.revalidate(self.rng.choice(self.lesson_ids))
+        )
+        await self.run(
+            "list_summary", counts["reads"],
+            lambda i: self.timed("GET", "/api/lessons", params={"limit": 50, "view": "summary"})
+        )
+        await self.run(
+            "search", counts["reads"],
+            lambda i: self.timed("GET", "/api/lessons/search", params={"q": self.rng.choice(SEARCH_QUERIES)})
+        )
+        return self.results
+
+    async def revalidate(self, lesson_id: int) -> Optional[float]:
+        response = await self.client.get(f"/api/lessons/{lesson_id}")
+        etag = response.headers.get("etag")
+        if response.status_code != 200 or not etag:
+            return None
+        return await self.timed("GET", f"/api/lessons/{lesson_id}", expect=304, headers={"If-None-Match": etag})
+
+def api_environment(backend: str, fake_url: str, workdir: Path, args: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": str(ROOT),
+        "OPENROUTER_API_KEY": "benchmark",
+        "OPENROUTER_BASE_URL": f"{fake_url}/api/v1",
+        "LESSON_STORAGE_BACKEND": backend,
+        "LESSON_STORAGE_PATH": str(workdir / f"lessons-{backend}.sqlite3"),
+    })
+    if not args.llm_cache:
+        env["LLM_CACHE_BACKEND"] = "none"
+    return env
+
+async def drive(base_url: str, args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    driver = LoadDriver(base_url, args.concurrency, args.seed)
+    try:
+        return await driver.run_all({
+            "create": args.lessons,
+            "stream": args.streams,
+            "continue": args.continues,
+            "reads": args.reads
+        })
+    finally:
+        await driver.aclose()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", default="memory,sqlite", help="Comma-separated storage backends to test")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--lessons", type=int, default=100, help="Lessons created with POST /api/lessons")
+    parser.add_argument("--streams", type=int, default=50, help="Lessons created with POST /api/lessons/stream")
+    parser.add_argument("--continues", type=int, default=50, help="Continuations of random lessons")
+    parser.add_argument("--reads", type=int, default=1000, help="Requests of each read endpoint")
+    parser.add_argument("--llm-cache", action="store_true",
+                        help="Keep the generation cache enabled (disabled by default so every call goes upstream)")
+    parser.add_argument("--label", default="", help="Free-form label stored with the results")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/<timestamp>.json)")
+    fake_openrouter.add_arguments(parser)
+    args = parser.parse_args()
+
+    timestamp = datetime.now(timezone.utc)
+    output = Path(args.output) if args.output else ROOT / "benchmarks" / "results" / f"{timestamp:%Y%m%dT%H%M%SZ}.json"
+    fake_config = fake_openrouter.config_from_arguments(args)
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": timestamp.isoformat(),
+            "label": args.label,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "counts": {"create": args.lessons, "stream": args.streams, "continue": args.continues, "reads": args.reads},
+            "llmCache": args.llm_cache,
+            "upstream": vars(fake_config),
+        },
+        "results": {}
+    }
+
+    with tempfile.TemporaryDirectory(prefix="lesson-bench-") as tmp:
+        workdir = Path(tmp)
+        fake_port = free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        fake_args = [sys.executable, "-m", "benchmarks.fake_openrouter", "--port", str(fake_port)]
+        for name in ("latency_median", "latency_sigma", "tokens_per_second", "error_rate",
+                     "error_statuses", "lesson_words", "continuation_words", "seed"):
+            fake_args += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        fake = start_process(fake_args, dict(os.environ, PYTHONPATH=str(ROOT)), workdir / "fake.log")
+        try:
+            wait_until_ready(f"{fake_url}/api/v1/models", fake, workdir / "fake.log")
+            for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+                print(f"Benchmarking {backend} storage", file=sys.stderr)
+                port = free_port()
+                log_path = workdir / f"api-{backend}.log"
+                api = start_process(
+                    [sys.executable, "-m", "uvicorn", "api.main:app",
+                     "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+                    api_environment(backend, fake_url, workdir, args),
+                    log_path
+                )
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    wait_until_ready(f"{base_url}/api/health", api, log_path)
+                    results = asyncio.run(drive(base_url, args))
+                    results["llm"] = httpx.get(f"{base_url}/api/llm/stats").json()
+                    report["results"][backend] = results
+                finally:
+                    stop_process(api)
+        finally:
+            stop_process(fake)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Wrote {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
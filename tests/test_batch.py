@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.models.lesson import LessonGenerationRequest
+from api.services import generation, lesson_storage, llm_client
+
+def lesson_json(topic: str) -> str:
+    return json.dumps({"title": topic, "content": f"# {topic}\n\nGenerated.", "readTime": 3})
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_batch_streams_each_lesson_as_it_completes(monkeypatch):
+    async def generate(prompt, system_prompt=None, **kwargs):
+        if "Broken topic" in prompt:
+            raise RuntimeError("upstream down")
+        await asyncio.sleep(0.3 if "Slow topic" in prompt else 0)
+        return lesson_json("Slow topic" if "Slow topic" in prompt else "Fast topic")
+
+    monkeypatch.setattr(llm_client, "generate_content", generate)
+    lessons = [
+        {"topic": topic, "gradeLevel": "middle_school"}
+        for topic in ("Slow topic", "Fast topic", "Broken topic")
+    ]
+
+    response = TestClient(app).post("/api/lessons/batch", json={"lessons": lessons})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    items = {data["index"]: data for event, data in events if event == "item"}
+    assert [event for event, _ in events] == ["item", "item", "item", "done"]
+    # Completion order, not request order
+    assert [data["index"] for event, data in events if event == "item"][-1] == 0
+    assert items[2]["error"] == "upstream down"
+    assert items[2].get("lesson") is None
+    for index in (0, 1):
+        stored = lesson_storage.get_lesson(items[index]["lesson"]["id"])
+        assert stored.topic == lessons[index]["topic"]
+    assert events[-1] == ("done", {"succeeded": 2, "failed": 1})
+
+def test_batch_generation_is_bounded_by_its_parallelism(monkeypatch):
+    running = 0
+    peak = 0
+
+    async def generate(prompt, system_prompt=None, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return lesson_json("Topic")
+
+    monkeypatch.setattr(llm_client, "generate_content", generate)
+    requests = [LessonGenerationRequest(topic=f"Batch topic {i}", gradeLevel="high_school") for i in range(7)]
+
+    async def collect():
+        return [item async for item in generation.generate_lessons(requests, parallelism=2)]
+
+    items = asyncio.run(collect())
+
+    assert peak == 2
+    assert sorted(item.index for item in items) == list(range(7))
+    assert len({item.lesson.id for item in items}) == 7
+
+def test_batch_size_is_validated():
+    response = TestClient(app).post("/api/lessons/batch", json={"lessons": []})
+
+    assert response.status_code == 422
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from api.services.llm.cache import (
+    CacheBackend,
+    FileCacheBackend,
+    GenerationCache,
+    SQLiteCacheBackend,
+    generation_key
+)
+
+@pytest.fixture(params=["sqlite", "file"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"))
+    return FileCacheBackend(str(tmp_path / "cache"))
+
+def test_key_ignores_formatting_noise_but_not_parameters():
+    key = generation_key("Explain tides\r\n", "Be brief  ", "model/a", 0.7, 4000)
+
+    assert key == generation_key("Explain tides", "Be brief", "model/a", 0.7, 4000)
+    assert key != generation_key("Explain tides", "Be brief", "model/b", 0.7, 4000)
+    assert key != generation_key("Explain tides", "Be brief", "model/a", 0.2, 4000)
+    assert key != generation_key("Explain tides", "Be brief", "model/a", 0.7, 4000, {"type": "json_object"})
+
+def test_memory_cache_evicts_the_least_recently_used():
+    cache = GenerationCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    cache = GenerationCache(ttl_seconds=60)
+    cache.set("key", "value")
+
+    monkeypatch.setattr(time, "time", lambda real=time.time: real() + 61)
+
+    assert cache.get("key") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_backend_serves_memory_misses(backend):
+    GenerationCache(backend=backend).set("key", "value")
+
+    fresh = GenerationCache(backend=backend)
+
+    assert asyncio.run(fresh.aget("key")) == "value"
+    assert fresh.stats()["hits"] == 1
+    # Kept in memory once read from the backend
+    assert fresh.get("key") == "value"
+
+def test_expired_backend_entries_are_deleted(backend):
+    backend.set("key", "value", time.time() - 120)
+    cache = GenerationCache(ttl_seconds=60, backend=backend)
+
+    assert cache.get("key") is None
+    assert backend.get("key") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_backend_failures_are_misses():
+    class BrokenBackend(CacheBackend):
+        def get(self, key):
+            return "value", 0.0
+
+        def delete(self, key):
+            raise OSError("disk gone")
+
+        def set(self, key, value, stored_at):
+            raise OSError("disk gone")
+
+    cache = GenerationCache(ttl_seconds=60, backend=BrokenBackend())
+    asyncio.run(cache.aset("other", "value"))
+
+    assert asyncio.run(cache.aget("key")) is None
+    assert cache.get("other") == "value"
+
+def test_file_backend_prunes_concurrent_writes(tmp_path):
+    backend = FileCacheBackend(str(tmp_path), max_entries=10)
+    backend.PRUNE_INTERVAL = 20
+    cache = GenerationCache(backend=backend)
+
+    async def write():
+        await asyncio.gather(*(cache.aset(f"key-{i % 30}", "value") for i in range(200)))
+
+    asyncio.run(write())
+
+    assert backend._writes == 200
+    assert len(list(tmp_path.glob("*.json"))) <= 30
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_fallback_answers_are_cached_under_the_answering_model(monkeypatch):
+    from api.services.llm.client import LLMClient, UpstreamError
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_MODELS", "primary/model,fallback/model")
+    monkeypatch.setenv("LLM_CACHE_BACKEND", "memory")
+    client = LLMClient()
+    calls = []
+
+    async def complete(route, data, tokens):
+        calls.append(route.name)
+        if route.name == "primary/model":
+            raise UpstreamError("unavailable")
+        return f"from {route.name}"
+
+    monkeypatch.setattr(client, "_complete", complete)
+
+    async def generate():
+        return [
+            await client.generate_content("Explain tides"),
+            await client.generate_content("Explain tides"),
+            await client.generate_content("Explain tides", model="fallback/model"),
+        ]
+
+    assert asyncio.run(generate()) == ["from fallback/model"] * 3
+    # The primary model is asked again; the request for the fallback model is a cache hit
+    assert calls == ["primary/model", "fallback/model", "primary/model", "fallback/model"]
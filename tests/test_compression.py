@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from api.middleware.compression import CompressionMiddleware
+
+BODY = "The water cycle moves water between the oceans, the air and the land. " * 20
+
+inner = FastAPI()
+
+@inner.get("/lesson")
+def lesson(if_none_match: str = Header(None)):
+    if if_none_match == '"v1"':
+        return Response(status_code=304, headers={"ETag": '"v1"'})
+    return PlainTextResponse(BODY, headers={"ETag": '"v1"'})
+
+@inner.post("/lesson")
+def create_lesson():
+    return PlainTextResponse(BODY, headers={"ETag": '"v1"'})
+
+@inner.get("/short")
+def short():
+    return PlainTextResponse("Too short to compress")
+
+@inner.get("/events")
+def events():
+    def stream():
+        for i in range(3):
+            yield f"data: {i} {BODY}\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@pytest.fixture
+def middleware():
+    return CompressionMiddleware(inner, minimum_size=500)
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip;q=0.5, identity", "gzip"),
+    ("deflate, *;q=0.1", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiates_the_encoding(middleware, accept_encoding, expected):
+    assert middleware._negotiate(accept_encoding) == expected
+
+def test_compresses_large_bodies_and_suffixes_the_etag(middleware):
+    client = TestClient(middleware)
+
+    response = client.get("/lesson", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == '"v1-gzip"'
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.text == BODY
+
+def test_small_bodies_and_identity_requests_are_sent_as_is(middleware):
+    client = TestClient(middleware)
+
+    assert "Content-Encoding" not in client.get("/short", headers={"Accept-Encoding": "gzip"}).headers
+    plain = client.get("/lesson", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["ETag"] == '"v1"'
+
+def test_revalidation_strips_and_restores_the_encoding_suffix(middleware):
+    response = TestClient(middleware).get(
+        "/lesson", headers={"Accept-Encoding": "gzip", "If-None-Match": '"v1-gzip"'}
+    )
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"v1-gzip"'
+
+def test_only_get_responses_are_cached(middleware, monkeypatch):
+    compressions = []
+    compress = middleware.compress
+
+    def counting_compress(body, encoding):
+        compressions.append(encoding)
+        return compress(body, encoding)
+
+    monkeypatch.setattr(middleware, "compress", counting_compress)
+    client = TestClient(middleware)
+
+    for _ in range(3):
+        client.get("/lesson", headers={"Accept-Encoding": "gzip"})
+        client.post("/lesson", headers={"Accept-Encoding": "gzip"})
+
+    assert len(compressions) == 4
+    assert all(key[0] == "/lesson" for key in middleware._cache)
+    assert len(middleware._cache) == 1
+
+def test_streams_are_compressed_chunk_by_chunk(middleware):
+    client = TestClient(middleware)
+
+    with client.stream("GET", "/events", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(raw).decode().count("data: ") == 3
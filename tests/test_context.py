@@ -0,0 +1,53 @@
+from api.services.llm.context import ContinuationContext, split_sections
+from api.services.llm.tokens import estimate_tokens
+
+def lesson(sections: int, paragraph: str = "Rocks change slowly over long periods of time. " * 8) -> str:
+    parts = ["# Geology"]
+    for i in range(sections):
+        parts.append(f"## Part {i}\n\n{paragraph}")
+    return "\n\n".join(parts)
+
+def test_short_lessons_are_sent_verbatim():
+    content = lesson(2)
+
+    assert ContinuationContext(budget_tokens=3000).build(content) == (content, False)
+
+def test_long_lessons_keep_outline_summaries_and_recent_sections():
+    content = lesson(40)
+
+    context, condensed = ContinuationContext(budget_tokens=1000, recent_sections=2).build(content)
+
+    assert condensed
+    assert estimate_tokens(context) <= 1000
+    assert context.startswith("Lesson outline:\n- Geology\n  - Part 0")
+    assert "  - Part 39" in context
+    assert "Summary of earlier sections:" in context
+    assert context.endswith(content.rstrip()[-200:])
+
+def test_outline_survives_when_the_recent_section_alone_is_too_long():
+    content = lesson(3, paragraph="Sediment settles in layers.\n" * 400)
+
+    context, _ = ContinuationContext(budget_tokens=500, recent_sections=1).build(content)
+
+    assert estimate_tokens(context) <= 500
+    assert context.startswith("Lesson outline:\n- Geology")
+    assert context.endswith("Sediment settles in layers.")
+    verbatim = context.split("Most recent sections (verbatim):\n", 1)[1]
+    # Shortened at a line boundary, never mid-line
+    assert all(line == "Sediment settles in layers." for line in verbatim.split("\n"))
+
+def test_outline_is_bounded_by_its_share_of_the_budget():
+    content = "\n\n".join(f"## Heading number {i}\n\nShort text." for i in range(2000))
+
+    context, _ = ContinuationContext(budget_tokens=400).build(content)
+
+    outline = context.split("\n\n", 1)[0]
+    assert estimate_tokens(context) <= 400
+    assert outline.startswith("Lesson outline:\n  - Heading number 0")
+    assert outline.endswith("- ...")
+    assert estimate_tokens(outline) <= 200 + 5
+
+def test_split_sections_ignores_headings_in_code_fences():
+    sections = split_sections("# Title\n\n```\n# not a heading\n```\n\n## Next\n\nText")
+
+    assert [section.title for section in sections] == ["Title", "Next"]
@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.models.lesson import LessonCreate
+from api.services import lesson_storage
+from api.services.http_cache import etag_matches, etag_matches_strong
+
+client = TestClient(app, headers={"Accept-Encoding": "identity"})
+
+def stored_lesson():
+    return lesson_storage.create_lesson(LessonCreate(
+        topic="Seasons", gradeLevel="elementary", content="# Seasons\n\nThe Earth is tilted.", readTime=2
+    ))
+
+def test_if_none_match_uses_the_weak_comparison():
+    etag = '"l1-v2-abc"'
+
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"l1-v1-abc"', etag)
+    assert not etag_matches(None, etag)
+
+def test_lesson_reads_revalidate_with_if_none_match():
+    lesson = stored_lesson()
+
+    first = client.get(f"/api/lessons/{lesson.id}")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    cached = client.get(f"/api/lessons/{lesson.id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+    lesson_storage.update_lesson(lesson.id, "Summer is warm.", 1)
+    changed = client.get(f"/api/lessons/{lesson.id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["version"] == 2
+
+def test_listing_etag_changes_with_any_write():
+    etag = client.get("/api/lessons").headers["ETag"]
+    assert client.get("/api/lessons", headers={"If-None-Match": etag}).status_code == 304
+
+    stored_lesson()
+
+    assert client.get("/api/lessons", headers={"If-None-Match": etag}).status_code == 200
+
+def test_if_match_uses_the_strong_comparison():
+    etag = '"l1-v2-abc"'
+
+    assert etag_matches_strong(f'"other", {etag}', etag)
+    assert etag_matches_strong("*", etag)
+    assert not etag_matches_strong(f"W/{etag}", etag)
+    assert not etag_matches_strong(None, etag)
+
+def test_continue_requires_a_current_strong_if_match():
+    lesson = stored_lesson()
+    etag = client.get(f"/api/lessons/{lesson.id}").headers["ETag"]
+
+    weak = client.post(f"/api/lessons/{lesson.id}/continue", headers={"If-Match": f"W/{etag}"})
+    assert weak.status_code == 412
+    assert weak.headers["ETag"] == etag
+
+    continued = client.post(f"/api/lessons/{lesson.id}/continue", headers={"If-Match": etag})
+    assert continued.status_code == 200
+    assert continued.json()["version"] == 2
+
+    stale = client.post(f"/api/lessons/{lesson.id}/continue", headers={"If-Match": etag})
+    assert stale.status_code == 412
+    assert client.post(f"/api/lessons/{lesson.id}/continue", headers={"If-Match": "*"}).status_code == 200
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.models.lesson import LessonCreate
+from api.services import llm_client, lesson_storage
+
+def wait_for_jobs(client: TestClient, job_ids, timeout: float = 10.0):
+    """Poll the jobs until all of them have finished"""
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = [client.get(f"/api/jobs/{job_id}").json() for job_id in job_ids]
+        if all(job["status"] in ("succeeded", "failed") for job in jobs):
+            return jobs
+        assert time.monotonic() < deadline, f"Jobs did not finish: {jobs}"
+        time.sleep(0.02)
+
+def test_concurrent_continuation_jobs_on_one_lesson_both_append(monkeypatch):
+    async def slow_generation(prompt, system_prompt=None, **kwargs):
+        # Long enough for both jobs to be picked up by different workers
+        await asyncio.sleep(0.2)
+        return json.dumps({"continuation": "More content.", "readTimeIncrement": 1})
+
+    monkeypatch.setattr(llm_client, "generate_content", slow_generation)
+    lesson = lesson_storage.create_lesson(LessonCreate(
+        topic="Tides",
+        gradeLevel="middle_school",
+        content="# Tides\n\nThe moon pulls the oceans.",
+        readTime=1
+    ))
+
+    with TestClient(app) as client:
+        job_ids = [
+            client.post(f"/api/jobs/lessons/{lesson.id}/continue").json()["id"]
+            for _ in range(2)
+        ]
+        jobs = wait_for_jobs(client, job_ids)
+
+    assert [job["status"] for job in jobs] == ["succeeded", "succeeded"]
+    stored = lesson_storage.get_lesson(lesson.id)
+    assert stored.version == 3
+    assert stored.content.count("More content.") == 2
+    assert stored.readTime == 3
+
+def test_continuations_of_one_lesson_do_not_hold_workers_from_other_jobs(monkeypatch):
+    async def slow_generation(prompt, system_prompt=None, **kwargs):
+        await asyncio.sleep(0.2)
+        if "continuation" in (system_prompt or "") + prompt:
+            return json.dumps({"continuation": "More content.", "readTimeIncrement": 1})
+        return json.dumps({"title": "Volcanoes", "content": "# Volcanoes\n\nMagma rises.", "readTime": 2})
+
+    monkeypatch.setattr(llm_client, "generate_content", slow_generation)
+    lesson = lesson_storage.create_lesson(LessonCreate(
+        topic="Glaciers",
+        gradeLevel="middle_school",
+        content="# Glaciers\n\nIce moves slowly.",
+        readTime=1
+    ))
+
+    with TestClient(app) as client:
+        workers = client.get("/api/jobs/stats").json()["workers"]
+        continue_ids = [
+            client.post(f"/api/jobs/lessons/{lesson.id}/continue").json()["id"]
+            for _ in range(workers + 2)
+        ]
+        create_id = client.post(
+            "/api/jobs/lessons", json={"topic": "Volcanoes", "gradeLevel": "middle_school"}
+        ).json()["id"]
+        create_job = wait_for_jobs(client, [create_id])[0]
+        continuations = wait_for_jobs(client, continue_ids)
+
+    assert create_job["status"] == "succeeded"
+    assert [job["status"] for job in continuations] == ["succeeded"] * (workers + 2)
+    # The create job ran next to the first continuation instead of behind the whole lesson backlog
+    finished = sorted(job["finishedAt"] for job in continuations)
+    assert create_job["finishedAt"] < finished[1]
+    assert lesson_storage.get_lesson(lesson.id).version == workers + 3
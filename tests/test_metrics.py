@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.models.lesson import LessonCreate
+from api.services import lesson_storage
+
+client = TestClient(app)
+
+def sample(body: str, name: str) -> float:
+    line = next(line for line in body.splitlines() if line.startswith(name + " "))
+    return float(line.split()[1])
+
+def test_lessons_stored_follows_creates_and_deletes():
+    before = sample(client.get("/metrics").text, "lessons_stored")
+    lesson = lesson_storage.create_lesson(LessonCreate(
+        topic="Magnetism", gradeLevel="middle_school", content="# Magnetism\n\nOpposites attract.", readTime=2
+    ))
+    assert sample(client.get("/metrics").text, "lessons_stored") == before + 1
+
+    lesson_storage.delete_lesson(lesson.id)
+    assert sample(client.get("/metrics").text, "lessons_stored") == before
+
+def test_requests_are_counted_by_route():
+    client.get("/api/lessons/search", params={"q": "magnetism"})
+
+    body = client.get("/metrics").text
+
+    assert 'http_requests_total{method="GET",route="/lessons/search",status="200"}' in body
+    assert "# TYPE http_request_duration_seconds histogram" in body
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from api.services.llm.parsing import IncrementalJSONParser
+
+RESPONSE = json.dumps({
+    "title": "Tides",
+    "content": "# Tides\n\nThe moon \"pulls\" the oceans — twice a day \U0001F30A.",
+    "readTime": 3,
+    "quiz": [{"question": "Why?", "options": ["Moon", "Sun"], "correctAnswer": 0}]
+})
+
+def feed_in_chunks(parser: IncrementalJSONParser, text: str, size: int) -> str:
+    return "".join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(RESPONSE)])
+def test_streams_the_decoded_content_whatever_the_chunking(size):
+    parser = IncrementalJSONParser()
+
+    streamed = feed_in_chunks(parser, f"Here is your lesson:\n```json\n{RESPONSE}\n```\nEnjoy!", size)
+
+    assert streamed == json.loads(RESPONSE)["content"]
+    assert parser.complete
+    assert parser.finish() == json.loads(RESPONSE)
+
+def test_only_top_level_stream_fields_are_streamed():
+    parser = IncrementalJSONParser(stream_fields=("content",))
+
+    streamed = parser.feed('{"title": "content", "meta": {"content": "nested"}, "content": "top"}')
+
+    assert streamed == "top"
+
+def test_repairs_a_response_cut_off_inside_a_string():
+    parser = IncrementalJSONParser()
+    parser.feed('{"title": "Tides", "content": "# Tides\\n\\nThe moon pul')
+
+    assert parser.finish() == {"title": "Tides", "content": "# Tides\n\nThe moon pul"}
+
+def test_repairs_a_response_cut_off_inside_an_escape():
+    parser = IncrementalJSONParser()
+    parser.feed('{"content": "Waves \\u00')
+
+    assert parser.finish() == {"content": "Waves "}
+
+def test_cuts_back_to_the_last_complete_value():
+    parser = IncrementalJSONParser()
+    parser.feed('{"title": "Tides", "content": "Text", "readTime": ')
+
+    assert parser.finish() == {"title": "Tides", "content": "Text"}
+
+def test_repairs_open_arrays_and_objects():
+    parser = IncrementalJSONParser()
+    parser.feed('{"content": "Text", "quiz": [{"question": "Why?", "options": ["Moon", "Su')
+
+    assert parser.finish() == {
+        "content": "Text",
+        "quiz": [{"question": "Why?", "options": ["Moon", "Su"]}]
+    }
+
+def test_text_without_an_object_is_an_error():
+    parser = IncrementalJSONParser()
+    parser.feed("Sorry, I cannot help with that.")
+
+    with pytest.raises(ValueError, match="No JSON object"):
+        parser.finish()
+
+def test_ignores_text_after_the_object():
+    parser = IncrementalJSONParser()
+    parser.feed('{"content": "a"} {"content": "b"}')
+
+    assert parser.consumed == len('{"content": "a"}')
+    assert parser.feed('{"content": "c"}') == ""
+    assert parser.finish() == {"content": "a"}
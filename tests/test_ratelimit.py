@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from api.services.llm import ratelimit
+from api.services.llm.ratelimit import RateLimitExceeded, RateLimiter, TokenBucket
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_bucket_refills_continuously_up_to_its_capacity(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    bucket = TokenBucket(per_minute=60)
+
+    bucket.consume(60)
+    assert bucket.delay_for(1) == pytest.approx(1.0)
+    assert bucket.delay_for(1000) == pytest.approx(60.0)
+
+    clock.now += 30
+    assert bucket.delay_for(30) == 0.0
+    clock.now += 3600
+    bucket.consume(0)
+    assert bucket.tokens == 60
+
+def drain(limiter: RateLimiter) -> None:
+    for bucket in (limiter._request_bucket, limiter._token_bucket):
+        if bucket:
+            bucket.consume(bucket.capacity)
+
+def test_waiting_calls_are_admitted_in_arrival_order():
+    # 100 tokens per second: the 50-token call first needs half a second
+    limiter = RateLimiter(tokens_per_minute=6000)
+    drain(limiter)
+    admitted = []
+
+    async def call(name: str, tokens: int):
+        await limiter.admit(tokens)
+        admitted.append(name)
+
+    async def run():
+        first = asyncio.ensure_future(call("large", 50))
+        await asyncio.sleep(0)
+        # Could be admitted sooner, but must not overtake the call queued before it
+        await asyncio.gather(first, call("small", 1))
+
+    asyncio.run(run())
+
+    assert admitted == ["large", "small"]
+    assert limiter.admitted == 2
+
+def test_calls_that_would_wait_too_long_are_rejected():
+    limiter = RateLimiter(requests_per_minute=6, max_wait=0.5)
+    drain(limiter)
+
+    with pytest.raises(RateLimitExceeded) as error:
+        asyncio.run(limiter.admit(1))
+
+    assert error.value.retry_after == pytest.approx(10.0, rel=0.01)
+    assert limiter.rejected == 1
+    assert limiter.waiting == 0
+
+def test_every_attempt_is_charged():
+    limiter = RateLimiter(requests_per_minute=3, tokens_per_minute=1000, max_wait=0.1)
+
+    async def attempts():
+        for _ in range(3):
+            await limiter.admit(100)
+
+    asyncio.run(attempts())
+
+    assert limiter.available_requests() == 0
+    assert 700 <= limiter.available_tokens() < 710
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(limiter.admit(100))
+
+def test_concurrency_slots_are_held_for_the_whole_call():
+    limiter = RateLimiter(max_concurrency=1, max_wait=0.2)
+    observed = []
+
+    async def call(hold: float):
+        async with limiter.slot():
+            observed.append(limiter.in_flight)
+            await asyncio.sleep(hold)
+
+    async def run():
+        await call(0)
+        return await asyncio.gather(call(0.5), call(0), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert observed == [1, 1]
+    assert results[0] is None
+    assert isinstance(results[1], RateLimitExceeded)
+    assert limiter.in_flight == 0
+
+def test_disabled_limits_admit_immediately():
+    limiter = RateLimiter()
+
+    asyncio.run(limiter.admit(10**9))
+
+    assert not limiter.enabled
+    assert limiter.available_requests() is None
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from api.services.llm.client import LLMClient
+from api.services.llm.retry import RetryPolicy
+
+def test_next_delay_stops_at_the_tighter_call_deadline():
+    # Backoff is at most 0.01 s, so Retry-After decides the delay
+    policy = RetryPolicy(max_attempts=10, base_delay=0.01, max_delay=0.01, deadline=90)
+    started = time.monotonic() - 1.8
+
+    assert policy.next_delay(1, started, retry_after=0.1) is not None
+    assert policy.next_delay(1, started, retry_after=0.1, deadline=2.0) is not None
+    assert policy.next_delay(1, started, retry_after=0.3, deadline=2.0) is None
+    assert policy.remaining(started, deadline=2.0) < 0.25
+
+def test_retries_end_with_the_last_response_before_the_model_timeout(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503, headers={"Retry-After": "0.2"}, json={"error": "overloaded"})
+
+    client = LLMClient()
+    client.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client.retry_policy = RetryPolicy(max_attempts=100, base_delay=0.01, max_delay=0.01, deadline=90)
+
+    async def send():
+        # Without the deadline, wait_for would cancel the retry loop mid-backoff instead
+        return await asyncio.wait_for(
+            client._send_with_retry({"model": "test/model", "messages": []}, 10, deadline=0.5),
+            timeout=0.5
+        )
+
+    response = asyncio.run(send())
+
+    assert response.status_code == 503
+    assert 2 <= len(calls) <= 3
+
+def test_backoff_is_full_jitter_below_an_exponential_ceiling():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3.0)
+
+    for attempt, ceiling in ((1, 0.5), (2, 1.0), (3, 2.0), (4, 3.0), (8, 3.0)):
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling / 2
+
+def test_retry_after_raises_the_delay_and_gives_up_past_the_deadline():
+    policy = RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=0.01, deadline=10)
+    started = time.monotonic()
+
+    assert policy.next_delay(1, started, retry_after=3) == 3
+    assert policy.next_delay(1, started, retry_after=30) is None
+    assert policy.next_delay(4, started) is None
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    assert RetryPolicy.parse_retry_after("2.5") == 2.5
+    assert RetryPolicy.parse_retry_after("-1") == 0.0
+    assert RetryPolicy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert RetryPolicy.parse_retry_after("soon") is None
+    assert RetryPolicy.parse_retry_after(None) is None
+
+def test_only_errors_before_the_request_was_sent_are_retried():
+    request = httpx.Request("POST", "https://openrouter.test/chat/completions")
+
+    assert RetryPolicy.is_retryable_exception(httpx.ConnectError("refused", request=request))
+    assert RetryPolicy.is_retryable_exception(httpx.PoolTimeout("busy", request=request))
+    assert not RetryPolicy.is_retryable_exception(httpx.ReadError("reset", request=request))
+    assert not RetryPolicy.is_retryable_exception(httpx.RemoteProtocolError("closed", request=request))
+    assert not RetryPolicy.is_retryable_exception(httpx.ReadTimeout("slow", request=request))
+
+def test_a_dropped_response_is_not_sent_again():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        raise httpx.RemoteProtocolError("peer closed connection", request=request)
+
+    client = LLMClient()
+    client.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client.retry_policy = RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=0.01)
+
+    with pytest.raises(httpx.RemoteProtocolError):
+        asyncio.run(client._send_with_retry({"model": "test/model", "messages": []}, 10))
+    assert len(calls) == 1
+
+def test_retryable_statuses_are_retried_until_success():
+    statuses = iter([503, 429, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), json={"choices": []})
+
+    client = LLMClient()
+    client.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client.retry_policy = RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=0.01)
+
+    response = asyncio.run(client._send_with_retry({"model": "test/model", "messages": []}, 10))
+
+    assert response.status_code == 200
@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.models.lesson import LessonCreate, QuizQuestion
+from api.services import lesson_storage
+
+client = TestClient(app)
+
+def store_lesson(topic: str, quiz: bool = False):
+    return lesson_storage.create_lesson(LessonCreate(
+        topic=topic,
+        gradeLevel="high_school",
+        content=f"# {topic}\n\nStored content.",
+        readTime=4,
+        includeQuiz=quiz,
+        quiz=[QuizQuestion(question="Why?", options=["A", "B"], correctAnswer=0)] if quiz else None
+    ))
+
+def create(**fields):
+    return client.post("/api/lessons", json={"gradeLevel": "high_school", "reuseExisting": True, **fields})
+
+def test_reuses_a_lesson_on_a_near_identical_topic():
+    stored = store_lesson("The Krebs cycle in cellular respiration")
+
+    response = create(topic="The Krebs Cycle in Cellular Respiration")
+
+    assert response.status_code == 200
+    assert float(response.headers["X-Lesson-Reused"]) >= 0.8
+    assert response.json()["id"] == stored.id
+
+def test_other_grade_levels_are_not_reused():
+    store_lesson("Plate tectonics and continental drift")
+
+    response = create(topic="Plate tectonics and continental drift", gradeLevel="elementary")
+
+    assert response.status_code == 201
+    assert "X-Lesson-Reused" not in response.headers
+
+def test_requests_with_additional_instructions_are_generated():
+    store_lesson("Photosynthesis in desert plants")
+
+    response = create(topic="Photosynthesis in desert plants", additionalInstructions="Focus on CAM plants")
+
+    assert response.status_code == 201
+    assert "X-Lesson-Reused" not in response.headers
+
+def test_quiz_must_match_include_quiz():
+    quiz_lesson = store_lesson("The water cycle and cloud formation", quiz=True)
+
+    without_quiz = create(topic="The water cycle and cloud formation")
+    with_quiz = create(topic="The water cycle and cloud formation", includeQuiz=True)
+
+    assert without_quiz.status_code == 201
+    assert with_quiz.status_code == 200
+    assert with_quiz.json()["id"] == quiz_lesson.id
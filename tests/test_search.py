@@ -0,0 +1,89 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.models.lesson import LessonCreate
+from api.services import lesson_storage
+from api.services.search import SearchIndex
+
+def test_ranks_topic_matches_and_rarer_terms_first():
+    index = SearchIndex()
+    index.add(1, "Volcanoes", "Magma rises through the crust.")
+    index.add(2, "Earth science", "Volcanoes form where magma rises.")
+    index.add(3, "Rivers", "Water carves valleys over time.")
+
+    total, ranked = index.search("volcanoes", limit=10)
+
+    assert total == 2
+    assert [lesson_id for lesson_id, _ in ranked] == [1, 2]
+
+def test_index_follows_appends_and_removals():
+    index = SearchIndex()
+    index.add(1, "Rivers", "Water carves valleys.")
+    index.add(2, "Deserts", "Little rain falls.")
+
+    index.append(2, "Flash floods carve canyons.")
+    assert index.search("carve", limit=10)[0] == 1
+    assert {lesson_id for lesson_id, _ in index.search("carves canyons", limit=10)[1]} == {1, 2}
+
+    index.remove(1)
+    total, ranked = index.search("carves canyons", limit=10)
+    assert total == 1
+    assert [lesson_id for lesson_id, _ in ranked] == [2]
+
+def test_writers_do_not_mutate_postings_being_ranked(monkeypatch):
+    index = SearchIndex()
+    index.add(1, "Tides", "The moon pulls the oceans.")
+    rank = index._rank
+    seen = {}
+
+    def rank_while_writing(present, count, average_length, size):
+        # A lesson indexed mid-search goes to a copy of the postings
+        index.add(2, "Moon phases", "The moon changes shape.")
+        index.remove(1)
+        seen.update({term: dict(postings) for term, postings in present})
+        return rank(present, count, average_length, size)
+
+    monkeypatch.setattr(index, "_rank", rank_while_writing)
+    total, ranked = index.search("moon", limit=10)
+
+    assert seen == {"moon": {1: 1}}
+    assert (total, [lesson_id for lesson_id, _ in ranked]) == (1, [1])
+    assert set(index.postings["moon"]) == {2}
+    assert not index._readers
+
+def test_common_terms_are_not_scanned_at_100k_lessons():
+    index = SearchIndex()
+    for i in range(100_000):
+        rare = "algebra" if i % 1000 == 0 else "geometry"
+        index.add(i, f"Math lesson {i}", f"Math practice with {rare} and numbers, set {i % 97}")
+
+    timings = []
+    for _ in range(5):
+        index._results.clear()
+        started = time.perf_counter()
+        total, ranked = index.search("math algebra", limit=20)
+        timings.append(time.perf_counter() - started)
+
+    assert total == 100_000
+    assert len(ranked) == 20
+    assert all(lesson_id % 1000 == 0 for lesson_id, _ in ranked)
+    assert min(timings) < 0.01
+
+def test_search_endpoint_returns_highlighted_hits():
+    lesson = lesson_storage.create_lesson(LessonCreate(
+        topic="Bioluminescence",
+        gradeLevel="middle_school",
+        content="# Bioluminescence\n\nFireflies and deep-sea fish make their own light.",
+        readTime=3
+    ))
+
+    response = TestClient(app).get("/api/lessons/search", params={"q": "fireflies light", "limit": 5})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] >= 1
+    hit = body["hits"][0]
+    assert hit["id"] == lesson.id
+    assert "<mark>Fireflies</mark>" in hit["snippet"]
@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.models.lesson import LessonCreate
+from api.services.similarity import LessonMatcher
+from api.services.sqlite_storage import SQLiteLessonStorage
+from api.services.storage import LessonStorage, VersionConflict
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        return LessonStorage()
+    return SQLiteLessonStorage(str(tmp_path / "lessons.sqlite3"))
+
+def new_lesson(topic: str) -> LessonCreate:
+    return LessonCreate(topic=topic, gradeLevel="middle_school", content=f"# {topic}\n\nText.", readTime=1)
+
+def test_similarity_index_drops_deleted_lessons(storage):
+    matcher = LessonMatcher(storage)
+    kept = storage.create_lesson(new_lesson("Ocean currents and climate"))
+    deleted = storage.create_lesson(new_lesson("Ocean currents and weather"))
+    assert {lesson_id for lesson_id, _ in matcher.similar("Ocean currents", "middle_school")} >= {kept.id, deleted.id}
+
+    storage.delete_lesson(deleted.id)
+
+    matches = {lesson_id for lesson_id, _ in matcher.similar("Ocean currents", "middle_school")}
+    assert kept.id in matches
+    assert deleted.id not in matches
+
+def test_memory_deletion_log_is_trimmed_once_every_consumer_has_seen_it():
+    storage = LessonStorage()
+    ids = [storage.create_lesson(new_lesson(f"Topic {i}")).id for i in range(4)]
+    storage.delete_lesson(ids[0])
+    assert not storage.deletions
+
+    first, first_after = storage.register_deletion_consumer()
+    second, second_after = storage.register_deletion_consumer()
+    for lesson_id in ids[1:]:
+        storage.delete_lesson(lesson_id)
+
+    seen = storage.list_deletions(after=first_after, consumer=first)
+    assert [lesson_id for _, lesson_id in seen] == ids[1:]
+    storage.list_deletions(after=seen[-1][0], consumer=first)
+    assert len(storage.deletions) == 3
+
+    rest = storage.list_deletions(after=second_after + 1, consumer=second)
+    assert rest == seen[1:]
+    assert len(storage.deletions) == 2
+    storage.list_deletions(after=seen[-1][0], consumer=second)
+    assert not storage.deletions
+    assert storage.list_deletions(after=seen[-1][0]) == []
+
+def test_continuations_bump_the_version_and_join_segments(storage):
+    lesson = storage.create_lesson(new_lesson("Erosion"))
+    assert lesson.version == 1
+
+    updated = storage.update_lesson(lesson.id, "More on wind.", 2, expected_version=1)
+
+    assert updated.version == 2
+    assert updated.readTime == 3
+    assert updated.content == "# Erosion\n\nText.\n\nMore on wind."
+    assert storage.get_lesson(lesson.id) == updated
+    assert [segment.content for segment in storage.get_segments(lesson.id)] == ["# Erosion\n\nText.", "More on wind."]
+
+def test_stale_continuations_raise_a_version_conflict(storage):
+    lesson = storage.create_lesson(new_lesson("Weathering"))
+    storage.update_lesson(lesson.id, "First.", 1, expected_version=1)
+
+    with pytest.raises(VersionConflict) as conflict:
+        storage.update_lesson(lesson.id, "Based on version 1.", 1, expected_version=1)
+
+    assert (conflict.value.expected_version, conflict.value.current_version) == (1, 2)
+    assert storage.get_lesson(lesson.id).version == 2
+    assert storage.update_lesson(lesson.id + 1000, "Missing.", 1, expected_version=1) is None
+
+def test_sqlite_lessons_survive_reopening_and_ids_are_not_reused(tmp_path):
+    path = str(tmp_path / "lessons.sqlite3")
+    first = SQLiteLessonStorage(path)
+    lesson = first.create_lesson(new_lesson("Fossils"))
+    first.update_lesson(lesson.id, "Amber.", 1)
+    first.delete_lesson(lesson.id)
+    kept = first.create_lesson(new_lesson("Minerals"))
+    revision = first.get_revision()
+
+    second = SQLiteLessonStorage(path)
+
+    assert second.get_lesson(kept.id) == kept
+    assert second.get_lesson(lesson.id) is None
+    assert second.get_revision() == revision
+    assert second.create_lesson(new_lesson("Crystals")).id > kept.id
+
+def test_sqlite_processes_see_each_others_writes(tmp_path):
+    path = str(tmp_path / "lessons.sqlite3")
+    writer, reader = SQLiteLessonStorage(path), SQLiteLessonStorage(path)
+    revision = reader.get_revision()
+
+    lesson = writer.create_lesson(new_lesson("Caves"))
+    writer.update_lesson(lesson.id, "Stalactites.", 1, expected_version=1)
+
+    assert reader.get_revision() != revision
+    assert reader.get_lesson(lesson.id).version == 2
+    with pytest.raises(VersionConflict):
+        reader.update_lesson(lesson.id, "Stale.", 1, expected_version=1)
+
+def test_concurrent_creates_get_distinct_ids(storage):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        lessons = list(pool.map(lambda i: storage.create_lesson(new_lesson(f"Topic {i}")), range(64)))
+
+    ids = [lesson.id for lesson in lessons]
+    assert len(set(ids)) == 64
+    assert all(storage.get_lesson(lesson_id).topic == f"Topic {i}" for i, lesson_id in enumerate(ids))
+
+def test_concurrent_continuations_with_the_same_version_conflict(storage):
+    lesson = storage.create_lesson(new_lesson("Glaciers"))
+
+    def continue_lesson(i: int) -> bool:
+        try:
+            storage.update_lesson(lesson.id, f"Part {i}.", 1, expected_version=1)
+            return True
+        except VersionConflict:
+            return False
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(continue_lesson, range(16)))
+
+    assert results.count(True) == 1
+    assert storage.get_lesson(lesson.id).version == 2